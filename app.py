@@ -1,51 +1,117 @@
 print("Script started")
 import os
-import pandas as pd
-from flask import Flask, request, jsonify, render_template, session, redirect, url_for, Response 
-
-from backend.features.data_processing import DataProcessor
-from backend.features.hmpi_calculation import  HMPICalculation
-from backend.features.basic_output import HMPIOutput
-from backend.features.better_df import PrettyColumns
-from backend.features.geospatial_analysis import GeoSpatialAnalyser
-from backend.features.report_generation import ReportGenerator
+import json
+import time
+import uuid
+from flask import Blueprint, Flask, current_app, request, jsonify, render_template, session, redirect, url_for, Response, g
+
+from backend.features.caching import artifact_key, content_hash
+from backend.features.lazy import LazyFeature
+from backend.features.metrics import metrics
+from backend.features.jobs import JobManager, calculate_task, calculate_stream_task, map_task, merge_task, report_task
 from werkzeug.utils import secure_filename
 
-app = Flask(
-    __name__,
-    template_folder="frontend/templates",
-    static_folder="frontend/static"
-)
-app.secret_key = 'some-secret'
+bp = Blueprint('hmpi', __name__)
 
 UPLOAD_FOLDER = os.path.join('data', 'uploads')
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+# CSV uploads larger than this are processed in chunks instead of in memory
+STREAMING_THRESHOLD = 256 * 1024 * 1024
+STREAMING_CHUNKSIZE = 100_000
+
+# Cached datasets are stored with compact dtypes (HMPI_COMPACT=0 to turn off),
+# and each process keeps up to this many MB of them in memory
+COMPACT_DATASETS = os.environ.get('HMPI_COMPACT', '1') != '0'
+DATASET_MEMORY_BYTES = int(os.environ.get('HMPI_DATASET_MEMORY_MB', '256')) * 1024 * 1024
 
 # Initiating Functions
-processor = DataProcessor()
-calculator = HMPICalculation()
-outputter = HMPIOutput()
-format = PrettyColumns()
-geospatial = GeoSpatialAnalyser()
-reporter = ReportGenerator()
+# Each feature module (and pandas, folium, fpdf, ...) is only imported when
+# a route first uses it; see create_app(preload=True) to import them upfront
+processor = LazyFeature('backend.features.data_processing', 'DataProcessor')
+calculator = LazyFeature('backend.features.hmpi_calculation', 'HMPICalculation')
+outputter = LazyFeature('backend.features.basic_output', 'HMPIOutput')
+format = LazyFeature('backend.features.better_df', 'PrettyColumns')
+geospatial = LazyFeature('backend.features.geospatial_analysis', 'GeoSpatialAnalyser')
+excel_reader = LazyFeature('backend.features.excel_reader', 'ExcelReader')
+dataset_cache = LazyFeature('backend.features.caching', 'DatasetCache', os.path.join(UPLOAD_FOLDER, 'cache'),
+                            max_memory_bytes=DATASET_MEMORY_BYTES, compact=COMPACT_DATASETS)
+artifact_cache = LazyFeature('backend.features.caching', 'ArtifactCache', os.path.join(UPLOAD_FOLDER, 'artifacts'))
+reporter = LazyFeature('backend.features.report_generation', 'ReportGenerator', artifact_cache)
+jobs = JobManager(os.path.join(UPLOAD_FOLDER, 'jobs.sqlite3'))
+chart_renderer = LazyFeature('backend.features.report_charts', 'ChartRenderer', artifact_cache)
+grids = LazyFeature('backend.features.map_aggregation', 'GridAggregator', dataset_cache=dataset_cache)
+station_indexes = LazyFeature('backend.features.spatial_index', 'StationIndexCache', dataset_cache)
+interpolator = LazyFeature('backend.features.interpolation', 'HMPIInterpolator')
+timeseries = LazyFeature('backend.features.time_series', 'TimeSeriesStore', os.path.join(UPLOAD_FOLDER, 'timeseries'))
+merger = LazyFeature('backend.features.dataset_merge', 'DatasetMerger', dataset_cache, calculator, format)
+store = LazyFeature('backend.features.dataset_store', 'DatasetStore', os.path.join(UPLOAD_FOLDER, 'datasets.sqlite3'))
+results = LazyFeature('backend.features.result_browser', 'ResultBrowserCache', dataset_cache)
+what_ifs = LazyFeature('backend.features.what_if', 'WhatIfCache', dataset_cache)
+FEATURES = [
+    processor, calculator, outputter, format, geospatial, dataset_cache, artifact_cache, reporter,
+    chart_renderer, grids, station_indexes, interpolator, timeseries, merger, store, results, what_ifs,
+]
     
+# Request Metrics and Profiling
+@bp.before_app_request
+def start_request_metrics():
+    if not metrics.enabled and not metrics.profile_dir:
+        return
+    g.request_start = time.perf_counter()
+    # With HMPI_PROFILE_DIR set, ?profile=1 dumps a cProfile of this one request
+    g.profiler = metrics.start_profile() if metrics.profile_dir and request.args.get('profile') == '1' else None
+
+@bp.after_app_request
+def record_request_metrics(response):
+    if 'request_start' not in g:
+        return response
+    if g.profiler:
+        path = stop_request_profile()
+        response.headers['X-Profile'] = os.path.basename(path)
+    labels = {'route': request.endpoint or 'unmatched', 'method': request.method, 'status': str(response.status_code)}
+    metrics.observe('hmpi_request_seconds', time.perf_counter() - g.request_start, labels)
+    return response
+
+@bp.teardown_app_request
+def stop_failed_request_profile(error=None):
+    # A request that raised skips record_request_metrics; never leave its profiler running
+    if g.get('profiler'):
+        stop_request_profile()
+
+def stop_request_profile():
+    """Stops and dumps the profiler of this request, and returns the profile path."""
+    path = metrics.profile_path(request.endpoint)
+    profiler, g.profiler = g.profiler, None
+    metrics.stop_profile(profiler, path)
+    return path
+
+def job_profile_path(kind):
+    """Profile path for a job started by a profiled request, or None."""
+    return metrics.profile_path(f'job-{kind}') if g.get('profiler') else None
+
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not metrics.enabled:
+        return "Metrics are disabled (HMPI_METRICS=0).", 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # Home Page
-@app.route('/')
+@bp.route('/')
 def home():
     return render_template('home.html')
 
 # Analyzer Page
-@app.route('/analyzer')
+@bp.route('/analyzer')
 def analyzer():
     return render_template('analyzer.html')
 
 # Info Page
-@app.route('/info')
+@bp.route('/info')
 def info():
     return render_template('info.html')
 
 # Upload
-@app.route('/upload', methods=['POST'])
+@bp.route('/upload', methods=['POST'])
 def upload_file():
 
     # Check for input file
@@ -58,95 +124,642 @@ def upload_file():
     filepath = os.path.join(UPLOAD_FOLDER, filename)
     file.save(filepath)
 
-    # Processing Input Data
-    df=processor.load(filepath) 
-    print("Data Loaded Successfully")
-
-    # --- Start of Fix ---
-    # Save the raw dataframe for calculation, but we will save the formatted one later
-    df.to_pickle(os.path.join('data', 'uploads', 'df_cache.pkl'))
-    session['df_cache'] = os.path.join('data', 'uploads', 'df_cache.pkl')
-    # --- End of Fix ---
-
     # Saving filepath in session 
     session['uploaded_file'] = filepath
+    session.pop('calculated_stage', None)
+
+    # Very large CSVs are never loaded whole, only previewed from the first chunk
+    streaming = filepath.endswith('.csv') and os.path.getsize(filepath) > STREAMING_THRESHOLD
+    session['streaming'] = streaming
+    if streaming:
+        import pandas as pd
+        session.pop('dataset_key', None)
+        preview = next(processor.iter_chunks(filepath, chunksize=30), pd.DataFrame())
+        return jsonify({
+                'message': 'Large file uploaded, it will be processed in chunks.',
+                'rows': None,
+                'streaming': True,
+                'columns': list(preview.columns),
+                'preview': processor.preview(preview)
+            })
+
+    # Datasets are cached by content, so an identical re-upload skips parsing
+    key = content_hash(filepath)
+
+    # Workbooks: the sheets to read, e.g. sheets=North,South or sheets=all,
+    # the first sheet by default. Other sheets are another dataset.
+    sheet_names, sheets = None, None
+    if filepath.endswith(('.xlsx', '.xls')):
+        try:
+            sheet_names = excel_reader.sheet_names(filepath)
+            sheets = excel_reader.selected(filepath, requested_sheets())
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': f'Could not read the workbook: {e}'}), 400
+        if sheets != sheet_names[:1]:
+            key = artifact_key('excel', key, sheets)
+    session['sheets'] = sheets
+
+    session.pop('dataset_key', None)
+    df = dataset_cache.get(key, 'cleaned')
+    if df is None:
+        # Processing Input Data
+        try:
+            df=processor.load(filepath, sheets)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        # An empty frame is never cached, or every re-upload of the file would hit it
+        if df.empty:
+            return jsonify({'error': 'The file has no data rows.'}), 400
+        dataset_cache.put(key, 'cleaned', df)
+        print("Data Loaded Successfully")
+    else:
+        print("Data Loaded From Cache")
+    session['dataset_key'] = key
 
     # Send a preview back to frontend
     return jsonify({
             'message': 'File uploaded and cleaned successfully!',
             'rows': len(df),
             'columns': list(df.columns),
-            'preview': df.head(30).to_dict(orient='records')
+            'sheets': sheet_names,
+            'selected_sheets': sheets,
+            'preview': processor.preview(df)
         })
 
+def requested_sheets():
+    """The 'sheets' form field as a list of names, 'all', or None for the default."""
+    names = [name.strip() for value in request.form.getlist('sheets') for name in value.split(',') if name.strip()]
+    if not names:
+        return None
+    return 'all' if names == ['all'] else names
+
 # Calculate
-@app.route('/calculate', methods=['POST'])
+@bp.route('/calculate', methods=['POST'])
 def calculate_hmpi():
-    if 'uploaded_file' not in session:
+    # A failed upload leaves no dataset key
+    if 'uploaded_file' not in session or not (session.get('streaming') or session.get('dataset_key')):
         return jsonify({'error': 'No file uploaded'}), 400
 
     filepath = session['uploaded_file']
-    df = processor.load(filepath)
+
+    # Optional extra indices, e.g. {"indices": ["HEI", "Cd", "MI"]}
+    options = request.get_json(silent=True) or {}
+    indices = options.get('indices') or request.form.getlist('indices')
+
+    try:
+        indices = calculator.normalize_indices(indices)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if session.get('streaming'):
+        return calculate_streaming(filepath, indices)
+
+    # Each set of indices is its own cache stage, e.g. 'calculated-hei-cd'
+    key = session['dataset_key']
+    stage = '-'.join(['calculated'] + indices[1:])
+    session['calculated_stage'] = stage
 
     # Calculating HMPI
     print("Running Calculation Module")
-    df = calculator.calculate(df)
-    df_pretty = format.prettify(df.copy()) # Prettify a copy for display
-    
-    # --- Start of Fix ---
-    # Save the prettified dataframe so the report has the correct columns
-    df_pretty.to_pickle(session['df_cache']) 
-    # --- End of Fix ---
+    job_id = jobs.submit(
+        'calculate', ('calculate', key, stage, owner_id()), calculate_task,
+        processor, calculator, format, dataset_cache, timeseries, store, owner_id(), key, filepath, indices, stage,
+        session.get('sheets'), profile_path=job_profile_path('calculate')
+    )
+    return job_accepted(job_id)
 
-    return jsonify({
-        'message': 'HMPI calculated successfully!',
-        'rows': len(df_pretty),
-        'columns': list(df_pretty.columns),
-        'preview': df_pretty.head(30).to_dict(orient='records')
-        })
+def calculate_streaming(filepath, indices):
+    """Calculates a large CSV chunk by chunk, writing results next to the upload."""
+    print("Running Streaming Calculation Module")
+    output_path = os.path.splitext(filepath)[0] + '_results.csv'
+    session['results_file'] = output_path
+
+    job_id = jobs.submit(
+        'calculate', ('calculate_stream', filepath, tuple(indices)), calculate_stream_task,
+        processor, calculator, format, filepath, output_path, indices, STREAMING_CHUNKSIZE,
+        profile_path=job_profile_path('calculate')
+    )
+    return job_accepted(job_id)
+
+def calculated_columns():
+    """Returns the columns of the session's calculated dataset without loading it, or None."""
+    key = session.get('dataset_key')
+    stage = session.get('calculated_stage')
+    if not key or not stage:
+        return None
+    return dataset_cache.columns(key, stage)
+
+def owner_id():
+    """Owner of the datasets saved from this session; a random id per browser until there are user accounts."""
+    if 'owner' not in session:
+        session['owner'] = uuid.uuid4().hex
+    return session['owner']
+
+# Browse Results, e.g. /results?page=2&sort=HMPI&order=desc&level=Poor&level=Very Poor&q=nadi
+@bp.route('/results', methods=['GET'])
+def browse_results():
+    columns = calculated_columns()
+    if columns is None:
+        return jsonify({'error': 'No calculated data, please analyze your data first.'}), 400
+
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', 50))
+        if page < 1:
+            raise ValueError("page must be at least 1")
+        if not 1 <= page_size <= 1000:
+            raise ValueError("page_size must be between 1 and 1000")
+        sort = request.args.get('sort') or None
+        if sort is not None and sort not in columns:
+            raise ValueError(f"Unknown column '{sort}'")
+        min_hmpi = request.args.get('min_hmpi')
+        max_hmpi = request.args.get('max_hmpi')
+
+        index = results.get(session['dataset_key'], session['calculated_stage'])
+        result = index.page(
+            page, page_size, sort, request.args.get('order', 'asc'),
+            levels=request.args.getlist('level'),
+            min_hmpi=float(min_hmpi) if min_hmpi else None,
+            max_hmpi=float(max_hmpi) if max_hmpi else None,
+            search=request.args.get('q', '').strip()
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    return jsonify(result)
+
+# What-if: HMPI and levels of the calculated dataset under other standards, e.g.
+# {"profile": "who"} or {"profile": "bis", "standards": {"pb": 0.05, "as": {"S": 0.05, "W": 20}}, "weights": {"cd": 100}}
+@bp.route('/whatif', methods=['POST'])
+def what_if():
+    columns = calculated_columns()
+    if columns is None or 'HMPI' not in columns:
+        return jsonify({'error': 'No calculated data, please analyze your data first.'}), 400
+
+    options = request.get_json(silent=True) or {}
+    name = options.get('profile') or 'default'
+    standards = options.get('standards') or {}
+    weights = options.get('weights') or {}
+    try:
+        if not isinstance(standards, dict) or not isinstance(weights, dict):
+            raise ValueError("standards and weights must be objects keyed by metal")
+        table = what_ifs.profile(name, standards, weights)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Results of the named profiles are cached per dataset, custom ones are recomputed
+    key, stage = session['dataset_key'], session['calculated_stage']
+    named = not standards and not weights
+    cache_key = artifact_key('whatif', key, stage, name, table)
+    if named:
+        cached = artifact_cache.get(cache_key)
+        if cached is not None:
+            return Response(cached, mimetype='application/json')
+
+    try:
+        result = what_ifs.get(key, stage).what_if(table)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    body = current_app.json.dumps({'profile': name, 'custom': not named, **result})
+    if named:
+        artifact_cache.put(cache_key, body)
+    return Response(body, mimetype='application/json')
+
+@bp.route('/whatif/profiles', methods=['GET'])
+def what_if_profiles():
+    return jsonify({'profiles': what_ifs.profiles})
+
+# Export, e.g. /export?format=geojson&compression=gzip
+@bp.route('/export', methods=['GET'])
+def export_results():
+    fmt = request.args.get('format', 'csv')
+    compression = request.args.get('compression') or None
+    try:
+        outputter.validate(fmt, compression)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Rows are read and sent chunk by chunk, the export is never built whole
+    if session.get('streaming') and os.path.exists(session.get('results_file', '')):
+        chunks = outputter.csv_chunks(session['results_file'], formatter=format)
+    elif calculated_columns() is not None:
+        chunks = outputter.parquet_chunks(dataset_cache.path(session['dataset_key'], session['calculated_stage']))
+    else:
+        return jsonify({'error': 'No calculated data, please analyze your data first.'}), 400
+
+    filename, mimetype = outputter.filename('hmpi_results', fmt, compression)
+    return Response(
+        outputter.export(chunks, fmt, compression),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
 # Generate Map
-@app.route('/map', methods=['GET'])
+@bp.route('/map', methods=['GET'])
 def generate_map():
 
-    if 'df_cache' not in session:
+    if 'dataset_key' not in session:
         return "No data uploaded", 400
     
-    df = pd.read_pickle(session['df_cache'])
+    columns = calculated_columns()
 
-    # The dataframe from pickle is now the prettified one, so we check for 'HMPI'
-    if 'HMPI' not in df.columns:
+    # The cached dataframe is the prettified one, so we check for 'HMPI'
+    if columns is None or 'HMPI' not in columns:
         return "HMPI column not found, please re-analyze your data.", 400
 
-    print("Running Geospatial Analysis Module")
     # The data processor will find 'Latitude' and 'Longitude' even if they are named differently
-    if 'Latitude' in df.columns and 'Longitude' in df.columns:
-        map_html = geospatial.geospatial_analysis(df)
-        return map_html
-    else:
+    if 'Latitude' not in columns or 'Longitude' not in columns:
         return "No coordinates found in data.", 400
 
+    # Map options, e.g. /map?radius=30&blur=15&tiles=street&surface=idw
+    try:
+        tiles = request.args.get('tiles')
+        options = geospatial.map_options(
+            radius=request.args.get('radius'),
+            blur=request.args.get('blur'),
+            tiles=tiles.split(',') if tiles else None,
+            surface=request.args.get('surface')
+        )
+    except ValueError as e:
+        return str(e), 400
+
+    # The rendered map only depends on the dataset and the options, so that is its ETag
+    key, stage = session['dataset_key'], session['calculated_stage']
+    etag = artifact_key('map', key, stage, options)
+    if etag in request.if_none_match:
+        return map_response(b'', etag, status=304)
+
+    map_html = artifact_cache.get(etag)
+    if map_html is not None:
+        return map_response(map_html, etag)
+
+    print("Running Geospatial Analysis Module")
+    job_id = jobs.submit('map', ('map', etag), map_task, geospatial, dataset_cache, artifact_cache, key, stage, options, etag,
+                         profile_path=job_profile_path('map'))
+    return job_accepted(job_id)
+
+def map_response(map_html, etag, status=200):
+    response = Response(map_html, status=status, mimetype='text/html')
+    response.set_etag(etag)
+    # Browsers keep the map but must revalidate, since /map follows the session's dataset
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Map Data: per-zoom HMPI summaries of the stations in the viewport
+@bp.route('/map/data', methods=['GET'])
+def map_data():
+    columns = calculated_columns()
+    if columns is None or 'HMPI' not in columns:
+        return jsonify({'error': 'HMPI column not found, please re-analyze your data.'}), 400
+    if 'Latitude' not in columns or 'Longitude' not in columns:
+        return jsonify({'error': 'No coordinates found in data.'}), 400
+
+    try:
+        zoom = int(request.args.get('zoom', 0))
+        # Same order as Leaflet's LatLngBounds.toBBoxString(): west,south,east,north
+        bbox = request.args.get('bbox')
+        bbox = [float(v) for v in bbox.split(',')] if bbox else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'zoom must be an integer and bbox "west,south,east,north"'}), 400
+
+    zooms = grids.grid(session['dataset_key'], session['calculated_stage'])
+    cells = grids.query(zooms, zoom, bbox)
+    return jsonify({
+        'zoom': min(max(zoom, 0), grids.max_zoom),
+        'cells': cells
+    })
+
+# Station Queries: nearest stations and stations within a radius of a point
+def station_query_args():
+    """Parses lat, lon and the optional min_hmpi filter shared by the station queries."""
+    lat = float(request.args['lat'])
+    lon = float(request.args['lon'])
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise ValueError("lat must be within [-90, 90] and lon within [-180, 180]")
+    min_hmpi = request.args.get('min_hmpi')
+    return lat, lon, float(min_hmpi) if min_hmpi is not None else None
+
+def station_index():
+    columns = calculated_columns()
+    if columns is None or 'HMPI' not in columns or 'Latitude' not in columns or 'Longitude' not in columns:
+        return None
+    return station_indexes.get(session['dataset_key'], session['calculated_stage'])
+
+@bp.route('/stations/nearest', methods=['GET'])
+def nearest_stations():
+    try:
+        lat, lon, min_hmpi = station_query_args()
+        k = int(request.args.get('k', 5))
+        if not 1 <= k <= 1000:
+            raise ValueError("k must be between 1 and 1000")
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+
+    index = station_index()
+    if index is None:
+        return jsonify({'error': 'No calculated data with coordinates, please re-analyze your data.'}), 400
+    return jsonify({'stations': index.nearest(lat, lon, k=k, min_hmpi=min_hmpi)})
+
+@bp.route('/stations/within', methods=['GET'])
+def stations_within():
+    try:
+        lat, lon, min_hmpi = station_query_args()
+        radius_km = float(request.args.get('radius_km', 10))
+        if not 0 < radius_km <= 20_000:
+            raise ValueError("radius_km must be between 0 and 20000")
+    except (KeyError, ValueError) as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+
+    index = station_index()
+    if index is None:
+        return jsonify({'error': 'No calculated data with coordinates, please re-analyze your data.'}), 400
+    return jsonify({'stations': index.within(lat, lon, radius_km, min_hmpi=min_hmpi)})
+
+# Interpolated HMPI Surface, e.g. /map/surface?method=kriging&resolution=300&format=png
+@bp.route('/map/surface', methods=['GET'])
+def map_surface():
+    method = request.args.get('method', 'idw')
+    fmt = request.args.get('format', 'json')
+    try:
+        resolution = int(request.args.get('resolution', 200))
+        if not 10 <= resolution <= 1000:
+            raise ValueError("resolution must be between 10 and 1000")
+        if fmt not in ('json', 'png'):
+            raise ValueError("format must be json or png")
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    index = station_index()
+    if index is None:
+        return jsonify({'error': 'No calculated data with coordinates, please re-analyze your data.'}), 400
+
+    key, stage = session['dataset_key'], session['calculated_stage']
+    cache_key = artifact_key('surface', key, stage, method, resolution, interpolator.k, interpolator.power, fmt)
+    cached = artifact_cache.get(cache_key)
+    if cached is None:
+        try:
+            surface = interpolator.surface(index, method, resolution)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if fmt == 'png':
+            cached = artifact_cache.put(cache_key, interpolator.to_png(surface))
+        else:
+            import numpy as np
+            values = surface['values'].round(2)
+            cached = artifact_cache.put(cache_key, json.dumps({
+                'method': method,
+                'bounds': surface['bounds'],
+                'width': values.shape[1],
+                'height': values.shape[0],
+                'values': np.where(np.isfinite(values), values, None).tolist()
+            }))
+
+    return Response(cached, mimetype='image/png' if fmt == 'png' else 'application/json')
+
+# Trends across dated uploads, e.g. /trends?period=monthly&station=Garudeshwar
+def trend_query_args():
+    """Parses period, the station or region (all samples by default) and the optional start/end dates."""
+    if request.args.get('station'):
+        scope, name = 'station', request.args['station']
+    elif request.args.get('region'):
+        scope, name = 'region', request.args['region']
+    else:
+        scope, name = 'all', 'All'
+    import pandas as pd
+    start, end = request.args.get('start'), request.args.get('end')
+    return {
+        'period': request.args.get('period', 'monthly'),
+        'scope': scope,
+        'name': name,
+        'start': pd.Timestamp(start).strftime('%Y-%m-%d') if start else None,
+        'end': pd.Timestamp(end).strftime('%Y-%m-%d') if end else None,
+    }
+
+@bp.route('/trends', methods=['GET'])
+def trends():
+    try:
+        query = trend_query_args()
+        points = timeseries.trend(**query)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    return jsonify({**query, 'points': points})
+
+@bp.route('/trends/chart', methods=['GET'])
+def trend_chart():
+    try:
+        query = trend_query_args()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+
+    # The store version changes with every ingested upload
+    cache_key = artifact_key('trend-chart', timeseries.version(), query)
+    png = artifact_cache.get(cache_key)
+    if png is None:
+        try:
+            points = timeseries.trend(**query)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query: {e}'}), 400
+        title = f"{query['period'].title()} HMPI Trend - {query['name']}"
+        png = artifact_cache.put(cache_key, timeseries.chart(points, title))
+    return Response(png, mimetype='image/png')
+
+@bp.route('/trends/names', methods=['GET'])
+def trend_names():
+    scope = request.args.get('scope', 'station')
+    if scope not in ('station', 'region'):
+        return jsonify({'error': 'scope must be station or region'}), 400
+    return jsonify({'scope': scope, 'names': timeseries.names(scope)})
+
+# Combined Datasets
+@bp.route('/datasets', methods=['GET'])
+def list_datasets():
+    return jsonify({'datasets': [
+        {'key': key, 'stage': stage, 'memory': dataset_cache.memory_report(key, stage)}
+        for key, stage in merger.available(owned_keys())
+    ]})
+
+def owned_keys():
+    """Keys of the datasets this session's owner has saved; other owners' datasets are never listed or merged."""
+    return [upload['key'] for upload in store.uploads(owner_id())]
+
+# Merge calculated datasets into one, e.g. {"datasets": ["<key>", ...]}; all calculated datasets by default
+@bp.route('/merge', methods=['POST'])
+def merge_datasets():
+    options = request.get_json(silent=True) or {}
+    available = dict(merger.available(owned_keys()))
+    keys = list(dict.fromkeys(options.get('datasets') or available))
+
+    unknown = [key for key in keys if key not in available]
+    if unknown:
+        return jsonify({'error': f"Datasets not found or not calculated: {', '.join(unknown)}"}), 400
+    if len(keys) < 2:
+        return jsonify({'error': 'At least two calculated datasets are needed to merge'}), 400
+
+    from backend.features.dataset_merge import MERGED_STAGE
+    datasets = [(key, available[key]) for key in keys]
+    merged_key = merger.merged_key(datasets)
+
+    # The map, station and report routes read the merged dataset from now on.
+    # It has no upload behind it, so /calculate must not reload the last one under its key.
+    session['dataset_key'] = merged_key
+    session['calculated_stage'] = MERGED_STAGE
+    session['streaming'] = False
+    session.pop('uploaded_file', None)
+    session.pop('sheets', None)
+
+    job_id = jobs.submit('merge', ('merge', merged_key, owner_id()), merge_task, merger, dataset_cache, store, owner_id(), merged_key, datasets,
+                         profile_path=job_profile_path('merge'))
+    return job_accepted(job_id)
+
+# Saved Datasets
+@bp.route('/saved', methods=['GET'])
+def saved_datasets():
+    return jsonify({'datasets': store.uploads(owner_id(), limit=request.args.get('limit', type=int))})
+
+# Stations across saved datasets, e.g. /saved/stations?level=Extremely Poor&last=10&bbox=72,20,74,23
+@bp.route('/saved/stations', methods=['GET'])
+def saved_stations():
+    try:
+        last = request.args.get('last')
+        last = int(last) if last is not None else None
+        limit = int(request.args.get('limit', 100))
+        if not 1 <= limit <= 10_000:
+            raise ValueError("limit must be between 1 and 10000")
+        if last is not None and last < 1:
+            raise ValueError("last must be at least 1")
+        min_hmpi = request.args.get('min_hmpi')
+        max_hmpi = request.args.get('max_hmpi')
+        bbox = request.args.get('bbox')
+        bbox = [float(v) for v in bbox.split(',')] if bbox else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError('bbox must be "west,south,east,north"')
+        stations = store.stations(
+            owner_id(),
+            level=request.args.get('level'),
+            min_hmpi=float(min_hmpi) if min_hmpi is not None else None,
+            max_hmpi=float(max_hmpi) if max_hmpi is not None else None,
+            station=request.args.get('station'),
+            last=last,
+            bbox=bbox,
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    return jsonify({'stations': stations})
+
+# Make a saved dataset the session's dataset again
+@bp.route('/saved/<int:upload_id>/open', methods=['POST'])
+def open_saved(upload_id):
+    upload = store.upload(owner_id(), upload_id)
+    if upload is None:
+        return jsonify({'error': 'Saved dataset not found'}), 404
+    if not dataset_cache.has(upload['key'], upload['stage']):
+        return jsonify({'error': 'The data of this saved dataset has expired, please upload it again.'}), 410
+
+    session['dataset_key'] = upload['key']
+    session['calculated_stage'] = upload['stage']
+    session['streaming'] = False
+    # As after a merge, the last upload is not this dataset's file
+    session.pop('uploaded_file', None)
+    session.pop('sheets', None)
+    df = dataset_cache.get(upload['key'], upload['stage'])
+    return jsonify({
+            'message': 'Saved dataset opened.',
+            'rows': len(df),
+            'columns': list(df.columns),
+            'preview': processor.preview(df)
+        })
+
+@bp.route('/saved/<int:upload_id>', methods=['DELETE'])
+def delete_saved(upload_id):
+    if not store.delete(owner_id(), upload_id):
+        return jsonify({'error': 'Saved dataset not found'}), 404
+    return jsonify({'message': 'Saved dataset deleted.'})
+
 # Generate Report
-@app.route('/report', methods=['POST'])
+@bp.route('/report', methods=['POST'])
 def generate_report_route():
-    if 'df_cache' not in session:
+    if calculated_columns() is None:
         return "No data available to generate a report.", 400
-
-    df = pd.read_pickle(session['df_cache'])
     report_data = request.get_json()
 
     # --- Start of Fix ---
     # Pass the path to the static folder to the report generator
-    static_folder_path = os.path.join(app.root_path, 'frontend', 'static')
-    pdf_bytes = reporter.generate_report(df, report_data, static_folder_path)
+    static_folder_path = current_app.static_folder
     # --- End of Fix ---
 
-    return Response(
-        pdf_bytes,
-        mimetype='application/pdf',
-        headers={'Content-Disposition': 'attachment;filename=hmpi_report.pdf'}
+    key, stage = session['dataset_key'], session['calculated_stage']
+    dedupe_key = ('report', key, stage, json.dumps(report_data, sort_keys=True))
+    job_id = jobs.submit('report', dedupe_key, report_task, reporter, chart_renderer, dataset_cache, key, stage, report_data, static_folder_path,
+                         profile_path=job_profile_path('report'))
+    return job_accepted(job_id)
+
+# Background Jobs
+def job_accepted(job_id):
+    return jsonify({
+        'job_id': job_id,
+        'status_url': url_for('.job_status', job_id=job_id),
+        'result_url': url_for('.job_result', job_id=job_id)
+    }), 202
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(status)
+
+@bp.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error']}), 500
+    if job['status'] != 'done':
+        return jsonify({'error': 'Job not finished', 'status_url': url_for('.job_status', job_id=job_id)}), 409
+
+    if job['kind'] == 'map':
+        return map_response(job['result'], job['key'][1])
+    if job['kind'] == 'report':
+        return Response(
+            job['result'],
+            mimetype='application/pdf',
+            headers={'Content-Disposition': 'attachment;filename=hmpi_report.pdf'}
+        )
+    return jsonify(job['result'])
+
+# App Factory
+def create_app(preload=False):
+    """
+    Builds the Flask app. Nothing heavy is imported or started here: the
+    feature objects are built on first use and the job pool on the first
+    submitted job, so a worker serving only the pages starts in a fraction
+    of a second.
+
+    With `preload`, every feature module is imported and built upfront
+    instead. Use it with `gunicorn --preload wsgi:app` so the master pays
+    the imports once and forked workers share them.
+    """
+    app = Flask(
+        __name__,
+        template_folder="frontend/templates",
+        static_folder="frontend/static"
     )
+    app.secret_key = 'some-secret'
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    app.register_blueprint(bp)
+
+    if preload:
+        for feature in FEATURES:
+            feature.resolve()
+    return app
 
+app = create_app()
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -2,22 +2,25 @@
 
 import pandas as pd
 
+# Column names that are acronyms and should stay upper case
+ACRONYMS = {'hmpi', 'hei', 'mi'}
+
 class PrettyColumns:
     def prettify(self, df):
         """
         Cleans up column names for display.
         - Replaces underscores with spaces.
         - Title cases the words.
-        - Makes a special exception for acronyms like HMPI.
+        - Makes a special exception for acronyms like HMPI, HEI and MI.
         """
         rename_map = {}
         for col in df.columns:
             # General rule: replace underscores and title case the words
             new_col_name = col.replace('_', ' ').title()
             
-            # Specific exception for the HMPI acronym
-            if col.lower() == 'hmpi':
-                new_col_name = 'HMPI'
+            # Specific exception for index acronyms
+            if col.lower() in ACRONYMS:
+                new_col_name = col.upper()
             
             rename_map[col] = new_col_name
             
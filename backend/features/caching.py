@@ -0,0 +1,373 @@
+# backend/features/caching.py
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+from backend.features.metrics import metrics
+
+# pandas and pyarrow are imported where they are used, so that importing
+# artifact_key or content_hash at app startup stays cheap
+
+def content_hash(filepath, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file, read in blocks so large uploads stay cheap on memory."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def artifact_key(*parts):
+    """Stable SHA-256 key for any JSON-serialisable inputs, e.g. ('map', dataset key, options)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def dir_size(path):
+    """Total size in bytes of all files below a directory."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+class DatasetCache:
+    """
+    On-disk cache of DataFrames keyed by the content hash of the upload.
+
+    Each dataset gets its own directory holding one Parquet file per stage
+    (e.g. 'cleaned' after DataProcessor.load, 'calculated' after the HMPI
+    calculation). Different sessions uploading different files never share
+    a path, and re-uploading an identical file hits the same entry.
+
+    The whole cache is kept under `max_bytes`: when a write pushes it over,
+    the least recently used datasets are deleted first. Reads refresh a
+    dataset's modification time so it counts as recently used.
+
+    Recently used DataFrames are also kept in this process, up to
+    `max_memory_bytes` as measured by compact.memory_bytes. Every stage is
+    on disk already, so going over the budget just drops the least recently
+    used frames from memory and their next read comes from Parquet. With
+    `compact`, frames are stored with compact dtypes (see compact.compact)
+    and the memory saved is kept per stage, see memory_report(). Objects
+    built from a stage, such as the result browser's index, are kept under
+    the same budget, see derived().
+    """
+
+    def __init__(self, root=os.path.join('data', 'uploads', 'cache'), max_bytes=2 * 1024 ** 3,
+                 max_memory_bytes=256 * 1024 ** 2, compact=True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.compact = compact
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def __getstate__(self):
+        # Worker processes only need the disk tier, and keep no frames in memory
+        state = self.__dict__.copy()
+        state['memory'] = OrderedDict()
+        state['memory_bytes'] = 0
+        state['max_memory_bytes'] = 0
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def dataset_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def path(self, key, stage):
+        return os.path.join(self.dataset_dir(key), f'{stage}.parquet')
+
+    def report_path(self, key, stage):
+        return os.path.join(self.dataset_dir(key), f'{stage}.memory.json')
+
+    def has(self, key, stage):
+        return bool(key) and os.path.exists(self.path(key, stage))
+
+    def keys(self):
+        """Returns the keys of all cached datasets."""
+        return [key for key in os.listdir(self.root) if os.path.isdir(self.dataset_dir(key))]
+
+    def stages(self, key):
+        """Returns the names of the stages cached for a dataset."""
+        try:
+            names = os.listdir(self.dataset_dir(key))
+        except OSError:
+            return []
+        return [name[:-len('.parquet')] for name in names if name.endswith('.parquet')]
+
+    def touch(self, key):
+        try:
+            os.utime(self.dataset_dir(key))
+        except OSError:
+            pass
+
+    def get(self, key, stage, columns=None):
+        """Returns the cached DataFrame for a stage, or None if it is not cached."""
+        if not self.has(key, stage):
+            return None
+        self.touch(key)
+        with self.lock:
+            entry = self.memory.get((key, stage))
+            if entry is not None:
+                self.memory.move_to_end((key, stage))
+        if entry is not None:
+            df = entry[0]
+            # A shallow copy, so callers adding columns leave the kept frame alone
+            return df[columns] if columns is not None else df.copy(deep=False)
+
+        import pandas as pd
+        with metrics.stage('cache.read') as timed:
+            df = pd.read_parquet(self.path(key, stage), columns=columns)
+            timed.rows = len(df)
+        if columns is None:
+            self.remember(key, stage, df)
+            df = df.copy(deep=False)
+        return df
+
+    def columns(self, key, stage):
+        """Returns the column names of a cached stage from the Parquet schema, without reading any rows."""
+        if not self.has(key, stage):
+            return None
+        import pyarrow.parquet as pq
+        return pq.read_schema(self.path(key, stage)).names
+
+    def put(self, key, stage, df):
+        """Writes a DataFrame for a stage, then evicts old datasets if the cache is over budget."""
+        os.makedirs(self.dataset_dir(key), exist_ok=True)
+        if self.compact:
+            from backend.features.compact import compact
+            df, report = compact(df)
+            with open(self.report_path(key, stage), 'w') as f:
+                json.dump(report, f)
+            print(f"Compacted {stage} of dataset {key[:12]}: {report['bytes_before'] / 1e6:.1f} MB -> "
+                  f"{report['bytes_after'] / 1e6:.1f} MB ({report['saved_percent']}% saved)")
+        path = self.path(key, stage)
+        # Write to a temporary file first so readers never see a half-written file
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        from pyarrow import ArrowInvalid, ArrowTypeError
+        try:
+            with metrics.stage('cache.write') as timed:
+                timed.rows = len(df)
+                df = df.rename(columns=str)
+                try:
+                    df.to_parquet(tmp_path, index=False)
+                except (ArrowInvalid, ArrowTypeError):
+                    # Kept in memory as written, so memory and disk reads agree
+                    df = self.arrow_safe(df)
+                    df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.touch(key)
+        self.remember(key, stage, df)
+        self.evict(keep=key)
+        return path
+
+    def memory_report(self, key, stage):
+        """Returns the memory saved by compacting a stage (see compact.compact), or None."""
+        try:
+            with open(self.report_path(key, stage)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def remember(self, key, stage, df):
+        """Keeps a frame in memory, dropping least recently used frames to stay under max_memory_bytes."""
+        if not self.max_memory_bytes:
+            return
+        from backend.features.compact import memory_bytes
+        self.keep((key, stage), df, memory_bytes(df))
+
+    def keep(self, entry, value, size):
+        """Adds or resizes a memory entry, evicting least recently used entries to stay under max_memory_bytes."""
+        with self.lock:
+            if entry in self.memory:
+                self.memory_bytes -= self.memory.pop(entry)[1]
+            if size > self.max_memory_bytes:
+                return
+            self.memory[entry] = (value, size)
+            self.memory_bytes += size
+            while self.memory_bytes > self.max_memory_bytes:
+                _, (_, old_size) = self.memory.popitem(last=False)
+                self.memory_bytes -= old_size
+
+    def derived(self, key, stage, name, build):
+        """
+        Returns build(df) of a cached stage, or None if the stage is not
+        cached. The result is kept in memory next to the frames and counts
+        against max_memory_bytes, as reported by its memory_bytes() method.
+        It is measured again on every hit, so objects that grow as they are
+        used (e.g. by keeping query results) stay accounted for.
+        """
+        entry = (key, stage, name)
+        with self.lock:
+            kept = self.memory.get(entry)
+            if kept is not None:
+                self.memory.move_to_end(entry)
+        if kept is not None:
+            value = kept[0]
+        else:
+            df = self.get(key, stage)
+            if df is None:
+                return None
+            value = build(df)
+        if self.max_memory_bytes:
+            self.keep(entry, value, value.memory_bytes())
+        return value
+
+    def forget(self, key, stage=None):
+        """Drops a stage, or all stages of a dataset, and what was derived from them from memory. Call with the lock held."""
+        for entry in [entry for entry in self.memory if entry[0] == key and stage in (None, entry[1])]:
+            _, size = self.memory.pop(entry)
+            self.memory_bytes -= size
+
+    def arrow_safe(self, df):
+        """
+        Parquet needs one type per column. Object columns mixing strings and
+        numbers (common in hand-made spreadsheets) are stored as strings,
+        keeping missing values missing.
+        """
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == 'object':
+                values = df[col].dropna()
+                if not values.map(type).eq(str).all():
+                    df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+        return df
+
+    def evict(self, keep=None):
+        """Deletes least recently used datasets until the cache fits in max_bytes."""
+        entries = []
+        for key in os.listdir(self.root):
+            path = self.dataset_dir(key)
+            if os.path.isdir(path):
+                entries.append((os.path.getmtime(path), dir_size(path), key))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.dataset_dir(key), ignore_errors=True)
+            with self.lock:
+                self.forget(key)
+            total -= size
+
+class ArtifactCache:
+    """
+    Two-tier LRU cache for rendered artifacts (map HTML, images, PDF parts),
+    keyed by artifact_key() of everything the artifact depends on.
+
+    The memory tier holds up to `max_memory_bytes` in this process. The disk
+    tier holds up to `max_disk_bytes` under `root` and is shared with worker
+    processes, so a job can fill it and the web process picks the result up
+    on its next read. Disk hits are promoted to memory.
+    """
+
+    def __init__(self, root, max_memory_bytes=64 * 1024 ** 2, max_disk_bytes=512 * 1024 ** 2):
+        self.root = root
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def __getstate__(self):
+        # Worker processes only need the disk tier
+        state = self.__dict__.copy()
+        state['memory'] = OrderedDict()
+        state['memory_bytes'] = 0
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        """Returns the cached bytes, or None."""
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        self.remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """Stores bytes (or str, encoded as UTF-8) in both tiers."""
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+
+        self.remember(key, value)
+        self.evict_disk(keep=key)
+        return value
+
+    def remember(self, key, value):
+        """Adds a value to the memory tier, evicting least recently used entries."""
+        if len(value) > self.max_memory_bytes:
+            return
+        with self.lock:
+            if key in self.memory:
+                self.memory_bytes -= len(self.memory.pop(key))
+            self.memory[key] = value
+            self.memory_bytes += len(value)
+            while self.memory_bytes > self.max_memory_bytes:
+                _, old = self.memory.popitem(last=False)
+                self.memory_bytes -= len(old)
+
+    def evict_disk(self, keep=None):
+        """Deletes least recently used files until the disk tier fits in max_disk_bytes."""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name, path))
+
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, name, path in sorted(entries):
+            if total <= self.max_disk_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,79 @@
+# backend/features/compact.py
+
+import numpy as np
+import pandas as pd
+
+from backend.features.hmpi_calculation import HMPICalculation, POLLUTION_LEVELS
+from backend.features.spatial_index import station_column
+
+METALS = set(HMPICalculation().standards)
+
+def memory_bytes(df):
+    """Bytes a DataFrame takes in memory, strings included."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+def fits_float32(values):
+    """
+    True if every value survives a float32 round trip exactly. Anything
+    less would move values (and the indices computed from them) across the
+    permissible limits, e.g. hg=0.001 becomes 0.0010000000474974513.
+    """
+    with np.errstate(over='ignore', invalid='ignore'):
+        narrowed = values.astype('float32').astype('float64')
+    return bool(((narrowed == values) | (np.isnan(values) & np.isnan(narrowed))).all())
+
+def compact(df):
+    """
+    Returns (compacted copy of df, report) with exactly the same values in
+    less memory:
+
+    - metal columns become float32 where every value is exact in float32
+    - 'Pollution Level' becomes an ordered categorical, Perfect < ... < Extremely Poor
+    - 'Pollution Color' and the station name column are dictionary-encoded
+      (categoricals), so each distinct string is stored once
+
+    The report has the bytes before and after, and the dtype change of every
+    column that was converted.
+    """
+    before = memory_bytes(df)
+    df = df.copy()
+    changed = {}
+
+    for col in df.columns:
+        if str(col).lower() in METALS and df[col].dtype == 'float64':
+            values = df[col].to_numpy()
+            if fits_float32(values):
+                df[col] = values.astype('float32')
+                changed[col] = 'float32'
+
+    if 'Pollution Level' in df.columns and not isinstance(df['Pollution Level'].dtype, pd.CategoricalDtype):
+        df['Pollution Level'] = pd.Categorical(df['Pollution Level'], categories=POLLUTION_LEVELS, ordered=True)
+        changed['Pollution Level'] = 'ordered category'
+
+    for col in ['Pollution Color', station_column(df.columns)]:
+        if col in df.columns and df[col].dtype == 'object':
+            values = df[col]
+            # Parquet needs one type per dictionary, as in DatasetCache.arrow_safe
+            if not values.dropna().map(type).eq(str).all():
+                values = values.where(values.isna(), values.astype(str))
+            df[col] = values.astype('category')
+            changed[col] = 'category'
+
+    after = memory_bytes(df)
+    return df, {
+        'bytes_before': before,
+        'bytes_after': after,
+        'saved_percent': round(100 * (1 - after / before), 1) if before else 0.0,
+        'columns': changed,
+    }
+
+def widen(df):
+    """
+    Turns float32 columns back into float64, e.g. for JSON output. compact()
+    only narrows values float32 holds exactly, so this gives back the values
+    as uploaded.
+    """
+    narrow = [col for col in df.columns if df[col].dtype == 'float32']
+    if not narrow:
+        return df
+    return df.assign(**{col: df[col].astype('float64') for col in narrow})
@@ -1,8 +1,15 @@
 # backend/features/data_processing.py
 
+import os
 import pandas as pd
 import re
 
+from backend.features.excel_reader import ExcelReader
+from backend.features.metrics import metrics
+
+# Lower-cased column names that hold the sampling date, in order of preference
+DATE_COLUMNS = ['date', 'sample date', 'sampling date', 'collection date', 'sample_date', 'sampling_date', 'datetime', 'timestamp']
+
 class DataProcessor:
 
     def clean_columns(self, df):
@@ -11,9 +18,12 @@ class DataProcessor:
         geospatial columns.
         """
         rename_map = {}
+        date_col = self.find_date_column(df.columns)
         for col in df.columns:
             cleaned_col = col.strip().lower()
-            if cleaned_col in ['lat', 'latitude']:
+            if col == date_col:
+                rename_map[col] = 'Date'
+            elif cleaned_col in ['lat', 'latitude']:
                 rename_map[col] = 'Latitude'
             elif cleaned_col in ['lon', 'long', 'longitude']:
                 rename_map[col] = 'Longitude'
@@ -24,32 +34,125 @@ class DataProcessor:
         df = df.rename(columns=rename_map)
         return df
 
-    def load(self, filepath):
-        """Loads data from CSV or Excel and cleans it."""
+    def find_date_column(self, columns):
+        """
+        Returns the column holding the sampling date, or None. Known names
+        come first, then any column with the word 'date' in its name.
+        """
+        by_lower = {str(col).strip().lower(): col for col in columns}
+        for name in DATE_COLUMNS:
+            if name in by_lower:
+                return by_lower[name]
+        for lower, col in by_lower.items():
+            if re.search(r'\bdate\b', lower.replace('_', ' ')):
+                return col
+        return None
+
+    def parse_dates(self, df):
+        """
+        Converts the 'Date' column to datetimes. Unparseable values become NaT.
+        Non-ISO dates are read day first (15/08/2023), as in Indian records.
+        """
+        if 'Date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['Date']):
+            df['Date'] = pd.to_datetime(df['Date'], errors='coerce', dayfirst=True, format='mixed')
+        return df
+
+    def load(self, filepath, sheets=None, max_workers=None):
+        """
+        Loads data from CSV or Excel and cleans it. For workbooks, `sheets` is
+        a list of sheet names or 'all', concatenated with a 'Sheet' column;
+        by default only the first sheet is read. `max_workers` caps the
+        processes parsing sheets (the core count by default); pass 1 when
+        already running in a pool worker, e.g. batch.py or a background job.
+        """
         try:
-            if filepath.endswith('.csv'):
-                df = pd.read_csv(filepath)
-            elif filepath.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(filepath)
-            else:
-                raise ValueError("Unsupported file type")
+            with metrics.stage('load.read') as stage:
+                if filepath.endswith('.csv'):
+                    df = pd.read_csv(filepath)
+                elif filepath.endswith(('.xlsx', '.xls')):
+                    df = ExcelReader(max_workers).read(filepath, sheets)
+                else:
+                    raise ValueError("Unsupported file type")
+                stage.rows = len(df)
 
             # Clean the column headers
-            df = self.clean_columns(df)
+            with metrics.stage('load.clean'):
+                df = self.clean_columns(df)
+                df = self.parse_dates(df)
             
             # Convert numeric columns, coercing errors
-            for col in df.columns:
-                if df[col].dtype == 'object':
-                    # Use a regex to check if the column seems to contain numbers
-                    # before trying to convert. This is a simple heuristic.
-                    if df[col].str.contains(r'^\d+\.?\d*$', na=False).sum() > 0:
-                         df[col] = pd.to_numeric(df[col], errors='coerce')
+            with metrics.stage('load.numeric'):
+                for col in self.numeric_object_columns(df):
+                    df[col] = pd.to_numeric(df[col], errors='coerce')
 
             return df
         except Exception as e:
             print(f"Error loading data: {e}")
-            return pd.DataFrame() # Return empty dataframe on error
+            # Raised rather than an empty frame, which would be cached and calculated as if valid
+            raise ValueError(f"Could not read {os.path.basename(filepath)}: {e}") from e
+
+    def numeric_object_columns(self, df):
+        """
+        Returns the object columns that seem to contain numbers.
+        Uses a regex to check before trying to convert. This is a simple heuristic.
+        """
+        return [col for col in df.columns
+                if df[col].dtype == 'object'
+                and df[col].str.contains(r'^\d+\.?\d*$', na=False).sum() > 0]
+
+    def iter_chunks(self, filepath, chunksize=100_000):
+        """
+        Streams a CSV file as cleaned DataFrame chunks of at most `chunksize` rows.
+
+        The column names are cleaned once from the header. Whether a column is
+        coerced to numbers is decided by the first chunk where it has values
+        and then kept, so every chunk comes out with the same columns and
+        dtypes. A column that is empty in the first chunks is not taken for
+        numeric just because pandas reads empty cells as float. Only one chunk
+        is held in memory at a time.
+        """
+        if not filepath.endswith('.csv'):
+            raise ValueError("Streaming is only supported for CSV files")
+
+        header = pd.read_csv(filepath, nrows=0)
+        columns = list(self.clean_columns(header).columns)
+
+        numeric_cols, text_cols = set(), set()
+        for chunk in pd.read_csv(filepath, chunksize=chunksize):
+            chunk.columns = columns
+            for col in columns:
+                if col in numeric_cols or col in text_cols or not chunk[col].notna().any():
+                    continue
+                if chunk[col].dtype != 'object' or self.numeric_object_columns(chunk[[col]]):
+                    numeric_cols.add(col)
+                else:
+                    text_cols.add(col)
+            for col in numeric_cols:
+                if chunk[col].dtype == 'object':
+                    chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+            for col in text_cols:
+                # Read as numbers in this chunk, e.g. when all its cells are empty
+                if chunk[col].dtype != 'object':
+                    chunk[col] = chunk[col].astype(object)
+            yield self.parse_dates(chunk)
 
     def coordinates_check(self, df):
         """Checks if Latitude and Longitude columns exist."""
-        return 'Latitude' in df.columns and 'Longitude' in df.columns
\ No newline at end of file
+        return 'Latitude' in df.columns and 'Longitude' in df.columns
+
+    def preview(self, df, rows=30):
+        """
+        Returns the first rows as JSON-friendly records. Dates are sent as
+        'YYYY-MM-DD' strings, and missing dates as None.
+        """
+        from backend.features.compact import widen
+        with metrics.stage('preview'):
+            head = widen(df.head(rows))
+            for col in head.columns:
+                if pd.api.types.is_datetime64_any_dtype(head[col]):
+                    head = head.assign(**{col: head[col].dt.strftime('%Y-%m-%d').astype(object).where(head[col].notna(), None)})
+            return head.to_dict(orient='records')
+
+    def dates_check(self, df):
+        """Checks if the data has a parsed sampling 'Date' column."""
+        return 'Date' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Date'])
\ No newline at end of file
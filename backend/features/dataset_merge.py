@@ -0,0 +1,205 @@
+# backend/features/dataset_merge.py
+
+import re
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from backend.features.caching import artifact_key
+from backend.features.hmpi_calculation import INDEX_COLUMNS
+from backend.features.spatial_index import km_to_chord, station_column, unit_vectors
+
+# Stage the merged dataset is cached under. Kept apart from 'calculated' so
+# merged datasets are never merged again into new ones.
+MERGED_STAGE = 'merged'
+
+# Calculated stages: 'calculated' plus any extra indices, e.g. 'calculated-hei-cd'
+CALCULATED_STAGE = re.compile(r'^calculated(-(%s))*$' % '|'.join(INDEX_COLUMNS))
+
+# Bits per axis when packing a 3D grid cell into one int64
+CELL_BITS = 21
+CELL_OFFSET = 1 << (CELL_BITS - 1)
+
+# The 13 neighbour cells "after" a cell; with the cell itself, each pair of
+# neighbouring cells is visited exactly once
+HALF_NEIGHBOURS = [
+    (dx, dy, dz)
+    for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1)
+    if (dx, dy, dz) > (0, 0, 0)
+]
+
+def normalize_name(names):
+    """Lower-cases station names and collapses whitespace and punctuation, for matching."""
+    return names.astype(str).str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+
+class DatasetMerger:
+    """
+    Joins calculated datasets from the DatasetCache into one combined dataset,
+    with each station appearing once.
+
+    Stations within `tolerance_m` metres of each other are treated as the
+    same station, whatever they are called in each file. Points are placed
+    on the unit sphere (as in StationIndex) and hashed into cubic grid cells
+    as wide as the tolerance. Candidate pairs only come from the same or a
+    neighbouring cell, so the work grows with the number of rows and not
+    with the number of pairs of datasets. Pairs closer than the tolerance
+    become edges of a graph, and each connected component is one station.
+    Rows without coordinates are matched on their normalised name instead.
+
+    Each merged station gets the mean of every metal over its samples, the
+    mean position and its most common name. HMPI and the pollution level
+    are then recalculated from the merged concentrations.
+    """
+
+    def __init__(self, dataset_cache, calculator, formatter, tolerance_m=50):
+        if tolerance_m < 10:
+            raise ValueError("tolerance_m must be at least 10 metres")
+        self.dataset_cache = dataset_cache
+        self.calculator = calculator
+        self.formatter = formatter
+        self.tolerance_m = tolerance_m
+
+    def calculated_stage(self, key):
+        """Returns the calculated stage cached for a dataset, preferring plain 'calculated', or None."""
+        stages = [stage for stage in self.dataset_cache.stages(key) if CALCULATED_STAGE.match(stage)]
+        if 'calculated' in stages:
+            return 'calculated'
+        return min(stages, key=len) if stages else None
+
+    def available(self, keys=None):
+        """Returns [(key, stage)] of the cached datasets that have been calculated, among `keys` if given."""
+        datasets = []
+        for key in self.dataset_cache.keys() if keys is None else dict.fromkeys(keys):
+            stage = self.calculated_stage(key)
+            if stage:
+                datasets.append((key, stage))
+        return datasets
+
+    def merged_key(self, datasets):
+        """Dataset key of the merge of `datasets`; the same inputs always give the same key."""
+        return artifact_key('merge', sorted(datasets), self.tolerance_m)
+
+    def load(self, datasets):
+        """Reads and stacks the datasets, with their station names in one 'Station' column and a 'Source' column."""
+        frames = []
+        for source, (key, stage) in enumerate(datasets):
+            df = self.dataset_cache.get(key, stage)
+            if df is None or df.empty:
+                continue
+            name_col = station_column(df.columns)
+            metals = [col for col in df.columns if col.lower() in self.calculator.standards]
+            frame = pd.DataFrame({
+                'Station': df[name_col].astype(str) if name_col else pd.Series(None, index=df.index, dtype=object),
+                'Latitude': pd.to_numeric(df['Latitude'], errors='coerce') if 'Latitude' in df.columns else np.nan,
+                'Longitude': pd.to_numeric(df['Longitude'], errors='coerce') if 'Longitude' in df.columns else np.nan,
+                'Source': source,
+            })
+            # Metal columns of different files can differ in case ('As' and 'as')
+            for col in metals:
+                frame[col.lower()] = pd.to_numeric(df[col], errors='coerce')
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=['Station', 'Latitude', 'Longitude', 'Source'])
+        return pd.concat(frames, ignore_index=True)
+
+    def duplicate_pairs(self, lat, lon):
+        """
+        Returns (i, j) index arrays of the point pairs closer than the tolerance.
+        Points at exactly the same position should be collapsed beforehand,
+        as they would all pair up with each other.
+        """
+        h = float(km_to_chord(self.tolerance_m / 1000))
+        xyz = unit_vectors(lat, lon)
+        cells = np.floor(xyz / h).astype(np.int64) + CELL_OFFSET
+
+        def pack(c):
+            return (c[:, 0] << (2 * CELL_BITS)) | (c[:, 1] << CELL_BITS) | c[:, 2]
+
+        # Packing is linear, so a neighbour cell's key is the cell's key plus a
+        # constant. Working on sorted keys keeps every search below in order.
+        order = np.argsort(pack(cells), kind='stable')
+        sorted_keys = pack(cells[order])
+        sorted_xyz = xyz[order]
+
+        pairs_i, pairs_j = [], []
+        for offset in [(0, 0, 0)] + HALF_NEIGHBOURS:
+            dx, dy, dz = offset
+            delta = (dx << (2 * CELL_BITS)) + (dy << CELL_BITS) + dz
+            left = np.searchsorted(sorted_keys, sorted_keys + delta, side='left')
+            right = np.searchsorted(sorted_keys, sorted_keys + delta, side='right')
+            counts = right - left
+            if not counts.any():
+                continue
+            # Expand every point into one candidate per point of the target cell
+            i = np.repeat(np.arange(len(sorted_keys)), counts)
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = np.repeat(left, counts) + within
+            if offset == (0, 0, 0):
+                keep = i < j
+                i, j = i[keep], j[keep]
+            close = np.linalg.norm(sorted_xyz[i] - sorted_xyz[j], axis=1) <= h
+            pairs_i.append(order[i[close]])
+            pairs_j.append(order[j[close]])
+
+        if not pairs_i:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+    def cluster(self, frame):
+        """Returns one station label per row: rows with the same label are the same station."""
+        labels = np.full(len(frame), -1, dtype=np.int64)
+        lat = frame['Latitude'].to_numpy(dtype='float64')
+        lon = frame['Longitude'].to_numpy(dtype='float64')
+        located = np.isfinite(lat) & np.isfinite(lon)
+
+        if located.any():
+            # Repeat samples of one station share a position; pair positions, not rows
+            # (hashing lat + i*lon factorises both coordinates at once)
+            position_of_row, positions = pd.factorize(lat[located] + 1j * lon[located])
+            i, j = self.duplicate_pairs(positions.real, positions.imag)
+            n = len(positions)
+            graph = coo_matrix((np.ones(len(i), dtype=np.int8), (i, j)), shape=(n, n))
+            _, component = connected_components(graph, directed=False)
+            labels[located] = component[position_of_row]
+
+        unlocated = ~located
+        if unlocated.any():
+            names = normalize_name(frame.loc[unlocated, 'Station'].fillna(''))
+            codes, _ = pd.factorize(names)
+            labels[unlocated] = labels.max() + 1 + codes
+        return labels
+
+    def merge(self, datasets):
+        """
+        Merges the datasets and returns (combined DataFrame, summary). The
+        frame has one row per station, with Samples (rows merged) and
+        Datasets (files the station appears in) columns.
+        """
+        frame = self.load(datasets)
+        if frame.empty:
+            raise ValueError("None of the datasets has calculated data to merge")
+
+        frame['_station'] = self.cluster(frame)
+        grouped = frame.groupby('_station', sort=False)
+        metals = [metal for metal in self.calculator.standards if metal in frame.columns]
+
+        merged = grouped[['Latitude', 'Longitude'] + metals].mean()
+        # Most common name of each station, the first seen on ties
+        names = frame.dropna(subset=['Station']).groupby(['_station', 'Station'], sort=False).size().reset_index(name='n')
+        names = names.sort_values('n', ascending=False, kind='stable').drop_duplicates('_station')
+        merged['Station'] = names.set_index('_station')['Station']
+        merged['Samples'] = grouped.size()
+        merged['Datasets'] = grouped['Source'].nunique()
+        merged = merged.reset_index(drop=True)[['Station', 'Latitude', 'Longitude'] + metals + ['Samples', 'Datasets']]
+
+        merged = self.formatter.prettify(self.calculator.calculate(merged))
+        summary = {
+            'datasets': len(datasets),
+            'rows': len(frame),
+            'stations': len(merged),
+            'duplicates': len(frame) - len(merged),
+            'tolerance_m': self.tolerance_m,
+        }
+        return merged, summary
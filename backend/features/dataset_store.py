@@ -0,0 +1,219 @@
+# backend/features/dataset_store.py
+
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from backend.features.hmpi_calculation import LEVEL_BOUNDS, POLLUTION_LEVELS
+from backend.features.spatial_index import station_column
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS datasets (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    UNIQUE (key, stage)
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    dataset_id INTEGER NOT NULL REFERENCES datasets (id),
+    filename TEXT,
+    created REAL NOT NULL,
+    UNIQUE (owner, dataset_id)
+);
+CREATE TABLE IF NOT EXISTS stations (
+    dataset_id INTEGER NOT NULL REFERENCES datasets (id),
+    row INTEGER NOT NULL,
+    station TEXT,
+    latitude REAL,
+    longitude REAL,
+    hmpi REAL,
+    level INTEGER
+);
+CREATE INDEX IF NOT EXISTS uploads_owner ON uploads (owner, created);
+CREATE INDEX IF NOT EXISTS stations_level ON stations (dataset_id, level, hmpi);
+CREATE INDEX IF NOT EXISTS stations_hmpi ON stations (dataset_id, hmpi);
+CREATE INDEX IF NOT EXISTS stations_station ON stations (station, dataset_id);
+"""
+
+class DatasetStore:
+    """
+    SQLite file keeping the calculated datasets each owner has saved, with
+    the per-station columns that are searched on (station, position, HMPI
+    and pollution level) in an indexed table.
+
+    The station rows of a dataset are written once, however many owners save
+    it; an upload only links an owner to the dataset. Queries such as "every
+    Extremely Poor station in my last 10 uploads" are answered from the
+    indexes without reading the cached DataFrames. The full rows stay in the
+    DatasetCache, found by the same key and stage.
+
+    Connections are opened per call, so the store can be handed to worker
+    processes. WAL mode lets the web server read while a worker writes.
+    """
+
+    def __init__(self, path=os.path.join('data', 'uploads', 'datasets.sqlite3'), timeout=30):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        """Yields a connection inside a transaction, committed on success and rolled back on error."""
+        conn = sqlite3.connect(self.path, timeout=self.timeout)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def station_rows(self, df):
+        """Returns (row, station, latitude, longitude, hmpi, level) tuples of a calculated DataFrame, lazily."""
+        name_col = station_column(df.columns)
+        hmpi = pd.to_numeric(df['HMPI'], errors='coerce').to_numpy(dtype='float64')
+        levels = np.digitize(np.nan_to_num(hmpi, nan=np.inf), LEVEL_BOUNDS, right=True)
+
+        def column(values):
+            # None instead of NaN, so SQLite stores NULL
+            values = values.astype(object)
+            values[pd.isna(values)] = None
+            return values.tolist()
+
+        names = df[name_col].astype(str).tolist() if name_col else [None] * len(df)
+        lat = column(pd.to_numeric(df['Latitude'], errors='coerce').to_numpy()) if 'Latitude' in df.columns else [None] * len(df)
+        lon = column(pd.to_numeric(df['Longitude'], errors='coerce').to_numpy()) if 'Longitude' in df.columns else [None] * len(df)
+        return zip(
+            range(len(df)), names, lat, lon, column(hmpi),
+            [int(level) if np.isfinite(value) else None for level, value in zip(levels, hmpi)],
+        )
+
+    def save(self, owner, key, stage, df, filename=None):
+        """
+        Saves a calculated dataset for an owner and returns its upload id.
+        Saving the same dataset again only refreshes the upload's date.
+
+        Owners calculating the same file save it from separate jobs at the
+        same time. The dataset row is written with INSERT OR IGNORE, which
+        takes the write lock first, so the slower job waits, inserts nothing
+        and links its owner to the existing dataset.
+        """
+        with self.connect() as conn:
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO datasets (key, stage, rows) VALUES (?, ?, ?)', (key, stage, len(df))
+            ).rowcount
+            dataset_id = conn.execute('SELECT id FROM datasets WHERE key = ? AND stage = ?', (key, stage)).fetchone()['id']
+            if inserted:
+                conn.executemany(
+                    'INSERT INTO stations (dataset_id, row, station, latitude, longitude, hmpi, level) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    ((dataset_id, *values) for values in self.station_rows(df))
+                )
+
+            conn.execute(
+                'INSERT INTO uploads (owner, dataset_id, filename, created) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (owner, dataset_id) DO UPDATE SET created = excluded.created, '
+                'filename = COALESCE(excluded.filename, uploads.filename)',
+                (owner, dataset_id, filename, time.time())
+            )
+            return conn.execute(
+                'SELECT id FROM uploads WHERE owner = ? AND dataset_id = ?', (owner, dataset_id)
+            ).fetchone()['id']
+
+    def uploads(self, owner, limit=None):
+        """Returns the owner's saved datasets as dicts, newest first."""
+        with self.connect() as conn:
+            rows = conn.execute(
+                'SELECT u.id, u.filename, u.created, d.key, d.stage, d.rows '
+                'FROM uploads u JOIN datasets d ON d.id = u.dataset_id '
+                'WHERE u.owner = ? ORDER BY u.created DESC LIMIT ?',
+                (owner, -1 if limit is None else limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def upload(self, owner, upload_id):
+        """Returns one of the owner's saved datasets, or None."""
+        with self.connect() as conn:
+            row = conn.execute(
+                'SELECT u.id, u.filename, u.created, d.key, d.stage, d.rows '
+                'FROM uploads u JOIN datasets d ON d.id = u.dataset_id '
+                'WHERE u.owner = ? AND u.id = ?',
+                (owner, upload_id)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def delete(self, owner, upload_id):
+        """
+        Removes one of the owner's saved datasets. Station rows go too once
+        no owner has the dataset saved. Returns False if there was no such upload.
+        """
+        with self.connect() as conn:
+            row = conn.execute('SELECT dataset_id FROM uploads WHERE owner = ? AND id = ?', (owner, upload_id)).fetchone()
+            if row is None:
+                return False
+            dataset_id = row['dataset_id']
+            conn.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+            if conn.execute('SELECT 1 FROM uploads WHERE dataset_id = ? LIMIT 1', (dataset_id,)).fetchone() is None:
+                conn.execute('DELETE FROM stations WHERE dataset_id = ?', (dataset_id,))
+                conn.execute('DELETE FROM datasets WHERE id = ?', (dataset_id,))
+            return True
+
+    def stations(self, owner, level=None, min_hmpi=None, max_hmpi=None, station=None, last=None, bbox=None, limit=100):
+        """
+        Returns the stations of the owner's saved datasets that match every
+        given filter, highest HMPI first. `last` only searches the owner's
+        `last` most recent uploads; `level` is a pollution level name;
+        `bbox` is (west, south, east, north), with west > east for a box
+        crossing the antimeridian.
+        """
+        if level is not None and level not in POLLUTION_LEVELS:
+            raise ValueError(f"Unknown pollution level '{level}'. Available: {', '.join(POLLUTION_LEVELS)}")
+
+        conditions, params = [], [owner, -1 if last is None else last]
+        if level is not None:
+            conditions.append('s.level = ?')
+            params.append(POLLUTION_LEVELS.index(level))
+        if min_hmpi is not None:
+            conditions.append('s.hmpi >= ?')
+            params.append(min_hmpi)
+        if max_hmpi is not None:
+            conditions.append('s.hmpi <= ?')
+            params.append(max_hmpi)
+        if station is not None:
+            conditions.append('s.station = ?')
+            params.append(station)
+        if bbox is not None:
+            west, south, east, north = bbox
+            conditions.append('s.latitude BETWEEN ? AND ?')
+            params += [south, north]
+            conditions.append('(s.longitude >= ? AND s.longitude <= ?)' if west <= east else '(s.longitude >= ? OR s.longitude <= ?)')
+            params += [west, east]
+        params.append(limit)
+
+        # The owner's uploads come from their index, then each dataset's
+        # stations from the (dataset_id, level, hmpi) or (station, dataset_id) index
+        query = (
+            'SELECT u.id AS upload_id, u.filename, s.row, s.station, s.latitude, s.longitude, s.hmpi, s.level '
+            'FROM (SELECT id, dataset_id, filename FROM uploads WHERE owner = ? ORDER BY created DESC LIMIT ?) u '
+            'JOIN stations s ON s.dataset_id = u.dataset_id'
+            + (' WHERE ' + ' AND '.join(conditions) if conditions else '')
+            + ' ORDER BY s.hmpi DESC LIMIT ?'
+        )
+        with self.connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        records = []
+        for row in rows:
+            record = dict(row)
+            level = record.pop('level')
+            record['pollution_level'] = POLLUTION_LEVELS[level] if level is not None else None
+            records.append(record)
+        return records
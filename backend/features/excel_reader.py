@@ -0,0 +1,319 @@
+# backend/features/excel_reader.py
+
+import datetime
+import multiprocessing
+import os
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from backend.features.metrics import metrics
+
+# Transitional and strict OOXML namespaces, e.g. '{...main}sheet'
+MAIN_NAMESPACES = [
+    'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'http://purl.oclc.org/ooxml/spreadsheetml/main',
+]
+RELATIONSHIP_NAMESPACES = [
+    'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'http://purl.oclc.org/ooxml/officeDocument/relationships',
+]
+PACKAGE_RELATIONSHIPS = '{http://schemas.openxmlformats.org/package/2006/relationships}Relationship'
+
+# Built-in number formats that display a date or time (ECMA-376 18.8.30)
+DATE_FORMAT_IDS = set(range(14, 23)) | set(range(45, 48))
+
+# Day zero of the two Excel date systems
+EPOCH_1900 = datetime.datetime(1899, 12, 30)
+EPOCH_1904 = datetime.datetime(1904, 1, 1)
+
+# Name of the column that says which sheet a row came from when sheets are combined
+SHEET_COLUMN = 'Sheet'
+
+# Workbooks smaller than this are read one sheet after another: starting
+# worker processes (and pandas in each) takes longer than parsing them
+PARALLEL_MIN_BYTES = 2 * 1024 * 1024
+
+def main_tags(name):
+    return ['{%s}%s' % (ns, name) for ns in MAIN_NAMESPACES]
+
+def find_all(element, name):
+    """Descendants of element called `name` in either main namespace."""
+    return [found for tag in main_tags(name) for found in element.iter(tag)]
+
+def is_date_format(code):
+    """True if a custom number format code shows a date or time, e.g. 'dd/mm/yyyy'."""
+    # Quoted text, [colours] and escaped characters are not date parts
+    code = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.|_.|\*.', '', code)
+    return re.search(r'[dmyhs]', code, re.IGNORECASE) is not None
+
+def column_index(ref, cache={}):
+    """0-based column of a cell reference, e.g. 'AB12' -> 27."""
+    letters = ref.rstrip('0123456789')
+    index = cache.get(letters)
+    if index is None:
+        index = 0
+        for ch in letters.upper():
+            index = index * 26 + ord(ch) - 64
+        index = cache[letters] = index - 1
+    return index
+
+def unique_headers(values):
+    """Column names from the header row as pandas names them: 'Unnamed: 3' for blanks, 'x.1' for repeats."""
+    headers, seen = [], {}
+    for i, value in enumerate(values):
+        name = f'Unnamed: {i}' if value is None or value == '' else str(value)
+        base = name
+        while name in seen:
+            seen[base] += 1
+            name = f'{base}.{seen[base]}'
+        seen[name] = 0
+        headers.append(name)
+    return headers
+
+def parse_sheet(path, sheet):
+    """Module-level so it can run in a worker process, see ExcelReader.read."""
+    return ExcelReader().read_sheet(path, sheet)
+
+class ExcelReader:
+    """
+    Reads .xlsx workbooks by streaming each worksheet's XML out of the zip
+    with expat, without building cell or style objects. That is over three
+    times faster than pd.read_excel and keeps only the values in memory.
+
+    Values come out as pd.read_excel gives them: numbers as int or float,
+    date-formatted numbers as datetimes, error cells as missing, and the
+    first non-empty row as the header. Several sheets are parsed in
+    parallel processes and can be concatenated, with a 'Sheet' column.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    def workbook(self, archive):
+        """Returns ({sheet name: part path}, 1904 dates?) from the workbook and its relationships."""
+        root = ET.fromstring(archive.read('xl/workbook.xml'))
+        rels = ET.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+        targets = {}
+        for rel in rels.iter(PACKAGE_RELATIONSHIPS):
+            target = rel.get('Target')
+            # Targets are relative to xl/, or absolute within the package
+            targets[rel.get('Id')] = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+
+        sheets = {}
+        for sheet in find_all(root, 'sheet'):
+            rel_id = next((sheet.get('{%s}id' % ns) for ns in RELATIONSHIP_NAMESPACES if sheet.get('{%s}id' % ns)), None)
+            if rel_id in targets:
+                sheets[sheet.get('name')] = targets[rel_id]
+        date1904 = any(pr.get('date1904') in ('1', 'true') for pr in find_all(root, 'workbookPr'))
+        return sheets, date1904
+
+    def shared_strings(self, archive):
+        """The shared string table, rich text runs joined, phonetic hints left out."""
+        if 'xl/sharedStrings.xml' not in archive.namelist():
+            return []
+        strings = []
+        si_tags, t_tags, rph_tags = set(main_tags('si')), set(main_tags('t')), set(main_tags('rPh'))
+        with archive.open('xl/sharedStrings.xml') as f:
+            for event, element in ET.iterparse(f, events=('end',)):
+                if element.tag in si_tags:
+                    phonetic = {id(t) for rph in element if rph.tag in rph_tags for t in rph.iter()}
+                    strings.append(''.join(t.text or '' for t in element.iter() if t.tag in t_tags and id(t) not in phonetic))
+                    element.clear()
+        return strings
+
+    def date_styles(self, archive):
+        """Indexes of the cell formats (the 's' attribute of a cell) that display dates."""
+        if 'xl/styles.xml' not in archive.namelist():
+            return set()
+        root = ET.fromstring(archive.read('xl/styles.xml'))
+        custom_dates = {
+            int(fmt.get('numFmtId')) for fmt in find_all(root, 'numFmt')
+            if is_date_format(fmt.get('formatCode', ''))
+        }
+        styles = set()
+        for cell_xfs in find_all(root, 'cellXfs'):
+            for i, xf in enumerate(xf for xf in cell_xfs if xf.tag in main_tags('xf')):
+                num_fmt = int(xf.get('numFmtId', 0))
+                if num_fmt in DATE_FORMAT_IDS or num_fmt in custom_dates:
+                    styles.add(str(i))
+        return styles
+
+    def sheet_names(self, path):
+        """Names of the worksheets in workbook order."""
+        if not path.endswith('.xlsx'):
+            return list(pd.ExcelFile(path).sheet_names)
+        with zipfile.ZipFile(path) as archive:
+            return list(self.workbook(archive)[0])
+
+    def rows(self, archive, part, strings, date_styles, epoch):
+        """Parses one worksheet part into a list of rows, each a list of cell values."""
+        rows = []
+        row = None
+        # Current cell: [column, type, style, text]
+        cell = [0, None, None, '']
+        # Row numbers: [current row, last row with values]
+        number = [0, 0]
+        collecting = False
+        phonetic = 0
+        # Element names, with the sheet's namespace prefix if it uses one (e.g. 'x:c')
+        c_tag = row_tag = v_tag = t_tag = rph_tag = None
+
+        def start(name, attrs):
+            nonlocal row, collecting, phonetic, c_tag, row_tag, v_tag, t_tag, rph_tag
+            if name == c_tag:
+                ref = attrs.get('r')
+                cell[0] = column_index(ref) if ref else len(row)
+                cell[1] = attrs.get('t')
+                cell[2] = attrs.get('s')
+                cell[3] = ''
+            elif name == v_tag or name == t_tag:
+                collecting = not phonetic
+            elif name == row_tag:
+                row = []
+                number[0] = int(attrs['r']) if 'r' in attrs else number[0] + 1
+            elif name == rph_tag:
+                phonetic += 1
+            elif c_tag is None:
+                # The first element is the root, e.g. 'worksheet' or 'x:worksheet'
+                prefix = name[:name.index(':') + 1] if ':' in name else ''
+                c_tag, row_tag, v_tag, t_tag, rph_tag = (prefix + tag for tag in ('c', 'row', 'v', 't', 'rPh'))
+
+        def end(name):
+            nonlocal collecting, phonetic
+            if name == v_tag or name == t_tag:
+                collecting = False
+            elif name == c_tag:
+                text = cell[3]
+                if cell[1] is None and text and cell[2] not in date_styles:
+                    # Plain numbers are nearly every cell of a monitoring sheet, so they skip cell_value
+                    value = float(text) if '.' in text or 'E' in text or 'e' in text else int(text)
+                else:
+                    value = self.cell_value(cell[1], text, cell[2], strings, date_styles, epoch)
+                if value is not None:
+                    index = cell[0]
+                    if index > len(row):
+                        row.extend([None] * (index - len(row)))
+                    if index == len(row):
+                        row.append(value)
+                    else:
+                        row[index] = value
+            elif name == row_tag:
+                if row:
+                    # Blank rows between filled ones stay, as empty rows, like in pd.read_excel
+                    if rows:
+                        rows.extend([] for _ in range(number[0] - number[1] - 1))
+                    rows.append(row)
+                    number[1] = number[0]
+            elif name == rph_tag:
+                phonetic -= 1
+
+        def characters(data):
+            # With buffer_text a cell's text nearly always arrives in one piece
+            if collecting:
+                cell[3] += data
+
+        # Without namespace processing, which costs about a fifth of the parse
+        parser = xml.parsers.expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = characters
+        with archive.open(part) as f:
+            parser.ParseFile(f)
+        return rows
+
+    def cell_value(self, kind, text, style, strings, date_styles, epoch):
+        """The Python value of a cell from its type attribute and text."""
+        if kind is None or kind == 'n':
+            if text == '':
+                return None
+            if style in date_styles:
+                # Excel keeps dates to the millisecond, the rest of the float is noise
+                return epoch + datetime.timedelta(milliseconds=round(float(text) * 86_400_000))
+            # Like openpyxl, whole numbers without a decimal point or exponent are ints
+            if '.' in text or 'E' in text or 'e' in text:
+                return float(text)
+            return int(text)
+        if kind == 's':
+            return strings[int(text)] if text != '' else None
+        if kind in ('inlineStr', 'str'):
+            return text
+        if kind == 'b':
+            return text == '1'
+        if kind == 'd':
+            return datetime.datetime.fromisoformat(text) if text else None
+        # 'e', error cells like #DIV/0! are missing values, as in pd.read_excel
+        return None
+
+    def read_sheet(self, path, sheet=None):
+        """One worksheet as a DataFrame, the first one if `sheet` is None."""
+        with zipfile.ZipFile(path) as archive:
+            sheets, date1904 = self.workbook(archive)
+            if not sheets:
+                raise ValueError("The workbook has no worksheets")
+            if sheet is None:
+                sheet = next(iter(sheets))
+            elif sheet not in sheets:
+                raise ValueError(f"Unknown sheet '{sheet}'. Available: {', '.join(sheets)}")
+            rows = self.rows(archive, sheets[sheet], self.shared_strings(archive), self.date_styles(archive),
+                             EPOCH_1904 if date1904 else EPOCH_1900)
+
+        if not rows:
+            return pd.DataFrame()
+        width = max(len(row) for row in rows)
+        headers = unique_headers(rows[0] + [None] * (width - len(rows[0])))
+        # Trailing cells of a row are simply absent, so rows are padded per column
+        columns = {
+            name: [row[i] if i < len(row) else None for row in rows[1:]]
+            for i, name in enumerate(headers)
+        }
+        return pd.DataFrame(columns)
+
+    def selected(self, path, sheets=None):
+        """The sheet names `sheets` stands for: None is the first sheet, 'all' every sheet."""
+        names = self.sheet_names(path)
+        if sheets is None:
+            return names[:1]
+        if sheets == 'all':
+            return names
+        unknown = [sheet for sheet in sheets if sheet not in names]
+        if unknown:
+            raise ValueError(f"Unknown sheet '{unknown[0]}'. Available: {', '.join(names)}")
+        return list(dict.fromkeys(sheets))
+
+    def read(self, path, sheets=None):
+        """
+        Reads the selected sheets of a workbook into one DataFrame. With more
+        than one sheet, they are parsed in parallel and concatenated, and a
+        'Sheet' column records where each row came from.
+        """
+        names = self.selected(path, sheets)
+        with metrics.stage('load.excel') as stage:
+            if not path.endswith('.xlsx'):
+                # Legacy .xls is binary, pandas reads it with xlrd
+                frames = pd.read_excel(path, sheet_name=names)
+            elif len(names) == 1:
+                frames = {names[0]: self.read_sheet(path, names[0])}
+            else:
+                workers = min(len(names), self.max_workers or os.cpu_count() or 1)
+                if workers <= 1 or os.path.getsize(path) < PARALLEL_MIN_BYTES:
+                    frames = {name: self.read_sheet(path, name) for name in names}
+                else:
+                    context = multiprocessing.get_context('spawn')
+                    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                        futures = {name: pool.submit(parse_sheet, path, name) for name in names}
+                        frames = {name: future.result() for name, future in futures.items()}
+
+            if len(frames) == 1:
+                df = next(iter(frames.values()))
+            else:
+                df = pd.concat([frame.assign(**{SHEET_COLUMN: name}) for name, frame in frames.items()], ignore_index=True)
+                df.insert(0, SHEET_COLUMN, df.pop(SHEET_COLUMN))
+            stage.rows = len(df)
+        return df
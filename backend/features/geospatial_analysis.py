@@ -3,9 +3,99 @@
 import pandas as pd
 import folium
 from folium.plugins import HeatMap, MarkerCluster
+from folium.template import Template
 import numpy as np # Import numpy for logarithmic scaling
+import base64
+
+from backend.features.interpolation import METHODS, HMPIInterpolator
+from backend.features.spatial_index import StationIndex
+
+class BulkMarkerCluster(MarkerCluster):
+    """
+    Marker cluster whose markers are created in the browser from one compact,
+    column-oriented payload instead of one folium.Marker per station.
+
+    `data` holds parallel lists: lat, lon, name, hmpi and level (an index
+    into `levels`). Markers look the same as the ones built by
+    GeoSpatialAnalyser in per-row mode; popups are built when opened.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = (function(){
+                var data = {{ this.data|tojson }};
+                var levels = {{ this.levels|tojson }};
+                var levelColors = {{ this.level_colors|tojson }};
+                var cluster = L.markerClusterGroup({{ this.options|tojavascript }});
+                var markers = new Array(data.lat.length);
+
+                for (var i = 0; i < data.lat.length; i++) {
+                    var level = levels[data.level[i]];
+                    var color = levelColors[level] || 'black';
+                    var marker = L.marker([data.lat[i], data.lon[i]], {
+                        icon: L.AwesomeMarkers.icon({icon: 'tint', prefix: 'fa', markerColor: color, iconColor: 'white'})
+                    });
+                    marker.bindPopup((function (i, level, color) {
+                        return function () {
+                            return '<b>Location:</b> ' + data.name[i] + '<br>' +
+                                '<b>HMPI:</b> ' + data.hmpi[i].toFixed(2) + '<br>' +
+                                "<b style='color:" + color + ";'>Level: " + (level || 'N/A') + '</b>';
+                        };
+                    })(i, level, color), {maxWidth: 300});
+                    markers[i] = marker;
+                }
+
+                cluster.addLayers(markers);
+                cluster.addTo({{ this._parent.get_name() }});
+                return cluster;
+            })();
+        {% endmacro %}""")
+
+    def __init__(self, data, levels, level_colors, name=None, **kwargs):
+        super().__init__(name=name, chunked_loading=True, **kwargs)
+        self._name = 'BulkMarkerCluster'
+        self.data = data
+        self.levels = levels
+        self.level_colors = level_colors
 
 class GeoSpatialAnalyser:
+    # Maps with at least this many stations are rendered in bulk mode
+    bulk_threshold = 1000
+
+    # Base layers that can be picked with the `tiles` option
+    tile_layers = {
+        'street': {'tiles': 'OpenStreetMap', 'name': 'Street Map'},
+        'satellite': {
+            'tiles': 'https://{s}.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
+            'attr': 'Google',
+            'name': 'Google Satellite',
+            'overlay': False,
+            'control': True,
+            'subdomains': ['mt0', 'mt1', 'mt2', 'mt3']
+        },
+    }
+    default_options = {'radius': 25, 'blur': 20, 'tiles': ['street', 'satellite'], 'surface': None}
+
+    def map_options(self, radius=None, blur=None, tiles=None, surface=None):
+        """
+        Validates map options and fills in defaults. The result fully
+        describes the rendered map for a dataset, so it is also the cache key.
+        """
+        options = {
+            'radius': int(radius) if radius is not None else self.default_options['radius'],
+            'blur': int(blur) if blur is not None else self.default_options['blur'],
+            'tiles': list(tiles) if tiles else list(self.default_options['tiles']),
+            'surface': surface or self.default_options['surface'],
+        }
+        if options['surface'] not in (None,) + tuple(METHODS):
+            raise ValueError(f"Unknown surface method '{options['surface']}'. Available: {', '.join(METHODS)}")
+        if not 1 <= options['radius'] <= 100 or not 1 <= options['blur'] <= 100:
+            raise ValueError("radius and blur must be between 1 and 100")
+        unknown = [name for name in options['tiles'] if name not in self.tile_layers]
+        if unknown:
+            raise ValueError(f"Unknown tile layer(s): {', '.join(unknown)}. Available: {', '.join(self.tile_layers)}")
+        return options
+
     def get_color(self, level):
         if level == 'Perfect' or level == 'Good':
             return 'green'
@@ -18,7 +108,16 @@ class GeoSpatialAnalyser:
         else: # Extremely Poor
             return 'black'
 
-    def geospatial_analysis(self, df):
+    def geospatial_analysis(self, df, bulk=None, options=None):
+        """
+        Builds the folium map and returns its HTML. `options` is a dict from
+        map_options() (heatmap radius and blur, base tile layers).
+
+        With bulk=True the heatmap data comes straight from the NumPy arrays
+        and the markers are rendered client-side by BulkMarkerCluster, which
+        scales to tens of thousands of stations. bulk=None picks bulk mode
+        for datasets of at least `bulk_threshold` stations.
+        """
         # More robust algorithm to find all necessary columns
         lat_col, lon_col, hmpi_col = None, None, None
         station_col, pollution_col = None, None
@@ -67,28 +166,48 @@ class GeoSpatialAnalyser:
         
         # --- Start of Positioning and Layer Control Fix ---
 
+        options = options or self.map_options()
+
         # Create map without initial center/zoom; we will set it automatically
         m = folium.Map(tiles=None)
 
         # Add base tile layers
-        folium.TileLayer('OpenStreetMap', name='Street Map').add_to(m)
-        folium.TileLayer(
-            tiles='https://{s}.google.com/vt/lyrs=s&x={x}&y={y}&z={z}',
-            attr='Google',
-            name='Google Satellite',
-            overlay=False,
-            control=True,
-            subdomains=['mt0', 'mt1', 'mt2', 'mt3']
-        ).add_to(m)
+        for name in options['tiles']:
+            folium.TileLayer(**self.tile_layers[name]).add_to(m)
+        
+        if bulk is None:
+            bulk = len(df_geo) >= self.bulk_threshold
+
+        if bulk:
+            self.add_layers_bulk(m, df_geo, options)
+        else:
+            self.add_layers(m, df_geo, options)
+
+        if options.get('surface'):
+            self.add_surface(m, df_geo, options['surface'])
+
+        # Add the layer control, ensuring it is not collapsed by default
+        folium.LayerControl(collapsed=False).add_to(m)
         
+        # Automatically fit the map to the bounds of your data points
+        sw = df_geo[['Latitude', 'Longitude']].min().values.tolist()
+        ne = df_geo[['Latitude', 'Longitude']].max().values.tolist()
+        m.fit_bounds([sw, ne])
+        
+        # --- End of Positioning and Layer Control Fix ---
+        
+        return m._repr_html_()
+
+    def add_layers(self, m, df_geo, options):
+        """Adds the heatmap and one folium.Marker per station."""
         # Use the log-scaled data for the heatmap
         heat_data = [[row['Latitude'], row['Longitude'], row['Hmpi_log_scaled']] for index, row in df_geo.iterrows()]
         
         HeatMap(
             heat_data,
             name="HMPI Heatmap",
-            radius=25,
-            blur=20,
+            radius=options['radius'],
+            blur=options['blur'],
             min_opacity=0.5
         ).add_to(m)
 
@@ -105,14 +224,56 @@ class GeoSpatialAnalyser:
                 icon=folium.Icon(color=self.get_color(row.get('Pollution level', '')), icon='tint', prefix='fa')
             ).add_to(marker_cluster)
 
-        # Add the layer control, ensuring it is not collapsed by default
-        folium.LayerControl(collapsed=False).add_to(m)
-        
-        # Automatically fit the map to the bounds of your data points
-        sw = df_geo[['Latitude', 'Longitude']].min().values.tolist()
-        ne = df_geo[['Latitude', 'Longitude']].max().values.tolist()
-        m.fit_bounds([sw, ne])
-        
-        # --- End of Positioning and Layer Control Fix ---
-        
-        return m._repr_html_()
\ No newline at end of file
+    def add_layers_bulk(self, m, df_geo, options):
+        """Adds the same heatmap and markers as add_layers, built from column arrays."""
+        # Rounded to ~0.1 m, more digits only make the HTML bigger
+        heat_data = df_geo[['Latitude', 'Longitude', 'Hmpi_log_scaled']].to_numpy(dtype='float64').round(6)
+
+        heat_map = HeatMap(
+            [],
+            name="HMPI Heatmap",
+            radius=options['radius'],
+            blur=options['blur'],
+            min_opacity=0.5
+        )
+        # Rows were already validated (numeric, NaNs dropped) above, so skip
+        # HeatMap's per-row validation and hand it the array directly
+        heat_map.data = heat_data.tolist()
+        heat_map.add_to(m)
+
+        if 'Station name' in df_geo.columns:
+            names = df_geo['Station name'].astype(str).tolist()
+        else:
+            names = ['N/A'] * len(df_geo)
+
+        if 'Pollution level' in df_geo.columns:
+            level_codes, levels = pd.factorize(df_geo['Pollution level'].astype(str))
+            levels = levels.tolist()
+        else:
+            level_codes, levels = np.zeros(len(df_geo), dtype=int), ['']
+
+        BulkMarkerCluster(
+            data={
+                'lat': df_geo['Latitude'].round(6).tolist(),
+                'lon': df_geo['Longitude'].round(6).tolist(),
+                'name': names,
+                'hmpi': df_geo['Hmpi'].round(2).tolist(),
+                'level': level_codes.tolist(),
+            },
+            levels=levels,
+            level_colors={level: self.get_color(level) for level in levels},
+            name="Pollution Stations"
+        ).add_to(m)
+
+    def add_surface(self, m, df_geo, method):
+        """Adds an interpolated HMPI surface (IDW or kriging) as an image overlay layer."""
+        index = StationIndex(df_geo.rename(columns={'Hmpi': 'HMPI'}))
+        interpolator = HMPIInterpolator()
+        surface = interpolator.surface(index, method)
+        png = base64.b64encode(interpolator.to_png(surface)).decode('ascii')
+        folium.raster_layers.ImageOverlay(
+            image=f'data:image/png;base64,{png}',
+            bounds=surface['bounds'],
+            name=f"HMPI Surface ({method.upper()})",
+            mercator_project=False
+        ).add_to(m)
@@ -1,6 +1,22 @@
 #HMPI Calculations
 
-import pandas as pd
+import numpy as np
+
+# Upper HMPI bound (inclusive) of every pollution level, in ascending order.
+# Anything above the last bound is 'Extremely Poor'.
+LEVEL_BOUNDS = [10, 50, 100, 200, 400]
+POLLUTION_LEVELS = ['Perfect', 'Good', 'Moderate', 'Poor', 'Very Poor', 'Extremely Poor']
+POLLUTION_COLORS = ['#28a745', '#28a745', '#ffc107', '#fd7e14', '#dc3545', '#8b0000']
+
+# Indices that can be requested from calculate(), mapped to their output column.
+# 'hpi' is accepted as an alias of 'hmpi'.
+INDEX_COLUMNS = {
+    'hmpi': 'HMPI',
+    'hei': 'HEI',
+    'cd': 'Contamination Degree',
+    'mi': 'MI',
+}
+INDEX_ALIASES = {'hpi': 'hmpi'}
 
 class HMPICalculation:
 
@@ -25,57 +41,154 @@ class HMPICalculation:
             'v': {'S': 0.05, 'W': 20, 'I': 0}
         }
 
-    def calculate(self, df):
-        hmpi_list = []
-        poll_list=[]
-        poll_color_list = []
-
-        for index, row in df.iterrows():
-            num = 0
-            den = 0
-
-            # Only consider metals present in DataFrame and not NaN
-            present_metals = [metal for metal in self.standards if metal in row and pd.notna(row[metal])]
-
-            for metal in present_metals:
-                Mi = row[metal]
-                Si = self.standards[metal]['S']
-                Ii = self.standards[metal]['I']
-                Wi = self.standards[metal]['W']
-
-                Qi = 100 * (Mi - Ii) / (Si - Ii)
-                num += Wi * Qi
-                den += Wi
-            
-            hmpi = num / den if den != 0 else 0
-            hmpi_list.append(hmpi)
-
-            poll_level='Perfect'
-            poll_color = '#28a745'  # Default to green for 'Perfect'
-
-            if hmpi <= 10:
-                poll_level = 'Perfect'
-                poll_color = '#28a745'
-            elif hmpi <= 50:
-                poll_level = 'Good'
-                poll_color = '#28a745'
-            elif hmpi <= 100:
-                poll_level = 'Moderate'
-                poll_color = '#ffc107'
-            elif hmpi <= 200:
-                poll_level = 'Poor'
-                poll_color = '#fd7e14'
-            elif hmpi <= 400:
-                poll_level = 'Very Poor'
-                poll_color = '#dc3545'
-            else:
-                poll_level = 'Extremely Poor'
-                poll_color = '#8b0000'
-            
-            poll_list.append(poll_level)
-            poll_color_list.append(poll_color)
-
-        df['HMPI'] = hmpi_list
-        df['Pollution Level'] = poll_list
-        
-        return df
\ No newline at end of file
+    def standard_arrays(self, metals):
+        """Returns the S, W and I values of the given metals as aligned arrays."""
+        S = np.array([self.standards[metal]['S'] for metal in metals], dtype='float64')
+        W = np.array([self.standards[metal]['W'] for metal in metals], dtype='float64')
+        I = np.array([self.standards[metal]['I'] for metal in metals], dtype='float64')
+        return S, W, I
+
+    def classify(self, hmpi):
+        """
+        Maps an array of HMPI values to pollution levels and colors.
+        Bounds are inclusive on the upper side, so 10 is 'Perfect' and
+        10.01 is 'Good'. NaN falls through to 'Extremely Poor'.
+        """
+        level_idx = np.digitize(hmpi, LEVEL_BOUNDS, right=True)
+        levels = np.array(POLLUTION_LEVELS, dtype=object)[level_idx]
+        colors = np.array(POLLUTION_COLORS, dtype=object)[level_idx]
+        return levels, colors
+
+    def normalize_indices(self, indices):
+        """
+        Validates a list of requested index names (or a single name) and
+        returns their canonical keys. HMPI is always included since the
+        pollution level is based on it.
+        """
+        if isinstance(indices, str):
+            # A bare "HEI" would otherwise be read letter by letter
+            indices = [indices]
+        requested = ['hmpi']
+        for name in indices or []:
+            key = str(name).strip().lower()
+            key = INDEX_ALIASES.get(key, key)
+            if key not in INDEX_COLUMNS:
+                raise ValueError(f"Unknown index '{name}'. Available: {', '.join(INDEX_COLUMNS)}")
+            if key not in requested:
+                requested.append(key)
+        return requested
+
+    def sub_indices(self, df):
+        """
+        Builds the per-metal sub-index matrices for the DataFrame in one pass.
+        Every index is derived from these, so the data is only scanned once
+        however many indices are requested.
+
+        Returns a dict with:
+        - metals: metal columns used, in standards order
+        - present: boolean (rows x metals) mask of non-NaN cells
+        - ratio: Mi / Si, 0 where the cell is missing
+        - qi: 100 * (Mi - Ii) / (Si - Ii), 0 where the cell is missing
+        - W: weights aligned with metals
+        """
+        # Only consider metals present in DataFrame, in standards order
+        metals = [metal for metal in self.standards if metal in df.columns]
+        S, W, I = self.standard_arrays(metals)
+
+        Mi = df[metals].to_numpy(dtype='float64')
+        present = ~np.isnan(Mi)
+
+        return {
+            'metals': metals,
+            'present': present,
+            'ratio': np.where(present, Mi / S, 0),
+            'qi': np.where(present, 100 * (Mi - I) / (S - I), 0),
+            'W': W,
+        }
+
+    def hmpi_index(self, sub):
+        """HMPI = sum(Wi * Qi) / sum(Wi) over the metals present in each row."""
+        num = (sub['qi'] * sub['W']).sum(axis=1)
+        den = (sub['present'] * sub['W']).sum(axis=1)
+        hmpi = np.zeros(len(num))
+        np.divide(num, den, out=hmpi, where=den != 0)
+        return hmpi
+
+    def hei_index(self, sub):
+        """Heavy metal Evaluation Index, HEI = sum(Mi / Si)."""
+        return sub['ratio'].sum(axis=1)
+
+    def cd_index(self, sub):
+        """Contamination Degree, Cd = sum(Mi / Si - 1)."""
+        return (sub['ratio'] - sub['present']).sum(axis=1)
+
+    def mi_index(self, sub):
+        """
+        Metal Index, MI = sum(Ci / MACi). With Si as the maximum allowable
+        concentration this is numerically the same sum as HEI.
+        """
+        return self.hei_index(sub)
+
+    def compute_indices(self, df, indices=None):
+        """Returns {column name: values} for every requested index, from one sub-index matrix."""
+        sub = self.sub_indices(df)
+        return {INDEX_COLUMNS[key]: getattr(self, f'{key}_index')(sub)
+                for key in self.normalize_indices(indices)}
+
+    def calculate(self, df, indices=None):
+        """
+        Adds HMPI, Pollution Level and Pollution Color columns to the DataFrame,
+        plus a column for every extra index requested (HEI, Cd, MI).
+
+        All rows are computed at once on a (rows x metals) matrix built from
+        the metal columns present in the data. A NaN cell only drops that
+        metal from that row's sums.
+        """
+        results = self.compute_indices(df, indices)
+
+        for column, values in results.items():
+            df[column] = values
+
+        poll_levels, poll_colors = self.classify(results['HMPI'])
+        df['Pollution Level'] = poll_levels
+        df['Pollution Color'] = poll_colors
+
+        return df
+
+    def calculate_stream(self, chunks, output_path, indices=None):
+        """
+        Runs calculate() over an iterable of DataFrame chunks and appends each
+        result to a CSV file, so the full result is never held in memory.
+
+        Only running aggregates are kept: row count, count per pollution level,
+        mean and max HMPI. These are returned as a summary dict.
+        """
+        # Fail on unknown index names before anything is written
+        indices = self.normalize_indices(indices)
+
+        rows = 0
+        hmpi_sum = 0.0
+        hmpi_max = None
+        level_counts = dict.fromkeys(POLLUTION_LEVELS, 0)
+
+        with open(output_path, 'w', newline='') as f:
+            for i, chunk in enumerate(chunks):
+                chunk = self.calculate(chunk, indices)
+                chunk.to_csv(f, header=(i == 0), index=False)
+
+                hmpi = chunk['HMPI'].to_numpy()
+                rows += len(hmpi)
+                hmpi_sum += float(hmpi.sum())
+                if len(hmpi):
+                    chunk_max = hmpi.max()
+                    hmpi_max = chunk_max if hmpi_max is None else max(hmpi_max, chunk_max)
+                for level, count in chunk['Pollution Level'].value_counts().items():
+                    level_counts[level] += int(count)
+
+        return {
+            'rows': rows,
+            'level_counts': level_counts,
+            'hmpi_mean': hmpi_sum / rows if rows else 0.0,
+            'hmpi_max': float(hmpi_max) if hmpi_max is not None else 0.0,
+            'output_path': output_path,
+        }
@@ -0,0 +1,198 @@
+# backend/features/interpolation.py
+
+import io
+
+import numpy as np
+
+from backend.features.hmpi_calculation import LEVEL_BOUNDS, POLLUTION_COLORS
+from backend.features.spatial_index import EARTH_RADIUS_KM, haversine_km, unit_vectors
+
+METHODS = ['idw', 'kriging']
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+def mercator_y(lat):
+    return np.arcsinh(np.tan(np.radians(lat)))
+
+def inverse_mercator_y(y):
+    return np.degrees(np.arctan(np.sinh(y)))
+
+class HMPIInterpolator:
+    """
+    Estimates HMPI between stations on a regular grid over the dataset bounds.
+
+    Each grid cell only looks at its `k` nearest stations, found with the
+    StationIndex KD-tree, so the cost is O(cells * k) whatever the number of
+    stations. Cells are processed in batches of `batch_size` with NumPy.
+
+    - 'idw': inverse distance weighting, weights 1 / d**power.
+    - 'kriging': local ordinary kriging with an exponential variogram fitted
+      to a sample of station pairs. Slower than IDW; one small linear system
+      per cell, solved in batches.
+
+    Rows are spaced evenly in Web Mercator so the raster lines up with the
+    web map when drawn as an image overlay.
+    """
+
+    def __init__(self, k=12, power=2, max_cells=250_000, batch_size=20_000):
+        self.k = k
+        self.power = power
+        self.max_cells = max_cells
+        self.batch_size = batch_size
+
+    def grid(self, index, resolution):
+        """
+        Returns (lats, lons, bounds) of a grid with `resolution` cells along
+        the longer side of the station bounds, capped at max_cells in total.
+        """
+        south, north = index.lat.min(), index.lat.max()
+        west, east = index.lon.min(), index.lon.max()
+        # Pad so single stations or lines of stations still get an area
+        pad_lat = max((north - south) * 0.05, 0.01)
+        pad_lon = max((east - west) * 0.05, 0.01)
+        south, north = max(south - pad_lat, -85), min(north + pad_lat, 85)
+        west, east = west - pad_lon, east + pad_lon
+
+        y0, y1 = mercator_y(south), mercator_y(north)
+        x_span, y_span = np.radians(east - west), y1 - y0
+        if x_span >= y_span:
+            width = resolution
+            height = max(int(round(resolution * y_span / x_span)), 1)
+        else:
+            height = resolution
+            width = max(int(round(resolution * x_span / y_span)), 1)
+
+        scale = min(1.0, np.sqrt(self.max_cells / (width * height)))
+        width, height = max(int(width * scale), 1), max(int(height * scale), 1)
+
+        # Cell centres, north to south so row 0 is the top of the image
+        lons = west + (np.arange(width) + 0.5) * (east - west) / width
+        lats = inverse_mercator_y(y1 - (np.arange(height) + 0.5) * (y1 - y0) / height)
+        return lats, lons, [[float(south), float(west)], [float(north), float(east)]]
+
+    def neighbours(self, index, lat, lon):
+        """k nearest stations of each point: (distances in km, station positions)."""
+        k = min(self.k, len(index))
+        chord, idx = index.tree.query(unit_vectors(lat, lon), k=k)
+        return chord_to_km(chord).reshape(len(lat), k), idx.reshape(len(lat), k)
+
+    def idw(self, index, lat, lon):
+        dist, idx = self.neighbours(index, lat, lon)
+        values = index.hmpi[idx]
+        with np.errstate(divide='ignore'):
+            weights = 1.0 / dist ** self.power
+        # A cell centred exactly on a station takes that station's value
+        exact = np.isinf(weights)
+        weights = np.where(exact.any(axis=1, keepdims=True), exact.astype(float), weights)
+        return (weights * values).sum(axis=1) / weights.sum(axis=1)
+
+    def fit_variogram(self, index, sample=2000, bins=15, seed=0):
+        """
+        Fits an exponential variogram gamma(h) = nugget + psill * (1 - exp(-3h / range))
+        to the empirical semivariance of a random sample of stations.
+        Returns (nugget, psill, range_km).
+        """
+        rng = np.random.default_rng(seed)
+        pick = rng.choice(len(index), size=min(sample, len(index)), replace=False)
+        lat, lon, z = index.lat[pick], index.lon[pick], index.hmpi[pick]
+
+        i, j = np.triu_indices(len(pick), k=1)
+        h = haversine_km(lat[i], lon[i], lat[j], lon[j])
+        semivariance = 0.5 * (z[i] - z[j]) ** 2
+
+        sill = max(float(np.var(z)), 1e-9)
+        max_h = float(h.max()) if len(h) else 1.0
+        if max_h <= 0:
+            return 0.0, sill, 1.0
+
+        edges = np.linspace(0, max_h / 2, bins + 1)
+        which = np.digitize(h, edges) - 1
+        ok = (which >= 0) & (which < bins)
+        counts = np.bincount(which[ok], minlength=bins)
+        sums = np.bincount(which[ok], weights=semivariance[ok], minlength=bins)
+        filled = counts > 0
+        lags = ((edges[:-1] + edges[1:]) / 2)[filled]
+        gamma = sums[filled] / counts[filled]
+        weight = counts[filled]
+
+        best, best_err = (0.0, sill, max_h / 3), np.inf
+        for range_km in np.linspace(max_h / 50, max_h, 40):
+            for nugget_share in np.linspace(0, 0.5, 6):
+                nugget, psill = sill * nugget_share, sill * (1 - nugget_share)
+                model = nugget + psill * (1 - np.exp(-3 * lags / range_km))
+                err = float((weight * (model - gamma) ** 2).sum())
+                if err < best_err:
+                    best, best_err = (nugget, psill, float(range_km)), err
+        return best
+
+    def kriging(self, index, lat, lon, variogram):
+        nugget, psill, range_km = variogram
+
+        def gamma(h):
+            return np.where(h > 0, nugget + psill * (1 - np.exp(-3 * h / range_km)), 0.0)
+
+        dist, idx = self.neighbours(index, lat, lon)
+        n, k = idx.shape
+        nlat, nlon = index.lat[idx], index.lon[idx]
+
+        # Ordinary kriging system per cell: [G 1; 1' 0] [w; mu] = [g0; 1]
+        A = np.ones((n, k + 1, k + 1))
+        A[:, :k, :k] = gamma(haversine_km(nlat[:, :, None], nlon[:, :, None], nlat[:, None, :], nlon[:, None, :]))
+        # A tiny measurement-error term keeps stations sharing coordinates solvable
+        A[:, np.arange(k), np.arange(k)] = -1e-6 * (nugget + psill)
+        A[:, k, k] = 0
+        b = np.ones((n, k + 1, 1))
+        b[:, :k, 0] = gamma(dist)
+
+        try:
+            w = np.linalg.solve(A, b)
+        except np.linalg.LinAlgError:
+            w = np.linalg.pinv(A) @ b
+        return (w[:, :k, 0] * index.hmpi[idx]).sum(axis=1)
+
+    def surface(self, index, method='idw', resolution=200):
+        """
+        Interpolates HMPI over the station bounds. Returns a dict with the
+        grid bounds [[south, west], [north, east]] and a (height x width)
+        array of values, row 0 at the north edge.
+        """
+        if method not in METHODS:
+            raise ValueError(f"Unknown interpolation method '{method}'. Available: {', '.join(METHODS)}")
+        if len(index) == 0:
+            raise ValueError("No stations with coordinates to interpolate")
+
+        lats, lons, bounds = self.grid(index, resolution)
+        grid_lat = np.repeat(lats, len(lons))
+        grid_lon = np.tile(lons, len(lats))
+
+        variogram = self.fit_variogram(index) if method == 'kriging' else None
+        values = np.empty(len(grid_lat))
+        for start in range(0, len(grid_lat), self.batch_size):
+            batch = slice(start, start + self.batch_size)
+            if method == 'idw':
+                values[batch] = self.idw(index, grid_lat[batch], grid_lon[batch])
+            else:
+                values[batch] = self.kriging(index, grid_lat[batch], grid_lon[batch], variogram)
+
+        return {
+            'method': method,
+            'bounds': bounds,
+            'values': np.maximum(values, 0).reshape(len(lats), len(lons)),
+        }
+
+    def to_png(self, surface, opacity=0.6):
+        """Renders a surface as a PNG coloured by pollution level, for use as a map overlay."""
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib import colors
+        from matplotlib import pyplot as plt
+
+        cmap = colors.ListedColormap(POLLUTION_COLORS)
+        norm = colors.BoundaryNorm([-np.inf] + LEVEL_BOUNDS + [np.inf], cmap.N)
+        rgba = cmap(norm(surface['values']))
+        rgba[..., 3] = np.where(np.isfinite(surface['values']), opacity, 0)
+
+        buffer = io.BytesIO()
+        plt.imsave(buffer, rgba, format='png')
+        return buffer.getvalue()
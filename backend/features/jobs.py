@@ -0,0 +1,403 @@
+# backend/features/jobs.py
+
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs of web workers that died are not reaped
+    fcntl = None
+
+from backend.features.metrics import metrics
+
+# Stages reported by the tasks below, in the order they run
+STAGES = ['queued', 'parse', 'calculate', 'prettify', 'charts', 'render', 'done']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key BLOB NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    error TEXT,
+    result BLOB,
+    created REAL NOT NULL,
+    finished REAL,
+    worker TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+"""
+
+def connect(path, timeout=30):
+    """Opens a connection to the job database at `path`."""
+    conn = sqlite3.connect(path, timeout=timeout)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+class Progress:
+    """Picklable callable that workers use to publish the stage their job is in."""
+
+    def __init__(self, path, job_id):
+        self.path = path
+        self.job_id = job_id
+
+    def __call__(self, stage):
+        conn = connect(self.path)
+        try:
+            with conn:
+                conn.execute("UPDATE jobs SET stage = ?, status = 'running' WHERE id = ?", (stage, self.job_id))
+        finally:
+            conn.close()
+
+def run_job(fn, progress, profile_path, *args):
+    """
+    Runs a task in a worker and returns (result, metrics snapshot), so the
+    stages timed in the worker show up in the web process's /metrics.
+    """
+    metrics.process = 'worker'
+    metrics.reset()
+    profiler = metrics.start_profile() if profile_path else None
+    try:
+        result = fn(progress, *args)
+    finally:
+        if profiler:
+            metrics.stop_profile(profiler, profile_path)
+    return result, metrics.snapshot()
+
+class JobManager:
+    """
+    Runs heavy work (calculation, map build, PDF render) in a process pool so
+    the Flask request thread only has to hand out a job id.
+
+    Job state, stage and result live in a SQLite file shared by every web
+    worker, so a job submitted through one gunicorn worker can be polled
+    through any other. Workers publish their stage to the same file.
+
+    Identical jobs that are still queued or running in this process are
+    deduplicated: the caller gets the id of the job already in flight.
+    Finished jobs keep their result until `max_finished` newer jobs have
+    finished.
+
+    Each web worker that submits jobs holds an flock on a file of its own
+    for as long as it lives. When a process opens the database it fails the
+    unfinished jobs of workers whose lock is free, i.e. that died, so their
+    status does not stay 'running' forever. A pool broken by a crashed job
+    process (e.g. killed for memory) is replaced on the next submit.
+
+    The pool is only created on the first submit and the database on first
+    use, so importing this module (or preloading the app) starts nothing.
+    """
+
+    def __init__(self, path=os.path.join('data', 'uploads', 'jobs.sqlite3'), max_workers=None, max_finished=100, timeout=30):
+        self.path = path
+        self.max_workers = max_workers
+        self.max_finished = max_finished
+        self.timeout = timeout
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self._executor = None
+        self._ready = False
+        self.worker = None
+        self._alive = None
+
+    @property
+    def workers_dir(self):
+        return f'{self.path}.workers'
+
+    def connect(self):
+        """
+        Returns a connection to the job database. The first time, creates its
+        table and fails the jobs left unfinished by workers that died.
+        """
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = connect(self.path, self.timeout)
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.executescript(SCHEMA)
+                # Databases created before jobs recorded their worker
+                if 'worker' not in [row['name'] for row in conn.execute('PRAGMA table_info(jobs)')]:
+                    conn.execute('ALTER TABLE jobs ADD COLUMN worker TEXT')
+            finally:
+                conn.close()
+            self._ready = True
+            self.reap()
+        return connect(self.path, self.timeout)
+
+    def claim_worker(self):
+        """Gives this process a worker id and holds its lock until the process exits."""
+        if self.worker is not None:
+            return
+        self.worker = uuid.uuid4().hex
+        if fcntl is not None:
+            os.makedirs(self.workers_dir, exist_ok=True)
+            self._alive = open(os.path.join(self.workers_dir, self.worker), 'w')
+            fcntl.flock(self._alive, fcntl.LOCK_EX)
+
+    def reap(self):
+        """Fails the queued and running jobs of workers that are no longer alive. Returns how many."""
+        if fcntl is None:
+            return 0
+        reaped = 0
+        workers = {row['worker'] for row in self.execute('SELECT DISTINCT worker FROM jobs WHERE finished IS NULL')}
+        # Workers that exited without unfinished jobs only leave their file behind
+        if os.path.isdir(self.workers_dir):
+            workers.update(os.listdir(self.workers_dir))
+        for worker in workers:
+            if worker == self.worker:
+                continue
+            if worker is not None:
+                path = os.path.join(self.workers_dir, worker)
+                try:
+                    with open(path, 'a') as f:
+                        # Taken while its worker lives; the OS frees it when the worker dies
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    pass
+            reaped += len(self.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ? "
+                "WHERE finished IS NULL AND worker IS ? RETURNING id",
+                ('The server stopped before the job finished, please try again', time.time(), worker)
+            ))
+            if worker is not None:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if reaped:
+            print(f"Marked {reaped} jobs of stopped workers as failed")
+        return reaped
+
+    def execute(self, sql, params=()):
+        """Runs one statement in its own transaction and returns the fetched rows."""
+        conn = self.connect()
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def executor(self):
+        self.claim_worker()
+        if self._executor is None:
+            # 'spawn' avoids forking the threaded web server
+            context = multiprocessing.get_context('spawn')
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+        return self._executor
+
+    def submit(self, kind, dedupe_key, fn, *args, profile_path=None):
+        """
+        Queues fn(progress, *args) and returns the job id. `fn` must be a
+        module-level function and `args` picklable. With `profile_path`,
+        the job runs under cProfile and its profile is dumped there.
+        """
+        with self.lock:
+            job_id = self.in_flight.get(dedupe_key)
+            if job_id is not None:
+                return job_id
+
+            executor = self.executor()
+            job_id = uuid.uuid4().hex
+            self.execute(
+                "INSERT INTO jobs (id, kind, key, status, stage, created, worker) VALUES (?, ?, ?, 'queued', 'queued', ?, ?)",
+                (job_id, kind, pickle.dumps(dedupe_key), time.time(), self.worker)
+            )
+            self.in_flight[dedupe_key] = job_id
+            args = (run_job, fn, Progress(self.path, job_id), profile_path, *args)
+            try:
+                future = executor.submit(*args)
+            except BrokenProcessPool:
+                self.drop_executor(executor)
+                executor = self.executor()
+                future = executor.submit(*args)
+
+        future.add_done_callback(lambda f: self._finish(job_id, kind, dedupe_key, executor, f))
+        return job_id
+
+    def drop_executor(self, executor):
+        """Forgets a broken pool, so the next submit starts a new one. Call with the lock held."""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False)
+
+    def _finish(self, job_id, kind, dedupe_key, executor, future):
+        finished = time.time()
+        try:
+            result, snapshot = future.result()
+            metrics.merge(snapshot)
+            status = 'done'
+            self.execute("UPDATE jobs SET status = 'done', stage = 'done', result = ?, finished = ? WHERE id = ?",
+                         (pickle.dumps(result), finished, job_id))
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            if isinstance(e, BrokenProcessPool):
+                # A job process died, e.g. killed for memory; every later submit would fail on this pool
+                with self.lock:
+                    self.drop_executor(executor)
+            status = 'failed'
+            self.execute("UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                         (str(e), finished, job_id))
+        created = self.execute('SELECT created FROM jobs WHERE id = ?', (job_id,))
+        if created:
+            metrics.observe('hmpi_job_seconds', finished - created[0]['created'], {'kind': kind, 'status': status})
+        with self.lock:
+            self.in_flight.pop(dedupe_key, None)
+        self._prune()
+
+    def _prune(self):
+        self.execute(
+            'DELETE FROM jobs WHERE finished IS NOT NULL AND id NOT IN '
+            '(SELECT id FROM jobs WHERE finished IS NOT NULL ORDER BY finished DESC LIMIT ?)',
+            (self.max_finished,)
+        )
+
+    def get(self, job_id):
+        """Returns the job as a dict with its unpickled key and result, or None if it is unknown."""
+        rows = self.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job['key'] = pickle.loads(job['key'])
+        job['result'] = pickle.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    def status(self, job_id):
+        """Returns a JSON-friendly status dict for the job, or None if it is unknown."""
+        rows = self.execute('SELECT kind, status, stage, error, created, finished FROM jobs WHERE id = ?', (job_id,))
+        if not rows:
+            return None
+        job = rows[0]
+        stage = job['stage']
+        return {
+            'id': job_id,
+            'kind': job['kind'],
+            'status': job['status'],
+            'stage': stage,
+            'progress': STAGES.index(stage) / (len(STAGES) - 1) if stage in STAGES else None,
+            'error': job['error'],
+            'elapsed': (job['finished'] or time.time()) - job['created'],
+        }
+
+# --- Tasks ---
+# Each task receives the feature objects it needs from app.py and reports its stage.
+# pandas and dataset_merge are imported inside the tasks that need them,
+# so importing this module at app startup stays cheap.
+
+def load_cleaned(progress, processor, cache, key, filepath, sheets=None):
+    progress('parse')
+    df = cache.get(key, 'cleaned')
+    if df is None:
+        # Already in a pool worker, so sheets are parsed in-process
+        df = processor.load(filepath, sheets, max_workers=1)
+        cache.put(key, 'cleaned', df)
+    return df
+
+def calculate_task(progress, processor, calculator, formatter, cache, timeseries, store, owner, key, filepath, indices, stage, sheets=None):
+    df_pretty = cache.get(key, stage)
+    if df_pretty is None:
+        df = load_cleaned(progress, processor, cache, key, filepath, sheets)
+
+        progress('calculate')
+        with metrics.stage('calculate') as timed:
+            df = calculator.calculate(df, indices)
+            timed.rows = len(df)
+
+        progress('prettify')
+        with metrics.stage('prettify'):
+            df_pretty = formatter.prettify(df)
+        cache.put(key, stage, df_pretty)
+
+        # Dated samples also feed the trend rollups; a no-op for undated or already ingested data
+        with metrics.stage('timeseries.ingest') as timed:
+            timed.rows = timeseries.ingest(key, df_pretty)
+
+    # Saved for the owner even on a cache hit, e.g. a file someone else uploaded first
+    with metrics.stage('store.save'):
+        store.save(owner, key, stage, df_pretty, os.path.basename(filepath))
+
+    progress('render')
+    return {
+        'message': 'HMPI calculated successfully!',
+        'rows': len(df_pretty),
+        'memory': cache.memory_report(key, stage),
+        'columns': list(df_pretty.columns),
+        'preview': processor.preview(df_pretty)
+    }
+
+def calculate_stream_task(progress, processor, calculator, formatter, filepath, output_path, indices, chunksize):
+    import pandas as pd
+    progress('calculate')
+    with metrics.stage('calculate.stream') as timed:
+        chunks = processor.iter_chunks(filepath, chunksize=chunksize)
+        summary = calculator.calculate_stream(chunks, output_path, indices)
+        timed.rows = summary['rows']
+
+    progress('render')
+    df_pretty = formatter.prettify(pd.read_csv(output_path, nrows=30))
+    return {
+        'message': 'HMPI calculated successfully!',
+        'rows': summary['rows'],
+        'summary': summary,
+        'columns': list(df_pretty.columns),
+        'preview': processor.preview(df_pretty)
+    }
+
+def map_task(progress, geospatial, cache, artifacts, key, stage, options, artifact):
+    progress('parse')
+    df = cache.get(key, stage)
+
+    progress('render')
+    with metrics.stage('map') as timed:
+        map_html = geospatial.geospatial_analysis(df, options=options)
+        timed.rows = len(df)
+    artifacts.put(artifact, map_html)
+    return map_html
+
+def report_task(progress, reporter, chart_renderer, cache, key, stage, report_data, static_folder_path):
+    progress('parse')
+    df = cache.get(key, stage)
+
+    progress('charts')
+    with metrics.stage('charts') as timed:
+        charts = chart_renderer.render(df, key, stage)
+        timed.rows = len(df)
+
+    progress('render')
+    with metrics.stage('report') as timed:
+        timed.rows = len(df)
+        return reporter.generate_report(df, report_data, static_folder_path, charts, key, stage)
+
+def merge_task(progress, merger, cache, store, owner, merged_key, datasets):
+    from backend.features.compact import widen
+    from backend.features.dataset_merge import MERGED_STAGE
+    progress('parse')
+    df = cache.get(merged_key, MERGED_STAGE)
+    if df is None:
+        progress('calculate')
+        with metrics.stage('merge') as timed:
+            df, summary = merger.merge(datasets)
+            timed.rows = summary['rows']
+        cache.put(merged_key, MERGED_STAGE, df)
+    else:
+        summary = {'datasets': len(datasets), 'stations': len(df)}
+    with metrics.stage('store.save'):
+        store.save(owner, merged_key, MERGED_STAGE, df, f'Merge of {len(datasets)} datasets')
+
+    progress('render')
+    return {
+        'message': 'Datasets merged successfully!',
+        'summary': summary,
+        'rows': len(df),
+        'columns': list(df.columns),
+        'preview': widen(df.head(30)).to_dict(orient='records')
+    }
@@ -0,0 +1,53 @@
+# backend/features/lazy.py
+
+import importlib
+import threading
+
+def build(module, name, args, kwargs):
+    """Imports `module` and returns name(*args, **kwargs), building any lazy arguments first."""
+    args = [arg.resolve() if isinstance(arg, LazyFeature) else arg for arg in args]
+    kwargs = {key: value.resolve() if isinstance(value, LazyFeature) else value for key, value in kwargs.items()}
+    return getattr(importlib.import_module(module), name)(*args, **kwargs)
+
+class LazyFeature:
+    """
+    Stands in for a feature object and only imports its module and builds
+    it on first use, e.g. LazyFeature('backend.features.geospatial_analysis',
+    'GeoSpatialAnalyser'). Attribute access is passed on to the real object.
+
+    The feature modules pull in pandas, folium, fpdf, matplotlib and scipy,
+    which take over a second to import. With every feature behind one of
+    these, starting the app, or serving a page that needs none of them,
+    imports none of them.
+
+    When pickled for a job worker, it is rebuilt from the same module, class
+    and arguments on the other side, so the worker does not need the web
+    process to have built it first.
+    """
+
+    def __init__(self, module, name, *args, **kwargs):
+        self._spec = (module, name, args, kwargs)
+        self._object = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        """Returns the real object, building it on the first call."""
+        if self._object is None:
+            with self._lock:
+                if self._object is None:
+                    self._object = build(*self._spec)
+        return self._object
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found on the proxy itself
+        if attr.startswith('__') or attr in ('_spec', '_object', '_lock'):
+            raise AttributeError(attr)
+        return getattr(self.resolve(), attr)
+
+    def __reduce__(self):
+        return build, self._spec
+
+    def __repr__(self):
+        module, name, _, _ = self._spec
+        state = 'built' if self._object is not None else 'not built'
+        return f'<LazyFeature {module}.{name} ({state})>'
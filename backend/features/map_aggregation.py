@@ -0,0 +1,154 @@
+# backend/features/map_aggregation.py
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from backend.features.hmpi_calculation import LEVEL_BOUNDS, POLLUTION_LEVELS
+
+# Web Mercator cannot represent the poles
+MAX_LATITUDE = 85.05112878
+
+def spread_bits(v):
+    """Spreads the low 32 bits of v so there is a zero bit between each of them."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+class GridAggregator:
+    """
+    Bins stations into a quadtree of Web Mercator tiles, one level per map
+    zoom, so the map can fetch a summary per cell instead of every station.
+
+    Every station gets a Morton (Z-order) code at `max_zoom`. The code of its
+    tile at a lower zoom is the same code shifted right by two bits per
+    level, so one sort at `max_zoom` puts the stations in order for every
+    zoom. Each level is then reduced in a single pass, without sorting again.
+
+    Each cell holds the station count, the mean and max HMPI, the worst
+    pollution level and the mean position of its stations. Grids are built
+    once per dataset and kept in a small in-memory LRU as well as in the
+    DatasetCache (stage '<stage>-grid') when one is given.
+    """
+
+    def __init__(self, max_zoom=16, dataset_cache=None, max_datasets=8):
+        self.max_zoom = max_zoom
+        self.dataset_cache = dataset_cache
+        self.max_datasets = max_datasets
+        self._grids = OrderedDict()
+
+    def tile_xy(self, lat, lon, zoom):
+        """Returns the slippy-map tile x, y of each point at the given zoom."""
+        n = 2 ** zoom
+        lat = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+        x = np.floor((lon + 180.0) / 360.0 * n)
+        y = np.floor((1.0 - np.arcsinh(np.tan(lat)) / np.pi) / 2.0 * n)
+        return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+    def build(self, df):
+        """
+        Returns a DataFrame with one row per non-empty cell at every zoom:
+        zoom, x, y, count, mean, max, level, lat, lon.
+        Cells of each zoom are sorted by x then y for viewport queries.
+        """
+        lat = pd.to_numeric(df['Latitude'], errors='coerce').to_numpy(dtype='float64')
+        lon = pd.to_numeric(df['Longitude'], errors='coerce').to_numpy(dtype='float64')
+        hmpi = pd.to_numeric(df['HMPI'], errors='coerce').to_numpy(dtype='float64')
+        valid = np.isfinite(lat) & np.isfinite(lon) & np.isfinite(hmpi) & (np.abs(lon) <= 180)
+        lat, lon, hmpi = lat[valid], lon[valid], hmpi[valid]
+
+        x, y = self.tile_xy(lat, lon, self.max_zoom)
+        codes = spread_bits(x) | (spread_bits(y) << np.uint64(1))
+
+        order = np.argsort(codes, kind='stable')
+        codes, lat, lon, hmpi = codes[order], lat[order], lon[order], hmpi[order]
+        level = np.digitize(hmpi, LEVEL_BOUNDS, right=True)
+
+        frames = []
+        for zoom in range(self.max_zoom + 1):
+            cell_codes = codes >> np.uint64(2 * (self.max_zoom - zoom))
+            if len(cell_codes) == 0:
+                break
+            starts = np.flatnonzero(np.r_[True, cell_codes[1:] != cell_codes[:-1]])
+            count = np.diff(np.r_[starts, len(cell_codes)])
+
+            cells = pd.DataFrame({
+                'count': count,
+                'mean': np.add.reduceat(hmpi, starts) / count,
+                'max': np.maximum.reduceat(hmpi, starts),
+                'level': np.maximum.reduceat(level, starts),
+                'lat': np.add.reduceat(lat, starts) / count,
+                'lon': np.add.reduceat(lon, starts) / count,
+            })
+            cells['x'], cells['y'] = self.tile_xy(cells['lat'].to_numpy(), cells['lon'].to_numpy(), zoom)
+            cells['zoom'] = zoom
+            frames.append(cells.sort_values(['x', 'y'], kind='stable'))
+
+        columns = ['zoom', 'x', 'y', 'count', 'mean', 'max', 'level', 'lat', 'lon']
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)[columns]
+
+    def grid(self, key, stage, df=None):
+        """
+        Returns the per-zoom cell arrays for a dataset, building them from
+        `df` (or the dataset cache) on first use.
+        """
+        cache_key = (key, stage)
+        if cache_key in self._grids:
+            self._grids.move_to_end(cache_key)
+            return self._grids[cache_key]
+
+        grid_stage = f'{stage}-grid'
+        cells = self.dataset_cache.get(key, grid_stage) if self.dataset_cache else None
+        if cells is None:
+            if df is None:
+                df = self.dataset_cache.get(key, stage, columns=['Latitude', 'Longitude', 'HMPI'])
+            cells = self.build(df)
+            if self.dataset_cache:
+                self.dataset_cache.put(key, grid_stage, cells)
+
+        zooms = {}
+        for zoom, group in cells.groupby('zoom'):
+            zooms[int(zoom)] = {col: group[col].to_numpy() for col in cells.columns if col != 'zoom'}
+
+        self._grids[cache_key] = zooms
+        if len(self._grids) > self.max_datasets:
+            self._grids.popitem(last=False)
+        return zooms
+
+    def query(self, zooms, zoom, bbox=None):
+        """
+        Returns the cells at `zoom` whose tile lies in bbox = (west, south, east, north),
+        as a list of dicts. Zooms past max_zoom use the max_zoom cells.
+        """
+        zoom = int(min(max(zoom, 0), self.max_zoom))
+        cells = zooms.get(zoom)
+        if cells is None:
+            return []
+
+        lo, hi = 0, len(cells['x'])
+        mask = slice(None)
+        if bbox is not None:
+            west, south, east, north = bbox
+            (x0, x1), (y0, y1) = self.tile_xy(np.array([north, south]), np.array([west, east]), zoom)
+            # Cells are sorted by x, so the x range is a contiguous slice
+            lo, hi = np.searchsorted(cells['x'], [x0, x1 + 1])
+            y = cells['y'][lo:hi]
+            mask = (y >= y0) & (y <= y1)
+
+        return [
+            {
+                'lat': float(lat), 'lon': float(lon), 'count': int(count),
+                'mean': float(mean), 'max': float(max_), 'level': POLLUTION_LEVELS[level],
+            }
+            for lat, lon, count, mean, max_, level in zip(
+                cells['lat'][lo:hi][mask], cells['lon'][lo:hi][mask], cells['count'][lo:hi][mask],
+                cells['mean'][lo:hi][mask], cells['max'][lo:hi][mask], cells['level'][lo:hi][mask],
+            )
+        ]
@@ -0,0 +1,225 @@
+# backend/features/metrics.py
+
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS, timings only
+    resource = None
+
+# Latency buckets in seconds, from fast routes up to large reports
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Name: (Prometheus type, help text) of every metric that is recorded
+DESCRIPTIONS = {
+    'hmpi_request_seconds': ('histogram', 'Time taken to answer a request, per route.'),
+    'hmpi_job_seconds': ('histogram', 'Time from submit to finish of background jobs.'),
+    'hmpi_stage_seconds': ('histogram', 'Time spent in each pipeline stage.'),
+    'hmpi_stage_rows_total': ('counter', 'Rows processed by each pipeline stage.'),
+    'hmpi_stage_rss_growth_bytes_total': ('counter', 'How much each pipeline stage raised the peak RSS of its process.'),
+    'hmpi_process_max_rss_bytes': ('gauge', 'Peak RSS of the web process, and of the largest job worker.'),
+}
+
+def max_rss():
+    """Peak resident set size of this process in bytes, or None where it is not available."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+class Stage:
+    """Times one pipeline stage; set `rows` inside the block to count the rows it processed."""
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.rows = None
+
+    def __enter__(self):
+        self.rss = max_rss()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        labels = {'stage': self.name}
+        self.metrics.observe('hmpi_stage_seconds', seconds, labels)
+        if self.rows is not None:
+            self.metrics.inc('hmpi_stage_rows_total', self.rows, labels)
+        if self.rss is not None:
+            rss = max_rss()
+            self.metrics.inc('hmpi_stage_rss_growth_bytes_total', rss - self.rss, labels)
+            self.metrics.gauge_max('hmpi_process_max_rss_bytes', rss, {'process': self.metrics.process})
+        return False
+
+class NullStage:
+    """Stand-in for Stage when metrics are off, so instrumented code costs next to nothing."""
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_STAGE = NullStage()
+
+class Metrics:
+    """
+    In-process store of latency histograms, counters and gauges, rendered
+    in the Prometheus text format for /metrics.
+
+    Pipeline code marks its stages with `with metrics.stage('load.read') as
+    stage: ...`. Most stages run in JobManager's worker processes, which
+    have their own copy of this module. Each job resets the worker's copy,
+    and its snapshot is sent back with the job result and merged into the
+    web process. Histograms and counters are added up; gauges keep the
+    maximum.
+
+    Set the HMPI_METRICS environment variable to 0 to turn recording off;
+    stages then cost one attribute check. With HMPI_PROFILE_DIR set, a
+    request with ?profile=1 is run under cProfile and the profile is dumped
+    to that directory. The profile of any job it starts is dumped there too.
+    """
+
+    def __init__(self, enabled=True, profile_dir=None, buckets=BUCKETS, process='web'):
+        self.enabled = enabled
+        self.profile_dir = profile_dir
+        self.buckets = buckets
+        self.process = process
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.gauges = {}
+
+    def stage(self, name):
+        return Stage(self, name) if self.enabled else NULL_STAGE
+
+    def observe(self, name, value, labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            # Non-cumulative counts, the last one above every bucket
+            i = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def inc(self, name, value, labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge_max(self, name, value, labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = max(self.gauges.get(key, value), value)
+
+    def snapshot(self):
+        """Returns everything recorded as plain, picklable data."""
+        with self.lock:
+            return {
+                'histograms': {key: {**value, 'buckets': list(value['buckets'])} for key, value in self.histograms.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+            }
+
+    def merge(self, snapshot):
+        """Adds a snapshot from another process into this one."""
+        if not self.enabled or not snapshot:
+            return
+        with self.lock:
+            for key, value in snapshot['histograms'].items():
+                histogram = self.histograms.setdefault(key, {'buckets': [0] * len(value['buckets']), 'sum': 0.0, 'count': 0})
+                histogram['buckets'] = [a + b for a, b in zip(histogram['buckets'], value['buckets'])]
+                histogram['sum'] += value['sum']
+                histogram['count'] += value['count']
+            for key, value in snapshot['counters'].items():
+                self.counters[key] = self.counters.get(key, 0) + value
+            for key, value in snapshot['gauges'].items():
+                self.gauges[key] = max(self.gauges.get(key, value), value)
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        if self.enabled:
+            rss = max_rss()
+            if rss is not None:
+                self.gauge_max('hmpi_process_max_rss_bytes', rss, {'process': self.process})
+
+        def label_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+            return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+        snapshot = self.snapshot()
+        lines = []
+        for name, (kind, help_text) in DESCRIPTIONS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                for (metric, labels), value in sorted(snapshot['histograms'].items()):
+                    if metric != name:
+                        continue
+                    total = 0
+                    for bound, count in zip(list(self.buckets) + ['+Inf'], value['buckets']):
+                        total += count
+                        lines.append(f'{name}_bucket{label_text(labels, [("le", bound)])} {total}')
+                    lines.append(f'{name}_sum{label_text(labels)} {value["sum"]}')
+                    lines.append(f'{name}_count{label_text(labels)} {value["count"]}')
+            else:
+                values = snapshot['counters'] if kind == 'counter' else snapshot['gauges']
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f'{name}{label_text(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    # --- Profiling ---
+
+    def profile_path(self, name):
+        """Path to dump a profile of `name` to, or None if profiling is off."""
+        if not self.profile_dir:
+            return None
+        os.makedirs(self.profile_dir, exist_ok=True)
+        safe_name = ''.join(char if char.isalnum() else '_' for char in str(name))
+        # The random suffix keeps profiles dumped within the same second apart
+        return os.path.join(self.profile_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{safe_name}-{os.getpid()}-{uuid.uuid4().hex[:8]}.prof')
+
+    def start_profile(self):
+        """Starts a cProfile profiler, or returns None if another profile is already running."""
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            print(f"Profiling skipped: {e}")
+            return None
+        return profiler
+
+    def stop_profile(self, profiler, path):
+        profiler.disable()
+        profiler.dump_stats(path)
+        print(f"Profile written to {path}")
+
+metrics = Metrics(
+    enabled=os.environ.get('HMPI_METRICS', '1') != '0',
+    profile_dir=os.environ.get('HMPI_PROFILE_DIR') or None,
+)
@@ -0,0 +1,305 @@
+# backend/features/report_charts.py
+
+import io
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backend.features.caching import artifact_key
+from backend.features.hmpi_calculation import HMPICalculation, LEVEL_BOUNDS, POLLUTION_COLORS, POLLUTION_LEVELS
+from backend.features.spatial_index import station_column
+
+# Metals shown in the key-metal comparison, when present
+KEY_METALS = ['as', 'cd', 'cr']
+
+# --- Chart renderers ---
+# Module-level so they can run in worker processes. Each takes plain arrays
+# and the shared chart params, and returns PNG bytes.
+
+def new_figure(params, size=(10, 6)):
+    # The object-oriented API keeps workers independent of pyplot's global state
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=size, dpi=params['dpi'])
+    return fig, fig.add_subplot()
+
+def to_png(fig):
+    buffer = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+def hmpi_histogram(data, params):
+    fig, ax = new_figure(params)
+    hmpi = data['hmpi'][np.isfinite(data['hmpi'])]
+    ax.hist(hmpi, bins=params['bins'], color='#2c7fb8', edgecolor='white')
+    ax.set_xlabel('HMPI')
+    ax.set_ylabel('Number of sites')
+    ax.set_title('HMPI Distribution')
+    return to_png(fig)
+
+def level_pie(data, params):
+    fig, ax = new_figure(params, size=(8, 8))
+    counts = data['level_counts']
+    shown = [i for i, count in enumerate(counts) if count > 0]
+    ax.pie(
+        [counts[i] for i in shown],
+        labels=[POLLUTION_LEVELS[i] for i in shown],
+        colors=[POLLUTION_COLORS[i] for i in shown],
+        autopct='%1.1f%%',
+        startangle=90
+    )
+    ax.set_title('Sites by Pollution Level')
+    return to_png(fig)
+
+def sample_line(data, params):
+    fig, ax = new_figure(params)
+    hmpi = data['hmpi']
+    x = np.arange(1, len(hmpi) + 1)
+    if len(hmpi) > params['max_points']:
+        # Too many samples to draw one by one: show the min-max envelope and
+        # mean of consecutive buckets, which keeps every spike visible
+        buckets = np.array_split(np.arange(len(hmpi)), params['max_points'])
+        starts = np.array([bucket[0] for bucket in buckets])
+        filled = np.where(np.isfinite(hmpi), hmpi, np.nan)
+        with np.errstate(invalid='ignore'):
+            low = np.fmin.reduceat(filled, starts)
+            high = np.fmax.reduceat(filled, starts)
+            mean = np.add.reduceat(np.nan_to_num(filled), starts) / np.maximum(np.add.reduceat(np.isfinite(filled).astype(int), starts), 1)
+        ax.fill_between(x[starts], low, high, color='#2c7fb8', alpha=0.3, linewidth=0, label='Min-max')
+        ax.plot(x[starts], mean, color='#2c7fb8', linewidth=0.8, label='Mean')
+        ax.legend()
+    else:
+        ax.plot(x, hmpi, color='#2c7fb8', linewidth=0.8, marker='o' if len(hmpi) <= 100 else None, markersize=3)
+    ax.set_xlabel('Sample')
+    ax.set_ylabel('HMPI')
+    ax.set_title('HMPI by Sample')
+    return to_png(fig)
+
+def key_metals(data, params):
+    fig, ax = new_figure(params)
+    ratios, labels = data['ratios'], data['labels']
+    if not ratios:
+        ax.text(0.5, 0.5, 'No key metals (As, Cd, Cr) in this dataset', ha='center', va='center')
+        ax.set_axis_off()
+        return to_png(fig)
+
+    width = 0.8 / len(ratios)
+    x = np.arange(len(labels))
+    for i, (metal, ratio) in enumerate(ratios.items()):
+        ax.bar(x + i * width - 0.4 + width / 2, ratio, width, label=metal)
+    ax.axhline(1, color='#dc3545', linestyle='--', linewidth=1, label='Permissible limit')
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels, rotation=60, ha='right', fontsize=7)
+    ax.set_ylabel('Concentration / permissible limit')
+    ax.set_title(f"Key Metals at the {len(labels)} Most Polluted Sites")
+    ax.legend()
+    return to_png(fig)
+
+def metal_distributions(data, params):
+    fig, ax = new_figure(params)
+    metals = {name: values[np.isfinite(values) & (values > 0)] for name, values in data['metals'].items()}
+    metals = {name: values for name, values in metals.items() if len(values)}
+    if not metals:
+        ax.text(0.5, 0.5, 'No metal concentrations in this dataset', ha='center', va='center')
+        ax.set_axis_off()
+        return to_png(fig)
+
+    # Box statistics come from all values; only a sample of the outliers is drawn
+    rng = np.random.default_rng(0)
+    stats = []
+    for name, values in metals.items():
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        low_fence, high_fence = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+        inside = values[(values >= low_fence) & (values <= high_fence)]
+        fliers = values[(values < low_fence) | (values > high_fence)]
+        if len(fliers) > params['max_points']:
+            fliers = rng.choice(fliers, size=params['max_points'], replace=False)
+        stats.append({
+            'label': name, 'med': median, 'q1': q1, 'q3': q3,
+            'whislo': inside.min() if len(inside) else q1,
+            'whishi': inside.max() if len(inside) else q3,
+            'fliers': fliers,
+        })
+    ax.bxp(stats, flierprops={'markersize': 2})
+    ax.set_yscale('log')
+    ax.set_ylabel('Concentration (mg/L)')
+    ax.set_title('Metal Concentration Distributions')
+    return to_png(fig)
+
+def correlation_matrix(data, params):
+    fig, ax = new_figure(params, size=(9, 8))
+    frame = pd.DataFrame(data['metals'])
+    frame['HMPI'] = data['hmpi']
+    corr = frame.corr().to_numpy()
+
+    image = ax.imshow(corr, cmap='coolwarm', vmin=-1, vmax=1)
+    ax.set_xticks(np.arange(len(frame.columns)))
+    ax.set_yticks(np.arange(len(frame.columns)))
+    ax.set_xticklabels(frame.columns, rotation=45, ha='right')
+    ax.set_yticklabels(frame.columns)
+    if len(frame.columns) <= 12:
+        for (i, j), value in np.ndenumerate(corr):
+            if np.isfinite(value):
+                ax.text(j, i, f'{value:.2f}', ha='center', va='center', fontsize=7)
+    fig.colorbar(image, ax=ax)
+    ax.set_title('Correlation Matrix')
+    return to_png(fig)
+
+def pca_scatter(data, params):
+    fig, ax = new_figure(params)
+    names = list(data['metals'])
+    X = np.column_stack(list(data['metals'].values())) if names else np.empty((0, 0))
+    if X.shape[1] < 2 or X.shape[0] < 3:
+        ax.text(0.5, 0.5, 'PCA needs at least two metals and three samples', ha='center', va='center')
+        ax.set_axis_off()
+        return to_png(fig)
+
+    # Standardise each metal, treating missing values as the mean
+    mean, std = np.nanmean(X, axis=0), np.nanstd(X, axis=0)
+    X = np.nan_to_num((X - mean) / np.where(std > 0, std, 1))
+    # Eigen-decomposition of the (metals x metals) covariance, cheaper than an SVD of X
+    eigenvalues, eigenvectors = np.linalg.eigh(X.T @ X)
+    order = np.argsort(eigenvalues)[::-1]
+    eigenvalues, Vt = np.clip(eigenvalues[order], 0, None), eigenvectors[:, order].T
+    scores = X @ Vt[:2].T
+    explained = eigenvalues / max(eigenvalues.sum(), 1e-12)
+
+    rng = np.random.default_rng(0)
+    shown = rng.choice(len(scores), size=min(len(scores), params['max_points']), replace=False)
+    ax.scatter(scores[shown, 0], scores[shown, 1], c=np.array(POLLUTION_COLORS)[data['level_codes'][shown]], s=12, alpha=0.7)
+
+    # Metal loadings, scaled to the spread of the scores
+    scale = np.abs(scores).max() / max(np.abs(Vt[:2]).max(), 1e-9) * 0.8
+    for name, (dx, dy) in zip(names, Vt[:2].T * scale):
+        ax.arrow(0, 0, dx, dy, color='#333333', width=0.002 * scale, alpha=0.6)
+        ax.text(dx * 1.08, dy * 1.08, name, fontsize=8)
+
+    ax.set_xlabel(f'PC1 ({explained[0]:.1%} of variance)')
+    ax.set_ylabel(f'PC2 ({explained[1]:.1%} of variance)')
+    ax.set_title('PCA of Metal Concentrations')
+    return to_png(fig)
+
+def top_sites(data, params):
+    fig, ax = new_figure(params)
+    hmpi, labels, codes = data['hmpi'], data['labels'], data['level_codes']
+    ax.barh(np.arange(len(hmpi)), hmpi, color=np.array(POLLUTION_COLORS)[codes])
+    ax.set_yticks(np.arange(len(hmpi)))
+    ax.set_yticklabels(labels)
+    ax.invert_yaxis()
+    ax.set_xlabel('HMPI')
+    ax.set_title(f'Top {len(hmpi)} Most Polluted Sites')
+    return to_png(fig)
+
+# Chart name -> renderer
+CHARTS = {
+    'hmpi_histogram': hmpi_histogram,
+    'level_pie': level_pie,
+    'sample_line': sample_line,
+    'key_metals': key_metals,
+    'metal_distributions': metal_distributions,
+    'correlation_matrix': correlation_matrix,
+    'pca_scatter': pca_scatter,
+    'top_sites': top_sites,
+}
+
+def render_chart(name, data, params):
+    return CHARTS[name](data, params)
+
+class ChartRenderer:
+    """
+    Draws the report charts from the calculated DataFrame.
+
+    Only the arrays each chart needs are extracted and sent to a process
+    pool, so the charts are plotted concurrently. Every chart is cached in
+    the ArtifactCache under the dataset key, stage, chart name and params,
+    so a second report on the same data reuses the PNGs without plotting.
+    """
+
+    def __init__(self, artifacts=None, max_workers=None, dpi=110, bins=30, top_n=10, max_samples=30, max_points=5000):
+        self.artifacts = artifacts
+        self.max_workers = max_workers
+        self.params = {'dpi': dpi, 'bins': bins, 'top_n': top_n, 'max_samples': max_samples, 'max_points': max_points}
+        self.standards = HMPICalculation().standards
+
+    def chart_data(self, df):
+        """Returns the plain arrays each chart is drawn from, keyed by chart name."""
+        hmpi = pd.to_numeric(df['HMPI'], errors='coerce').to_numpy(dtype='float64')
+        level_codes = np.digitize(np.nan_to_num(hmpi, nan=np.inf), LEVEL_BOUNDS, right=True)
+        name_col = station_column(df.columns)
+        labels = df[name_col].astype(str).str.slice(0, 25).to_numpy() if name_col else (np.arange(len(df)) + 1).astype(str)
+        metal_cols = [col for col in df.columns if col.lower() in self.standards]
+        metals = {col: pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64') for col in metal_cols}
+
+        # Most polluted sites first, NaN last
+        ranked = np.argsort(-np.nan_to_num(hmpi, nan=-np.inf), kind='stable')
+        top = ranked[:self.params['top_n']]
+        worst = ranked[:self.params['max_samples']]
+        ratios = {
+            col: metals[col][worst] / self.standards[col.lower()]['S']
+            for col in metal_cols if col.lower() in KEY_METALS
+        }
+
+        return {
+            'hmpi_histogram': {'hmpi': hmpi},
+            'level_pie': {'level_counts': np.bincount(level_codes, minlength=len(POLLUTION_LEVELS)).tolist()},
+            'sample_line': {'hmpi': hmpi},
+            'key_metals': {'ratios': ratios, 'labels': labels[worst]},
+            'metal_distributions': {'metals': metals},
+            'correlation_matrix': {'metals': metals, 'hmpi': hmpi},
+            'pca_scatter': {'metals': metals, 'level_codes': level_codes},
+            'top_sites': {'hmpi': hmpi[top], 'labels': labels[top], 'level_codes': level_codes[top]},
+        }
+
+    def cache_key(self, key, stage, name):
+        return artifact_key('chart', key, stage, name, self.params)
+
+    def render(self, df, key=None, stage=None):
+        """
+        Returns {chart name: PNG bytes}. Charts that fail to render are left
+        out, so the report shows a placeholder for them. Without a
+        dataset key nothing is cached.
+        """
+        charts, missing = {}, []
+        for name in CHARTS:
+            cached = self.artifacts.get(self.cache_key(key, stage, name)) if self.artifacts and key else None
+            if cached is not None:
+                charts[name] = cached
+            else:
+                missing.append(name)
+        if not missing:
+            return charts
+
+        data = self.chart_data(df)
+        workers = min(len(missing), self.max_workers or os.cpu_count() or 1)
+        if workers <= 1:
+            # A pool only pays for its start-up cost with more than one chart and core
+            results = {name: self.safe_render(name, data[name]) for name in missing}
+        else:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+                futures = {name: pool.submit(render_chart, name, data[name], self.params) for name in missing}
+                results = {}
+                for name, future in futures.items():
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        print(f"Error rendering chart '{name}': {e}")
+                        results[name] = None
+
+        for name, png in results.items():
+            if png is None:
+                continue
+            charts[name] = png
+            if self.artifacts and key:
+                self.artifacts.put(self.cache_key(key, stage, name), png)
+        return charts
+
+    def safe_render(self, name, data):
+        try:
+            return render_chart(name, data, self.params)
+        except Exception as e:
+            print(f"Error rendering chart '{name}': {e}")
+            return None
@@ -1,24 +1,43 @@
 # backend/features/report_generation.py
 
 from fpdf import FPDF
+from pypdf import PdfReader, PdfWriter
+import numpy as np
 import pandas as pd
+import hashlib
+import io
 import os
 from datetime import datetime
 
+from backend.features.caching import artifact_key
+from backend.features.hmpi_calculation import HMPICalculation
+
 class PDF(FPDF):
     """
     Custom PDF class to handle headers, footers, and standardized styling.
     """
+    # Report sections are rendered without the logo and page numbers, which
+    # are stamped on from a single PageOverlay once the report is assembled
+    decorations = True
+
     def header(self):
         self.set_font('Arial', 'B', 12)
+        if self.decorations:
+            self.add_logo()
+        self.cell(0, 10, 'JalSuchak - Heavy Metal Analysis Report', 0, 1, 'C')
+        self.ln(5)
+
+    def footer(self):
+        if self.decorations:
+            self.add_page_number()
+
+    def add_logo(self):
         # Add Logo if it exists
         logo_path = os.path.join(self.static_folder, 'images/small_app_logo.png')
         if os.path.exists(logo_path):
             self.image(logo_path, 10, 8, 10)
-        self.cell(0, 10, 'JalSuchak - Heavy Metal Analysis Report', 0, 1, 'C')
-        self.ln(5)
 
-    def footer(self):
+    def add_page_number(self):
         self.set_y(-15)
         self.set_font('Arial', 'I', 8)
         self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
@@ -34,6 +53,25 @@ class PDF(FPDF):
         self.multi_cell(0, 7, body)
         self.ln()
         
+    def format_column(self, series, max_chars=40):
+        """
+        Formats a whole column as display strings in one go: floats to two
+        decimals, missing values as '-', and other values cut to max_chars
+        with '...'. Numbers are never cut, as a cut number would be misleading.
+        Characters the core PDF fonts cannot encode are replaced with '?'.
+        """
+        if pd.api.types.is_float_dtype(series):
+            values = series.to_numpy(dtype='float64')
+            # tolist() gives plain str; numpy string scalars are much slower for fpdf to handle
+            text = pd.Series(np.char.mod('%.2f', values).tolist(), index=series.index).where(~np.isnan(values), '-')
+        else:
+            text = series.astype(str).where(series.notna(), '-')
+            text = text.str.encode('latin-1', 'replace').str.decode('latin-1')
+            too_long = text.str.len() > max_chars
+            if too_long.any():
+                text = text.where(~too_long, text.str.slice(0, max(max_chars - 3, 1)) + '...')
+        return text.to_numpy(dtype=object)
+
     def add_table(self, df, columns, col_widths):
         self.set_font('Arial', 'B', 9)
         # Header
@@ -43,18 +81,77 @@ class PDF(FPDF):
 
         # Data
         self.set_font('Arial', '', 8)
-        for _, row in df.iterrows():
-            for i, key in enumerate(columns.keys()):
-                value = row.get(key, 'N/A')
-                if isinstance(value, float):
-                    value = f"{value:.2f}"
-                # Truncate long names to prevent cell overflow
-                if len(str(value)) > 40:
-                    value = str(value)[:37] + "..."
-                self.cell(col_widths[i], 10, str(value), 1)
+        formatted = [self.format_column(df[key]) if key in df.columns else ['N/A'] * len(df) for key in columns]
+        for row in zip(*formatted):
+            for i, value in enumerate(row):
+                self.cell(col_widths[i], 10, value, 1)
             self.ln()
         self.ln(8)
 
+    def add_data_table(self, df, columns, col_widths, numbered=False, chunksize=5000, font_size=6, row_height=4):
+        """
+        Writes every row of `df` as a table that continues over as many pages
+        as it needs, repeating the header on each page.
+
+        Rows are formatted `chunksize` at a time, column by column, so only
+        one chunk of strings exists at once. Values are drawn with text()
+        and the grid with one line per row plus the column rules per page,
+        which is much cheaper than a cell() per value on large tables.
+        With `numbered`, a leading '#' column counts the rows from 1.
+        """
+        if numbered:
+            columns = {'#': '#', **columns}
+            col_widths = [10] + list(col_widths)
+        widths = np.asarray(col_widths, dtype='float64')
+        # Plain floats: fpdf formats every coordinate, and numpy scalars are slow to format
+        edges = (self.l_margin + np.r_[0, np.cumsum(widths)]).tolist()
+        pad = 1
+
+        self.set_font('Arial', '', font_size)
+        char_width = self.get_string_width('0')
+        max_chars = [max(int((w - 2 * pad) / char_width), 4) for w in widths]
+        # Centre the cap height (about 0.7 em, in mm) in the row
+        baseline = row_height * 0.5 + font_size * 0.3528 * 0.35
+
+        def start_page(new_page):
+            if new_page:
+                self.add_page(same=True)
+            self.set_font('Arial', 'B', font_size)
+            top = self.get_y()
+            self.set_fill_color(220, 230, 240)
+            self.rect(edges[0], top, edges[-1] - edges[0], row_height, style='DF')
+            for x, header in zip(edges, columns.values()):
+                self.text(x + pad, top + baseline, header)
+            self.set_font('Arial', '', font_size)
+            return top
+
+        def close_page(top, bottom):
+            for x in edges:
+                self.line(x, top, x, bottom)
+
+        top = start_page(self.get_y() + 2 * row_height > self.page_break_trigger)
+        y = top + row_height
+        for start in range(0, len(df), chunksize):
+            chunk = df.iloc[start:start + chunksize]
+            formatted = [
+                self.format_column(chunk[key], chars) if key in chunk.columns else np.full(len(chunk), 'N/A', dtype=object)
+                for key, chars in zip(columns, max_chars)
+            ]
+            if numbered:
+                formatted[0] = [str(i) for i in range(start + 1, start + len(chunk) + 1)]
+            for row in zip(*formatted):
+                if y + row_height > self.page_break_trigger:
+                    close_page(top, y)
+                    top = start_page(True)
+                    y = top + row_height
+                for x, value in zip(edges, row):
+                    self.text(x + pad, y + baseline, value)
+                y += row_height
+                self.line(edges[0], y, edges[-1], y)
+        close_page(top, y)
+        self.set_y(y)
+        self.ln(8)
+
     def add_summary_stats(self, df, station_col):
         self.set_font('Arial', 'B', 12)
         self.cell(0, 7, "Key Findings at a Glance:", 0, 1)
@@ -73,44 +170,149 @@ class PDF(FPDF):
         self.cell(0, 7, "Site Classification Breakdown:", 0, 1)
         self.set_font('Arial', '', 11)
         pollution_counts = df[pollution_col].value_counts()
+        # Categorical levels also count the levels no site has
+        pollution_counts = pollution_counts[pollution_counts > 0]
         for level, count in pollution_counts.items():
             self.cell(0, 7, f"- {level}: {count} sites ({count/len(df)*100:.1f}%)", 0, 1)
         self.ln(5)
         
-    def add_graph(self, graph_name, title, description):
-        self.add_page()
-        self.chapter_title(title)
-        self.chapter_body(description)
-        graph_path = os.path.join(self.static_folder, f'images/graphs/{graph_name}')
-        if os.path.exists(graph_path):
-            self.image(graph_path, x=self.get_x() + 10, w=self.w - self.l_margin - self.r_margin - 20)
-        else:
-            self.set_font('Arial', 'I', 10)
-            self.cell(0, 10, f"[Chart image '{graph_name}' not found]", 0, 1)
-        self.ln(5)
+class PageOverlay(PDF):
+    """
+    Blank pages carrying only the logo and page number. Stamped over the
+    assembled report, so the logo is embedded once for the whole document.
+    """
+    def header(self):
+        self.add_logo()
+
+    def footer(self):
+        self.add_page_number()
+
+# Charts on the insight pages, in page order, with their title and description
+INSIGHTS = [
+    ('hmpi_histogram', 'Insight 1: HMPI Distribution', "This histogram reveals the frequency of different HMPI scores. A skew towards higher values indicates widespread pollution."),
+    ('level_pie', 'Insight 2: Overall Water Quality', "This pie chart provides a clear, at-a-glance breakdown of the percentage of sites falling into each pollution category."),
+    ('sample_line', 'Insight 3: HMPI Values by Sample', "This line chart displays the unique pollution signature of each sample, making it easy to spot anomalies and high-risk sites."),
+    ('key_metals', 'Insight 4: Key Heavy Metal Concentrations', "This chart compares the levels of key toxic metals (As, Cd, Cr) across samples, highlighting which sites exceed safe limits."),
+    ('metal_distributions', 'Insight 5: Metal Concentration Distributions', "These plots show the statistical distribution for individual heavy metals, helping to identify which metals have the most extreme outliers."),
+    ('correlation_matrix', 'Insight 6: Correlation Matrix', "This heatmap shows which metals are most strongly correlated with a high HMPI. A strong correlation (brighter color) points to a primary driver of pollution."),
+    ('pca_scatter', 'Insight 7: PCA Analysis', "Principal Component Analysis (PCA) simplifies complex data, showing the combined variance and relationships between different heavy metals."),
+]
 
 class ReportGenerator:
-    def generate_report(self, df, report_data, static_folder_path):
+    """
+    Builds the PDF report from independent sections (cover, high-risk sites,
+    map, insights, contaminants, appendix). Each section is rendered on its
+    own as a small PDF without page numbers. With an ArtifactCache, the
+    section is cached under the dataset key, stage and only the inputs that
+    section uses. Changing the title re-renders the cover page and reuses
+    every other section. The sections are then joined with pypdf and page
+    numbers and logo are stamped on at the end, so a section's cached pages
+    stay valid when an earlier section is added or removed.
+    """
+
+    def __init__(self, artifacts=None):
+        self.artifacts = artifacts
+
+    def generate_report(self, df, report_data, static_folder_path, charts=None, key=None, stage=None):
+        """
+        Builds the PDF report. `charts` maps chart names (see report_charts.CHARTS)
+        to PNG bytes drawn from this dataset; missing charts are drawn as a
+        "[chart unavailable]" placeholder. Sections are only cached when the
+        dataset key and stage are given.
+        """
+        charts = charts or {}
+        fragments = []
+        for name, inputs in self.plan(report_data, static_folder_path, charts):
+            cache_key = artifact_key('report-section', key, stage, name, inputs, static_folder_path) if self.artifacts and key else None
+            fragment = self.artifacts.get(cache_key) if cache_key else None
+            if fragment is None:
+                fragment = self.render_section(name, df, inputs, charts, static_folder_path)
+                if cache_key:
+                    self.artifacts.put(cache_key, fragment)
+            fragments.append(fragment)
+        return self.assemble(fragments, static_folder_path)
+
+    def plan(self, report_data, static_folder_path, charts):
+        """
+        Returns [(section name, inputs)] for the sections in this report, in
+        order. `inputs` holds everything the section depends on apart from
+        the dataset, and is part of its cache key.
+        """
+        sections = report_data.get('sections', {})
+
+        def chart_digests(names):
+            return {name: hashlib.sha256(charts[name]).hexdigest() if name in charts else None for name in names}
+
+        plan = [
+            ('cover', {
+                'title': report_data.get('title', 'Analysis Report'),
+                'date': report_data.get('date') or datetime.now().strftime('%Y-%m-%d'),
+                'org': report_data.get('org', 'N/A'),
+                'author': report_data.get('author', 'N/A'),
+                'exec': bool(sections.get('exec')),
+                'quality': bool(sections.get('quality')),
+            }),
+            ('high_risk', {'charts': chart_digests(['top_sites'])}),
+        ]
+        if report_data.get('include_maps'):
+            map_image_path = os.path.join(static_folder_path, 'images/map_screenshot.png')
+            plan.append(('map', {'screenshot': os.path.getmtime(map_image_path) if os.path.exists(map_image_path) else None}))
+        plan.append(('insights', {'charts': chart_digests([chart for chart, _, _ in INSIGHTS])}))
+        plan.append(('contaminants', {'recommendations': bool(report_data.get('recommendations'))}))
+        if sections.get('appendix'):
+            plan.append(('appendix', {}))
+        return plan
+
+    def render_section(self, name, df, inputs, charts, static_folder_path):
+        """Renders one section into a PDF of its own, without page numbers."""
         pdf = PDF()
         pdf.static_folder = static_folder_path
-        
+        pdf.decorations = False
+        getattr(self, f'section_{name}')(pdf, df, inputs, charts)
+        return bytes(pdf.output())
+
+    def assemble(self, fragments, static_folder_path):
+        """Joins the section PDFs and stamps the logo and page number on every page."""
+        writer = PdfWriter()
+        for fragment in fragments:
+            writer.append(PdfReader(io.BytesIO(fragment)))
+
+        overlay = PageOverlay()
+        overlay.static_folder = static_folder_path
+        overlay.set_auto_page_break(False)
+        for page in writer.pages:
+            overlay.add_page(orientation='L' if page.mediabox.width > page.mediabox.height else 'P')
+        for page, decorations in zip(writer.pages, PdfReader(io.BytesIO(bytes(overlay.output()))).pages):
+            page.merge_page(decorations)
+            # merge_page leaves the page content uncompressed
+            page.compress_content_streams()
+
+        output = io.BytesIO()
+        writer.write(output)
+        return output.getvalue()
+
+    def columns(self, df):
         # --- Robust Column Name Detection ---
         station_col = 'Station Name' if 'Station Name' in df.columns else 'sample_id'
         pollution_col = 'Pollution Level' if 'Pollution Level' in df.columns else 'poll_level'
-        
-        # --- Page 1: Title and Summary ---
+        return station_col, pollution_col
+
+    # --- Sections ---
+
+    def section_cover(self, pdf, df, inputs, charts):
+        """Page 1: title, summary and quality breakdown."""
+        station_col, pollution_col = self.columns(df)
         pdf.add_page()
         pdf.set_font('Arial', 'B', 28)
-        pdf.cell(0, 30, report_data.get('title', 'Analysis Report'), 0, 1, 'C')
+        pdf.cell(0, 30, inputs['title'], 0, 1, 'C')
         pdf.ln(15)
         pdf.set_font('Arial', '', 12)
-        report_date = report_data.get('date') or datetime.now().strftime('%Y-%m-%d')
-        pdf.cell(0, 10, f"Date: {report_date}", 0, 1, 'C')
-        pdf.cell(0, 10, f"Organization: {report_data.get('org', 'N/A')}", 0, 1, 'C')
-        pdf.cell(0, 10, f"Author: {report_data.get('author', 'N/A')}", 0, 1, 'C')
+        pdf.cell(0, 10, f"Date: {inputs['date']}", 0, 1, 'C')
+        pdf.cell(0, 10, f"Organization: {inputs['org']}", 0, 1, 'C')
+        pdf.cell(0, 10, f"Author: {inputs['author']}", 0, 1, 'C')
         pdf.ln(25)
 
-        if report_data.get('sections', {}).get('exec'):
+        if inputs['exec']:
             pdf.chapter_title('1. Executive Summary')
             summary_text = (
                 f"This report details the analysis of {len(df)} groundwater samples to assess heavy metal contamination. "
@@ -120,43 +322,41 @@ class ReportGenerator:
             pdf.chapter_body(summary_text)
             pdf.add_summary_stats(df, station_col)
 
-        if report_data.get('sections', {}).get('quality'):
+        if inputs['quality']:
             pdf.chapter_title('2. Water Quality Assessment')
             pdf.add_pollution_breakdown(df, pollution_col)
 
-        # --- Page 2: High-Risk Areas (Using Graph) ---
+    def section_high_risk(self, pdf, df, inputs, charts):
+        """High-risk areas, with the top sites chart."""
         pdf.add_page()
         pdf.chapter_title('3. High-Risk Locations')
         pdf.chapter_body(
             "The bar chart below visualizes the HMPI scores of the ten most polluted sites, making it easy to identify the locations with the most critical contamination levels. "
             "These sites should be prioritized for further action."
         )
-        pdf.add_graph('graph_8.png', '', '')
+        self.add_graph(pdf, 'top_sites', '', '', charts)
 
-        # --- Page 3: Geospatial Overview ---
-        if report_data.get('include_maps'):
-            pdf.add_page()
-            pdf.chapter_title('4. Geospatial Hotspot Overview')
-            pdf.chapter_body(
-                "The image below is a static snapshot of the geospatial analysis, highlighting pollution hotspots. "
-                "For an interactive experience, please use the map feature in the web application."
-            )
-            map_image_path = os.path.join(pdf.static_folder, 'images/map_screenshot.png')
-            if os.path.exists(map_image_path):
-                 pdf.image(map_image_path, x=pdf.get_x() + 10, w=pdf.w - pdf.l_margin - pdf.r_margin - 20)
-            else:
-                 pdf.cell(0, 10, "[Map screenshot not available. Please add a 'map_screenshot.png' to the images folder.]", 0, 1)
-
-        # --- Subsequent Pages: All Graphical Insights ---
-        self.add_graph(pdf, 'graph_1.png', 'Insight 1: HMPI Distribution', "This histogram reveals the frequency of different HMPI scores. A skew towards higher values indicates widespread pollution.")
-        self.add_graph(pdf, 'graph_2.png', 'Insight 2: Overall Water Quality', "This pie chart provides a clear, at-a-glance breakdown of the percentage of sites falling into each pollution category.")
-        self.add_graph(pdf, 'graph_3.png', 'Insight 3: HMPI Values by Sample', "This line chart displays the unique pollution signature of each sample, making it easy to spot anomalies and high-risk sites.")
-        self.add_graph(pdf, 'graph_4.png', 'Insight 4: Key Heavy Metal Concentrations', "This chart compares the levels of key toxic metals (As, Cd, Cr) across samples, highlighting which sites exceed safe limits.")
-        self.add_graph(pdf, 'graph_5.png', 'Insight 5: Metal Concentration Distributions', "These plots show the statistical distribution for individual heavy metals, helping to identify which metals have the most extreme outliers.")
-        self.add_graph(pdf, 'graph_6.png', 'Insight 6: Correlation Matrix', "This heatmap shows which metals are most strongly correlated with a high HMPI. A strong correlation (brighter color) points to a primary driver of pollution.")
-        self.add_graph(pdf, 'graph_7.png', 'Insight 7: PCA Analysis', "Principal Component Analysis (PCA) simplifies complex data, showing the combined variance and relationships between different heavy metals.")
-        
-        # --- Final Page: Contaminant Analysis & Recommendations ---
+    def section_map(self, pdf, df, inputs, charts):
+        """Geospatial overview from the static map screenshot."""
+        pdf.add_page()
+        pdf.chapter_title('4. Geospatial Hotspot Overview')
+        pdf.chapter_body(
+            "The image below is a static snapshot of the geospatial analysis, highlighting pollution hotspots. "
+            "For an interactive experience, please use the map feature in the web application."
+        )
+        map_image_path = os.path.join(pdf.static_folder, 'images/map_screenshot.png')
+        if os.path.exists(map_image_path):
+             pdf.image(map_image_path, x=pdf.get_x() + 10, w=pdf.w - pdf.l_margin - pdf.r_margin - 20)
+        else:
+             pdf.cell(0, 10, "[Map screenshot not available. Please add a 'map_screenshot.png' to the images folder.]", 0, 1)
+
+    def section_insights(self, pdf, df, inputs, charts):
+        """One page per chart."""
+        for chart, title, description in INSIGHTS:
+            self.add_graph(pdf, chart, title, description, charts)
+
+    def section_contaminants(self, pdf, df, inputs, charts):
+        """Final page: primary contaminants and recommendations."""
         pdf.add_page()
         pdf.chapter_title('8. Primary Contaminant Analysis')
         pdf.chapter_body("The table below identifies the top 5 heavy metals that, on average, contribute most significantly to the pollution index across all samples.")
@@ -171,7 +371,7 @@ class ReportGenerator:
             metal_widths = [80, 80]
             pdf.add_table(metal_df, metal_cols, metal_widths)
 
-        if report_data.get('recommendations'):
+        if inputs['recommendations']:
             pdf.chapter_title('9. Recommendations')
             recs_text = (
                 "1.  **Immediate Investigation:** Sites classified as 'Extremely Poor' or 'Very Poor' require immediate follow-up sampling and public health advisories.\n\n"
@@ -180,17 +380,39 @@ class ReportGenerator:
                 "4.  **Long-Term Monitoring:** Establish a regular monitoring program to track pollution trends and assess interventions."
             )
             pdf.chapter_body(recs_text)
-        
-        return bytes(pdf.output())
+
+    def section_appendix(self, pdf, df, inputs, charts):
+        station_col, pollution_col = self.columns(df)
+        self.add_appendix(pdf, df, station_col, pollution_col)
+
+    def add_appendix(self, pdf, df, station_col, pollution_col):
+        """Lists every sample with its metal concentrations, HMPI and pollution level, on landscape pages."""
+        pdf.add_page(orientation='L')
+        pdf.chapter_title('Appendix: Results by Sample')
+        pdf.chapter_body(f"All {len(df)} samples with their measured metal concentrations (mg/L), HMPI and pollution level.")
+
+        metals = [col for col in df.columns if col.lower() in HMPICalculation().standards]
+        columns = {}
+        if station_col in df.columns:
+            columns[station_col] = 'Station'
+        columns.update({metal: metal for metal in metals})
+        columns.update({'HMPI': 'HMPI', pollution_col: 'Level'})
+
+        fixed = {station_col: 40, 'HMPI': 14, pollution_col: 22}
+        free = pdf.w - pdf.l_margin - pdf.r_margin - 10 - sum(fixed[col] for col in columns if col in fixed)
+        metal_width = free / max(len(metals), 1)
+        widths = [fixed.get(col, metal_width) for col in columns]
+
+        pdf.add_data_table(df, columns, widths, numbered=True)
     
-    def add_graph(self, pdf, graph_name, title, description):
+    def add_graph(self, pdf, chart, title, description, charts):
         pdf.add_page()
         pdf.chapter_title(title)
         pdf.chapter_body(description)
-        graph_path = os.path.join(pdf.static_folder, f'images/graphs/{graph_name}')
-        if os.path.exists(graph_path):
-            pdf.image(graph_path, x=pdf.get_x() + 10, w=pdf.w - pdf.l_margin - pdf.r_margin - 20)
+        if chart in charts:
+            pdf.image(io.BytesIO(charts[chart]), x=pdf.get_x() + 10, w=pdf.w - pdf.l_margin - pdf.r_margin - 20)
         else:
+            # Never stand in another dataset's picture for a chart that failed
             pdf.set_font('Arial', 'I', 10)
-            pdf.cell(0, 10, f"[Chart image '{graph_name}' not found]", 0, 1)
+            pdf.cell(0, 10, "[chart unavailable]", 0, 1)
         pdf.ln(5)
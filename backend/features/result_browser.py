@@ -0,0 +1,209 @@
+# backend/features/result_browser.py
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from backend.features.compact import memory_bytes, widen
+from backend.features.hmpi_calculation import POLLUTION_LEVELS
+from backend.features.spatial_index import station_column
+
+ORDERS = ['asc', 'desc']
+
+class ResultIndex:
+    """
+    Pages through one calculated dataset, sorted by any column and filtered
+    by pollution level, HMPI range and station name.
+
+    Each column's sort order is computed on its first use and kept, so the
+    dataset is only sorted once per column. Without filters, a page is a
+    slice of that order. With filters, the matching rows in sorted order are
+    worked out once per query and kept for the next pages. Either way, later
+    pages cost O(page size).
+
+    Levels are kept as integer codes, HMPI as a float array, and each
+    distinct station name once in lower case, so filters never go through
+    the full DataFrame. The kept orders and queries are shared by the
+    server's request threads, behind a lock.
+    """
+
+    def __init__(self, df, max_queries=32):
+        self.df = df
+        self.max_queries = max_queries
+        self._orders = {}
+        self._queries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hmpi = pd.to_numeric(df['HMPI'], errors='coerce').to_numpy(dtype='float64') if 'HMPI' in df.columns else None
+        self.levels = None
+        if 'Pollution Level' in df.columns:
+            self.levels = pd.Categorical(df['Pollution Level'], categories=POLLUTION_LEVELS).codes
+        self.name_col = station_column(df.columns)
+        self.names = self.name_inverse = None
+        if self.name_col:
+            codes, uniques = pd.factorize(df[self.name_col].astype(str).str.lower())
+            self.names, self.name_inverse = pd.Index(uniques), codes
+        # Measured once; only the sort orders and queries grow afterwards
+        self.fixed_bytes = memory_bytes(df) + (self.names.memory_usage(deep=True) if self.names is not None else 0)
+
+    def __len__(self):
+        return len(self.df)
+
+    def memory_bytes(self):
+        """Bytes held by the index, the frame it pages through included."""
+        arrays = [self.hmpi, self.levels, self.name_inverse]
+        with self.lock:
+            arrays += [array for order in self._orders.values() for array in order]
+            arrays += [rows for rows in self._queries.values() if rows is not None]
+        return self.fixed_bytes + sum(array.nbytes for array in arrays if array is not None)
+
+    def order(self, column):
+        """
+        Returns (rows with a value in ascending order, rows without a value)
+        for a column. Text sorts case-insensitively, ordered categoricals by
+        their order.
+        """
+        if column not in self._orders:
+            values = self.df[column]
+            missing = values.isna().to_numpy()
+            if isinstance(values.dtype, pd.CategoricalDtype) and values.cat.ordered:
+                # e.g. Pollution Level, Perfect to Extremely Poor rather than alphabetically
+                keys = values.cat.codes.to_numpy()
+            elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+                keys = values.to_numpy()
+            else:
+                keys = values.astype(str).str.lower().to_numpy()
+            present = np.flatnonzero(~missing)
+            sorted_present = present[np.argsort(keys[present], kind='stable')]
+            with self.lock:
+                self._orders.setdefault(column, (sorted_present, np.flatnonzero(missing)))
+        return self._orders[column]
+
+    def sorted_rows(self, column, order):
+        """Row positions in sort order; rows without a value always come last."""
+        present, missing = self.order(column)
+        return np.concatenate([present if order == 'asc' else present[::-1], missing])
+
+    def mask(self, levels=None, min_hmpi=None, max_hmpi=None, search=None):
+        """Boolean mask of the rows matching every filter, or None without filters."""
+        mask = None
+
+        def combine(current, new):
+            return new if current is None else current & new
+
+        if levels:
+            if self.levels is None:
+                raise ValueError("This dataset has no Pollution Level column")
+            unknown = [level for level in levels if level not in POLLUTION_LEVELS]
+            if unknown:
+                raise ValueError(f"Unknown pollution level '{unknown[0]}'. Available: {', '.join(POLLUTION_LEVELS)}")
+            mask = combine(mask, np.isin(self.levels, [POLLUTION_LEVELS.index(level) for level in levels]))
+        if min_hmpi is not None or max_hmpi is not None:
+            if self.hmpi is None:
+                raise ValueError("This dataset has no HMPI column")
+            with np.errstate(invalid='ignore'):
+                if min_hmpi is not None:
+                    mask = combine(mask, self.hmpi >= min_hmpi)
+                if max_hmpi is not None:
+                    mask = combine(mask, self.hmpi <= max_hmpi)
+        if search:
+            if self.names is None:
+                raise ValueError("This dataset has no station name column")
+            # Match the distinct names, then map back to rows
+            matches = self.names.str.contains(search.lower(), regex=False)
+            mask = combine(mask, np.asarray(matches)[self.name_inverse])
+        return mask
+
+    def query(self, sort, order, filters):
+        """
+        Returns the row positions matching `filters` in sort order (original
+        order without `sort`), reusing recent queries. None without filters.
+        """
+        if sort is not None and sort not in self.df.columns:
+            raise ValueError(f"Unknown column '{sort}'")
+        if order not in ORDERS:
+            raise ValueError("order must be asc or desc")
+
+        query_key = (sort, order, tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in filters.items())))
+        with self.lock:
+            if query_key in self._queries:
+                self._queries.move_to_end(query_key)
+                return self._queries[query_key]
+
+        mask = self.mask(**filters)
+        if mask is None:
+            # Pages are sliced straight from the column order
+            rows = None
+        elif sort is None:
+            rows = np.flatnonzero(mask)
+        else:
+            rows = self.sorted_rows(sort, order)
+            rows = rows[mask[rows]]
+        with self.lock:
+            self._queries[query_key] = rows
+            if len(self._queries) > self.max_queries:
+                self._queries.popitem(last=False)
+        return rows
+
+    def page_rows(self, sort, order, start, stop):
+        """Row positions start:stop of the unfiltered dataset in sort order, without building the full order."""
+        present, missing = self.order(sort)
+        if order == 'desc':
+            present = present[::-1]
+        head = present[start:stop]
+        if len(head) == stop - start:
+            return head
+        tail = missing[max(start - len(present), 0):stop - len(present)]
+        return np.concatenate([head, tail])
+
+    def page(self, page=1, page_size=50, sort=None, order='asc', **filters):
+        """
+        Returns one page as a JSON-friendly dict: the rows, their positions in
+        the dataset, and the total row count and number of pages of the query.
+        Without `sort`, rows keep their original order.
+        """
+        filters = {name: value for name, value in filters.items() if value not in (None, '', [])}
+        start = (page - 1) * page_size
+        stop = start + page_size
+
+        matching = self.query(sort, order, filters)
+        if matching is not None:
+            total = len(matching)
+            rows = matching[start:stop]
+        else:
+            total = len(self)
+            rows = np.arange(start, min(stop, total)) if sort is None else self.page_rows(sort, order, start, stop)
+
+        return {
+            'page': page,
+            'page_size': page_size,
+            'pages': max(-(-total // page_size), 1),
+            'total': total,
+            'sort': sort,
+            'order': order,
+            'columns': list(self.df.columns),
+            'row_numbers': [int(row) for row in rows],
+            'rows': records(self.df.iloc[rows]),
+        }
+
+def records(df):
+    """Turns rows into JSON-friendly dicts: dates as 'YYYY-MM-DD' and missing values as None."""
+    df = widen(df).copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d')
+    return df.astype(object).where(df.notna(), None).to_dict(orient='records')
+
+class ResultBrowserCache:
+    """
+    Gives the ResultIndex of a calculated dataset. Indexes are kept by the
+    DatasetCache next to the frames, under its memory budget.
+    """
+
+    def __init__(self, dataset_cache):
+        self.dataset_cache = dataset_cache
+
+    def get(self, key, stage):
+        return self.dataset_cache.derived(key, stage, 'result-index', ResultIndex)
@@ -0,0 +1,143 @@
+# backend/features/spatial_index.py
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# Mean Earth radius
+EARTH_RADIUS_KM = 6371.0088
+
+# Lower-cased column names that can hold the station name, in order of preference
+STATION_COLUMNS = ['station name', 'station', 'sample_id', 'sample id', 'location']
+
+def unit_vectors(lat, lon):
+    """Converts latitude/longitude in degrees to 3D points on the unit sphere."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km, broadcasting over arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def km_to_chord(km):
+    """Straight-line distance through the unit sphere for a great-circle distance."""
+    return 2 * np.sin(np.minimum(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+def station_column(columns):
+    """Returns the column holding station names, or None."""
+    by_lower = {col.lower(): col for col in columns}
+    for name in STATION_COLUMNS:
+        if name in by_lower:
+            return by_lower[name]
+    return None
+
+class StationIndex:
+    """
+    Nearest-station and radius queries over a calculated dataset.
+
+    Stations are stored as points on the unit sphere in a KD-tree. The
+    straight-line (chord) distance between two such points grows with their
+    great-circle distance, so the tree's Euclidean nearest neighbours are
+    the haversine nearest neighbours, with no distortion near the poles or
+    the antimeridian. Reported distances are exact haversine kilometres.
+    """
+
+    def __init__(self, df):
+        lat = pd.to_numeric(df['Latitude'], errors='coerce').to_numpy(dtype='float64')
+        lon = pd.to_numeric(df['Longitude'], errors='coerce').to_numpy(dtype='float64')
+        valid = np.isfinite(lat) & np.isfinite(lon)
+
+        self.rows = np.flatnonzero(valid)
+        self.lat = lat[valid]
+        self.lon = lon[valid]
+        self.hmpi = pd.to_numeric(df['HMPI'], errors='coerce').to_numpy(dtype='float64')[valid]
+
+        name_col = station_column(df.columns)
+        self.names = df[name_col].astype(str).to_numpy()[valid] if name_col else None
+        self.levels = df['Pollution Level'].astype(str).to_numpy()[valid] if 'Pollution Level' in df.columns else None
+
+        self.tree = cKDTree(unit_vectors(self.lat, self.lon))
+
+    def __len__(self):
+        return len(self.lat)
+
+    def records(self, idx, distances):
+        """Turns matched positions and their distances into JSON-friendly dicts."""
+        return [
+            {
+                'row': int(self.rows[i]),
+                'station': self.names[i] if self.names is not None else None,
+                'latitude': float(self.lat[i]),
+                'longitude': float(self.lon[i]),
+                'hmpi': float(self.hmpi[i]),
+                'pollution_level': self.levels[i] if self.levels is not None else None,
+                'distance_km': float(d),
+            }
+            for i, d in zip(idx, distances)
+        ]
+
+    def nearest(self, lat, lon, k=5, min_hmpi=None):
+        """
+        Returns the k stations closest to (lat, lon), nearest first.
+        With min_hmpi, only stations with HMPI >= min_hmpi count, and the
+        search widens until k of them are found.
+        """
+        if len(self) == 0:
+            return []
+        point = unit_vectors(np.array([lat]), np.array([lon]))[0]
+
+        want = min(k, len(self))
+        while True:
+            _, idx = self.tree.query(point, k=want)
+            idx = np.atleast_1d(idx)
+            if min_hmpi is not None:
+                idx = idx[self.hmpi[idx] >= min_hmpi]
+            if len(idx) >= k or want == len(self):
+                break
+            want = min(want * 4, len(self))
+
+        idx = idx[:k]
+        return self.records(idx, haversine_km(lat, lon, self.lat[idx], self.lon[idx]))
+
+    def within(self, lat, lon, radius_km, min_hmpi=None):
+        """Returns the stations within radius_km of (lat, lon), nearest first."""
+        if len(self) == 0:
+            return []
+        point = unit_vectors(np.array([lat]), np.array([lon]))[0]
+
+        idx = np.asarray(self.tree.query_ball_point(point, km_to_chord(radius_km)), dtype=np.intp)
+        if min_hmpi is not None:
+            idx = idx[self.hmpi[idx] >= min_hmpi]
+
+        distances = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        order = np.argsort(distances, kind='stable')
+        return self.records(idx[order], distances[order])
+
+class StationIndexCache:
+    """Builds one StationIndex per calculated dataset and keeps the most recently used ones."""
+
+    def __init__(self, dataset_cache, max_datasets=8):
+        self.dataset_cache = dataset_cache
+        self.max_datasets = max_datasets
+        self._indexes = OrderedDict()
+
+    def get(self, key, stage):
+        cache_key = (key, stage)
+        if cache_key in self._indexes:
+            self._indexes.move_to_end(cache_key)
+            return self._indexes[cache_key]
+
+        columns = self.dataset_cache.columns(key, stage)
+        wanted = ['Latitude', 'Longitude', 'HMPI', 'Pollution Level', station_column(columns)]
+        df = self.dataset_cache.get(key, stage, columns=[col for col in wanted if col in columns])
+
+        index = StationIndex(df)
+        self._indexes[cache_key] = index
+        if len(self._indexes) > self.max_datasets:
+            self._indexes.popitem(last=False)
+        return index
@@ -0,0 +1,314 @@
+# backend/features/time_series.py
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: a lock file with a timeout instead, see TimeSeriesStore.file_lock
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from backend.features.hmpi_calculation import LEVEL_BOUNDS, POLLUTION_COLORS, POLLUTION_LEVELS
+from backend.features.report_charts import new_figure, to_png
+from backend.features.spatial_index import station_column
+
+# Rollup periods and the pandas period each one groups by
+PERIODS = {'daily': 'D', 'monthly': 'M', 'yearly': 'Y'}
+
+# Lower-cased column names that can hold the region of a station, in order of preference
+REGION_COLUMNS = ['region', 'district', 'state', 'basin', 'block']
+
+# Rollups are kept for each station, each region and for all samples together
+SCOPES = ['station', 'region', 'all']
+
+LEVEL_COUNTS = [f'level_{i}' for i in range(len(POLLUTION_LEVELS))]
+
+def region_column(columns):
+    """Returns the column holding region names, or None."""
+    by_lower = {str(col).lower(): col for col in columns}
+    for name in REGION_COLUMNS:
+        if name in by_lower:
+            return by_lower[name]
+    return None
+
+class TimeSeriesStore:
+    """
+    Keeps the samples of every dated upload, and rollups of them, so trends
+    can be drawn across uploads.
+
+    Samples go to Parquet files partitioned by year
+    (`samples/year=2023/<dataset key>.parquet`), sorted by station and date.
+    Each file holds one upload, so re-uploading the same file changes nothing.
+
+    For each period (daily, monthly, yearly), `rollups/<period>.parquet` holds
+    one row per scope (station, region, all), name and period. The row
+    stores the sample count, HMPI sum and max, and the count of samples at
+    each pollution level. Sums and counts can simply be added, so a new
+    upload is rolled up on its own and merged into the existing rollups,
+    without reading older samples again. Trend queries only read the rollups.
+    """
+
+    def __init__(self, root=os.path.join('data', 'uploads', 'timeseries'), lock_timeout=60):
+        self.root = root
+        self.lock_timeout = lock_timeout
+        os.makedirs(os.path.join(self.root, 'rollups'), exist_ok=True)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, 'manifest.json')
+
+    def rollup_path(self, period):
+        return os.path.join(self.root, 'rollups', f'{period}.parquet')
+
+    def sample_path(self, key, year):
+        return os.path.join(self.root, 'samples', f'year={year}', f'{key}.parquet')
+
+    def manifest(self):
+        """Returns {dataset key: summary} of every ingested upload."""
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def version(self):
+        """Changes whenever an upload is ingested, for use in cache keys."""
+        return sorted(self.manifest())
+
+    @contextmanager
+    def lock(self):
+        """
+        Cross-process lock around the read-merge-write of the rollups, as
+        calculation jobs run in worker processes. On POSIX it is an flock on
+        the lock file, which the OS releases when the holder exits or dies,
+        so there is no stale lock to break. Elsewhere see file_lock().
+        """
+        path = os.path.join(self.root, '.lock')
+        if fcntl is None:
+            with self.file_lock(path):
+                yield
+            return
+        with open(path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def file_lock(self, path):
+        """
+        Lock held by creating the lock file, for systems without flock. A lock
+        file older than lock_timeout is treated as left over from a crashed
+        worker; the holder touches it every lock_timeout / 3, so a long ingest
+        keeps its lock.
+        """
+        while True:
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > self.lock_timeout:
+                        self.break_stale(path)
+                        continue
+                except OSError:
+                    continue
+                time.sleep(0.05)
+
+        stop = threading.Event()
+
+        def refresh():
+            while not stop.wait(self.lock_timeout / 3):
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+
+        refresher = threading.Thread(target=refresh, daemon=True)
+        refresher.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            refresher.join()
+            os.close(fd)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def break_stale(self, path):
+        """
+        Removes a stale lock file. It is renamed to a unique name first, so
+        only one process gets it, and checked again there: a lock refreshed
+        or re-created since the caller looked at it is put back.
+        """
+        stale = f'{path}.{uuid.uuid4().hex}.stale'
+        os.rename(path, stale)
+        if time.time() - os.path.getmtime(stale) > self.lock_timeout:
+            os.remove(stale)
+        else:
+            os.rename(stale, path)
+
+    def samples(self, df):
+        """Extracts the columns kept for trends from a calculated DataFrame, one row per dated sample."""
+        name_col = station_column(df.columns)
+        region_col = region_column(df.columns)
+        hmpi = pd.to_numeric(df['HMPI'], errors='coerce').to_numpy(dtype='float64')
+
+        samples = pd.DataFrame({
+            'date': pd.to_datetime(df['Date'], errors='coerce').to_numpy(),
+            'station': df[name_col].astype(str).to_numpy() if name_col else 'Unknown',
+            'region': df[region_col].astype(str).to_numpy() if region_col else 'All',
+            'latitude': pd.to_numeric(df['Latitude'], errors='coerce').to_numpy() if 'Latitude' in df.columns else np.nan,
+            'longitude': pd.to_numeric(df['Longitude'], errors='coerce').to_numpy() if 'Longitude' in df.columns else np.nan,
+            'hmpi': hmpi,
+            'level': np.digitize(np.nan_to_num(hmpi, nan=np.inf), LEVEL_BOUNDS, right=True).astype('int8'),
+        })
+        samples = samples[samples['date'].notna() & np.isfinite(hmpi)]
+        return samples.sort_values(['station', 'date'], kind='stable', ignore_index=True)
+
+    def rollup(self, samples, period):
+        """Aggregates samples per scope, name and period into additive columns."""
+        start = samples['date'].dt.to_period(PERIODS[period]).dt.start_time
+        levels = pd.get_dummies(samples['level']).reindex(columns=range(len(POLLUTION_LEVELS)), fill_value=0)
+        levels.columns = LEVEL_COUNTS
+        base = pd.concat([samples[['station', 'region', 'hmpi']], levels.astype('int64')], axis=1)
+        base['period'] = start
+
+        frames = []
+        for scope in SCOPES:
+            names = base['station'] if scope == 'station' else base['region'] if scope == 'region' else pd.Series('All', index=base.index)
+            grouped = base.assign(name=names).groupby(['name', 'period'], sort=False)
+            frame = grouped[LEVEL_COUNTS].sum()
+            frame['count'] = grouped['hmpi'].size()
+            frame['sum'] = grouped['hmpi'].sum()
+            frame['max'] = grouped['hmpi'].max()
+            frames.append(frame.reset_index().assign(scope=scope))
+        return pd.concat(frames, ignore_index=True)[['scope', 'name', 'period', 'count', 'sum', 'max'] + LEVEL_COUNTS]
+
+    def merge(self, old, new):
+        """Adds new rollup rows into existing ones."""
+        if old is None or old.empty:
+            return new
+        combined = pd.concat([old, new], ignore_index=True)
+        aggregations = {'count': 'sum', 'sum': 'sum', 'max': 'max', **{col: 'sum' for col in LEVEL_COUNTS}}
+        return combined.groupby(['scope', 'name', 'period'], as_index=False, sort=False).agg(aggregations)
+
+    def write(self, df, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def ingest(self, key, df):
+        """
+        Adds a calculated upload to the store. Returns the number of dated
+        samples added; 0 if the data has no dates or the upload was
+        already ingested.
+        """
+        if 'Date' not in df.columns or 'HMPI' not in df.columns:
+            return 0
+        samples = self.samples(df)
+        if samples.empty:
+            return 0
+
+        with self.lock():
+            manifest = self.manifest()
+            if key in manifest:
+                return 0
+
+            for year, group in samples.groupby(samples['date'].dt.year):
+                self.write(group, self.sample_path(key, int(year)))
+
+            for period in PERIODS:
+                path = self.rollup_path(period)
+                old = pd.read_parquet(path) if os.path.exists(path) else None
+                self.write(self.merge(old, self.rollup(samples, period)), path)
+
+            manifest[key] = {
+                'rows': len(samples),
+                'first': samples['date'].min().isoformat(),
+                'last': samples['date'].max().isoformat(),
+                'ingested': time.time(),
+            }
+            tmp_path = f'{self.manifest_path}.{uuid.uuid4().hex}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.manifest_path)
+        return len(samples)
+
+    def trend(self, period='monthly', scope='all', name='All', start=None, end=None):
+        """
+        Returns the rollups of one station, region or all samples as a list
+        of {period, count, mean, max, levels} dicts, oldest first.
+        """
+        if period not in PERIODS:
+            raise ValueError(f"Unknown period '{period}'. Available: {', '.join(PERIODS)}")
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown scope '{scope}'. Available: {', '.join(SCOPES)}")
+
+        path = self.rollup_path(period)
+        if not os.path.exists(path):
+            return []
+        filters = [('scope', '==', scope), ('name', '==', name)]
+        if start is not None:
+            filters.append(('period', '>=', pd.Timestamp(start)))
+        if end is not None:
+            filters.append(('period', '<=', pd.Timestamp(end)))
+        rows = pd.read_parquet(path, filters=filters).sort_values('period')
+
+        return [
+            {
+                'period': row['period'].strftime('%Y-%m-%d'),
+                'count': int(row['count']),
+                'mean': float(row['sum'] / row['count']),
+                'max': float(row['max']),
+                'levels': {level: int(row[col]) for level, col in zip(POLLUTION_LEVELS, LEVEL_COUNTS) if row[col]},
+            }
+            for _, row in rows.iterrows()
+        ]
+
+    def names(self, scope):
+        """Returns the station or region names that have rollups."""
+        path = self.rollup_path('yearly')
+        if not os.path.exists(path):
+            return []
+        rows = pd.read_parquet(path, columns=['scope', 'name'], filters=[('scope', '==', scope)])
+        return sorted(rows['name'].unique().tolist())
+
+    def chart(self, points, title, dpi=110):
+        """Draws mean and max HMPI of a trend over time, over the pollution level bands, as PNG bytes."""
+        fig, ax = new_figure({'dpi': dpi})
+        if not points:
+            ax.text(0.5, 0.5, 'No dated samples for this selection', ha='center', va='center')
+            ax.set_axis_off()
+            return to_png(fig)
+
+        dates = pd.to_datetime([point['period'] for point in points])
+        means = [point['mean'] for point in points]
+        maxes = [point['max'] for point in points]
+
+        # Shade the pollution level bands behind the lines
+        top = max(maxes) * 1.1
+        for low, high, color in zip([0] + LEVEL_BOUNDS, LEVEL_BOUNDS + [np.inf], POLLUTION_COLORS):
+            if low < top:
+                ax.axhspan(low, min(high, top), color=color, alpha=0.08, linewidth=0)
+
+        marker = 'o' if len(points) <= 60 else None
+        ax.plot(dates, means, color='#2c7fb8', marker=marker, markersize=3, label='Mean HMPI')
+        ax.plot(dates, maxes, color='#dc3545', marker=marker, markersize=3, linestyle='--', label='Max HMPI')
+        ax.set_ylim(0, top)
+        ax.set_ylabel('HMPI')
+        ax.set_title(title)
+        ax.legend()
+        fig.autofmt_xdate()
+        return to_png(fig)
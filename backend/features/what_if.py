@@ -0,0 +1,234 @@
+# backend/features/what_if.py
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from backend.features.hmpi_calculation import HMPICalculation, LEVEL_BOUNDS, POLLUTION_LEVELS
+from backend.features.spatial_index import station_column
+
+# Drinking water limits in mg/L. Metals a standard sets no limit for are
+# left out of the index under that profile.
+
+# IS 10500:2012, permissible limit in the absence of an alternate source
+BIS_LIMITS = {
+    'al': 0.2, 'as': 0.01, 'ba': 0.7, 'cd': 0.003, 'cr': 0.05, 'cu': 1.5,
+    'fe': 0.3, 'hg': 0.001, 'mn': 0.3, 'ni': 0.02, 'pb': 0.01, 'se': 0.01, 'zn': 15,
+}
+
+# WHO Guidelines for drinking-water quality, 4th edition incorporating the addenda (2022)
+WHO_LIMITS = {
+    'as': 0.01, 'ba': 1.3, 'cd': 0.003, 'cr': 0.05, 'cu': 2, 'hg': 0.006,
+    'mn': 0.08, 'ni': 0.07, 'pb': 0.01, 'sb': 0.02, 'se': 0.04,
+}
+
+def unit_weights(limits):
+    """A standards table with W = 1 / S and I = 0, the convention of the built-in table."""
+    return {metal: {'S': limit, 'W': 1 / limit, 'I': 0} for metal, limit in limits.items()}
+
+PROFILES = {
+    'default': HMPICalculation().standards,
+    'bis': unit_weights(BIS_LIMITS),
+    'who': unit_weights(WHO_LIMITS),
+}
+
+METALS = list(HMPICalculation().standards)
+
+# Most polluted rows listed in a what-if result
+TOP_ROWS = 20
+
+def number(value, name):
+    """A finite float, or ValueError naming the field."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+    if not math.isfinite(value):
+        raise ValueError(f"{name} must be a finite number")
+    return value
+
+def resolve_profile(name=None, standards=None, weights=None):
+    """
+    Returns the standards table {metal: {'S', 'W', 'I'}} of a named profile
+    ('default' if None) with custom limits and weights on top.
+
+    `standards` maps metals to a limit, or to a dict with any of S, W and I.
+    `weights` maps metals to a weight. A metal given a new limit but no
+    weight gets W = 1 / S. Raises ValueError for unknown profiles or metals,
+    negative weights and limits not above the ideal value.
+    """
+    name = name or 'default'
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile '{name}'. Available: {', '.join(PROFILES)}")
+    table = {metal: dict(values) for metal, values in PROFILES[name].items()}
+
+    for metal, value in (standards or {}).items():
+        key = str(metal).strip().lower()
+        if key not in METALS:
+            raise ValueError(f"Unknown metal '{metal}'. Available: {', '.join(METALS)}")
+        entry = table.get(key, {'I': 0})
+        if isinstance(value, dict):
+            unknown = set(value) - {'S', 'W', 'I'}
+            if unknown:
+                raise ValueError(f"Unknown field '{unknown.pop()}' for {metal}, use S, W and I")
+            entry.update({field: number(v, f'{field} of {metal}') for field, v in value.items()})
+            if 'S' not in entry:
+                raise ValueError(f"{metal} needs a limit S in this profile")
+            if 'W' not in value and 'S' in value:
+                entry['W'] = 1 / entry['S'] if entry['S'] else 0
+        else:
+            entry['S'] = number(value, f'limit of {metal}')
+            entry['W'] = 1 / entry['S'] if entry['S'] else 0
+        table[key] = entry
+
+    for metal, value in (weights or {}).items():
+        key = str(metal).strip().lower()
+        if key not in table:
+            raise ValueError(f"No limit for '{metal}' in this profile, set one in standards")
+        table[key]['W'] = number(value, f'weight of {metal}')
+
+    for metal, entry in table.items():
+        if entry['S'] <= entry['I']:
+            raise ValueError(f"The limit of {metal} must be above its ideal value {entry['I']}")
+        if entry['W'] < 0:
+            raise ValueError(f"The weight of {metal} cannot be negative")
+    return table
+
+class ConcentrationMatrix:
+    """
+    The metal concentrations of one calculated dataset as a dense
+    (rows x metals) matrix M, missing cells as 0, with a 0/1 matrix P of the
+    cells present. With A = 100 * W / (S - I), every profile's HMPI is
+
+        HMPI = (M @ A - P @ (A * I)) / (P @ W)
+
+    the same sums as HMPICalculation.hmpi_index, as matrix-vector products
+    over matrices built once per dataset, so no row is visited in Python.
+    """
+
+    def __init__(self, df):
+        columns = {str(col).lower(): col for col in df.columns}
+        self.metals = [metal for metal in METALS if metal in columns]
+        values = df[[columns[metal] for metal in self.metals]].to_numpy(dtype='float64')
+        present = ~np.isnan(values)
+        self.values = np.where(present, values, 0.0)
+        self.present = present.astype('float64')
+
+        self.hmpi = pd.to_numeric(df['HMPI'], errors='coerce').to_numpy(dtype='float64')
+        self.levels = np.digitize(self.hmpi, LEVEL_BOUNDS, right=True)
+        name_col = station_column(df.columns)
+        self.names = df[name_col].reset_index(drop=True) if name_col else None
+        self._summary = None
+        self.nbytes = self.values.nbytes + self.present.nbytes + self.hmpi.nbytes + self.levels.nbytes
+        if self.names is not None:
+            self.nbytes += int(self.names.memory_usage(deep=True))
+
+    def __len__(self):
+        return len(self.hmpi)
+
+    def memory_bytes(self):
+        return self.nbytes
+
+    def vectors(self, table):
+        """S, W, I of the dataset's metals; metals without a limit in the table get weight 0."""
+        S = np.array([table[metal]['S'] if metal in table else 1.0 for metal in self.metals])
+        W = np.array([table[metal]['W'] if metal in table else 0.0 for metal in self.metals])
+        I = np.array([table[metal]['I'] if metal in table else 0.0 for metal in self.metals])
+        return S, W, I
+
+    def hmpi_for(self, table):
+        """HMPI of every row under the table; NaN for rows with none of its weighted metals."""
+        S, W, I = self.vectors(table)
+        A = 100 * W / (S - I)
+        num = self.values @ A
+        if I.any():
+            num -= self.present @ (A * I)
+        den = self.present @ W
+        hmpi = np.full(len(self), np.nan)
+        np.divide(num, den, out=hmpi, where=den != 0)
+        return hmpi
+
+    def summary(self, hmpi, levels):
+        """Mean, median, max and level counts over the rows with an HMPI; NaN rows are left out."""
+        scored = ~np.isnan(hmpi)
+        hmpi, levels = hmpi[scored], levels[scored]
+        counts = np.bincount(levels, minlength=len(POLLUTION_LEVELS))
+        return {
+            'unscored': int(len(scored) - len(hmpi)),
+            'hmpi_mean': float(hmpi.mean()) if len(hmpi) else 0.0,
+            'hmpi_median': float(np.median(hmpi)) if len(hmpi) else 0.0,
+            'hmpi_max': float(hmpi.max()) if len(hmpi) else 0.0,
+            'level_counts': {level: int(count) for level, count in zip(POLLUTION_LEVELS, counts)},
+        }
+
+    def what_if(self, table, top=TOP_ROWS):
+        """
+        Recomputes HMPI and pollution levels under a standards table and
+        compares them with the calculated ones: both summaries, how many rows
+        change level and in which direction, and the most polluted rows.
+
+        Rows with none of the table's weighted metals cannot be scored. They
+        are counted in 'unscored' and left out of everything else, instead
+        of passing for 'Perfect' with an HMPI of 0.
+        """
+        used = [metal for metal in self.metals if metal in table and table[metal]['W'] > 0]
+        if not used:
+            raise ValueError(f"None of the dataset's metals ({', '.join(self.metals)}) has a weighted limit in this profile")
+        hmpi = self.hmpi_for(table)
+        levels = np.digitize(hmpi, LEVEL_BOUNDS, right=True)
+
+        if self._summary is None:
+            self._summary = self.summary(self.hmpi, self.levels)
+
+        scored = ~np.isnan(hmpi)
+        compared = scored & ~np.isnan(self.hmpi)
+        n = len(POLLUTION_LEVELS)
+        transitions = np.bincount(self.levels[compared] * n + levels[compared], minlength=n * n).reshape(n, n)
+        # Only the top rows are sorted, after a linear-time partition
+        rows = np.flatnonzero(scored)
+        if len(rows) > top:
+            rows = rows[np.argpartition(-hmpi[rows], top)[:top]]
+        worst = rows[np.argsort(-hmpi[rows], kind='stable')]
+
+        return {
+            'rows': len(self),
+            'unscored': int(len(self) - scored.sum()),
+            'metals': used,
+            'excluded': [metal for metal in self.metals if metal not in used],
+            'standards': {metal: table[metal] for metal in used},
+            'current': self._summary,
+            'what_if': self.summary(hmpi, levels),
+            'changed': int(compared.sum() - np.trace(transitions)),
+            'worse': int(np.triu(transitions, 1).sum()),
+            'better': int(np.tril(transitions, -1).sum()),
+            'transitions': {
+                POLLUTION_LEVELS[i]: {POLLUTION_LEVELS[j]: int(transitions[i, j]) for j in range(n) if transitions[i, j]}
+                for i in range(n) if transitions[i].any()
+            },
+            'top': [{
+                'row': int(row),
+                'station': str(self.names.iloc[row]) if self.names is not None else None,
+                'hmpi': float(hmpi[row]),
+                'level': POLLUTION_LEVELS[levels[row]],
+                'current_hmpi': float(self.hmpi[row]),
+                'current_level': POLLUTION_LEVELS[self.levels[row]],
+            } for row in worst],
+        }
+
+class WhatIfCache:
+    """
+    Gives the ConcentrationMatrix of a calculated dataset. Matrices are kept
+    by the DatasetCache next to the frames, under its memory budget.
+    """
+
+    profiles = PROFILES
+
+    def __init__(self, dataset_cache):
+        self.dataset_cache = dataset_cache
+
+    def profile(self, name=None, standards=None, weights=None):
+        return resolve_profile(name, standards, weights)
+
+    def get(self, key, stage):
+        return self.dataset_cache.derived(key, stage, 'what-if', ConcentrationMatrix)
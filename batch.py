@@ -0,0 +1,223 @@
+# batch.py
+#
+# Headless batch mode, e.g. for nightly runs: processes every CSV and Excel
+# file in a directory with the same pipeline as the web app, on a process
+# pool, without starting a server. Each file gets its own output directory,
+# named after the file with its extension (out/surat.csv/), with
+# results.csv, map.html and report.pdf.
+#
+#   python batch.py data/districts --out data/batch
+#   python batch.py data/districts --out data/batch --workers 4 --indices HEI MI --no-report
+#   python batch.py data/workbooks --sheets all
+#
+# Finished files are recorded in <out>/checkpoints.json by content hash, so
+# a rerun (after a crash, or with new files added) skips files already done
+# with the same options. --force processes everything again.
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from backend.features.caching import artifact_key, content_hash
+
+INPUT_EXTENSIONS = ('.csv', '.xlsx', '.xls')
+
+STATIC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'frontend', 'static')
+
+CHECKPOINT_FILE = 'checkpoints.json'
+
+# Built once per worker process, see features()
+_features = None
+
+def features():
+    """The pipeline objects, created on first use in each worker."""
+    global _features
+    if _features is None:
+        from backend.features.basic_output import HMPIOutput
+        from backend.features.better_df import PrettyColumns
+        from backend.features.data_processing import DataProcessor
+        from backend.features.geospatial_analysis import GeoSpatialAnalyser
+        from backend.features.hmpi_calculation import HMPICalculation
+        from backend.features.report_charts import ChartRenderer
+        from backend.features.report_generation import ReportGenerator
+        _features = {
+            'processor': DataProcessor(),
+            'calculator': HMPICalculation(),
+            'formatter': PrettyColumns(),
+            'geospatial': GeoSpatialAnalyser(),
+            # Files are already spread over the cores, so charts are drawn in-process
+            'charts': ChartRenderer(max_workers=1),
+            'reporter': ReportGenerator(),
+            'outputter': HMPIOutput(),
+        }
+    return _features
+
+def write_atomic(path, parts):
+    """Writes bytes (or an iterable of bytes) through a temporary file, so a crash never leaves half a file."""
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            for part in [parts] if isinstance(parts, bytes) else parts:
+                f.write(part)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def process_file(path, out_dir, options):
+    """Runs the pipeline on one file and writes its outputs to out_dir. Returns a checkpoint record."""
+    f = features()
+    start = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+
+    sheets = None
+    if path.endswith(('.xlsx', '.xls')):
+        # A workbook without the requested sheets fails instead of loading empty
+        from backend.features.excel_reader import ExcelReader
+        sheets = ExcelReader().selected(path, options['sheets'])
+    # Files are already spread over the cores, so sheets are parsed in-process
+    df = f['processor'].load(path, sheets, max_workers=1)
+    if df.empty:
+        raise ValueError("no data rows")
+    indices = f['calculator'].normalize_indices(options['indices'])
+    df = f['formatter'].prettify(f['calculator'].calculate(df, indices))
+
+    outputs = {'results': os.path.join(out_dir, 'results.csv')}
+    write_atomic(outputs['results'], f['outputter'].export([df], 'csv'))
+
+    if options['map'] and f['processor'].coordinates_check(df):
+        outputs['map'] = os.path.join(out_dir, 'map.html')
+        write_atomic(outputs['map'], f['geospatial'].geospatial_analysis(df).encode('utf-8'))
+
+    if options['report']:
+        report_data = {
+            'title': f"{os.path.splitext(os.path.basename(path))[0]} Analysis Report",
+            'sections': {'exec': True, 'quality': True},
+            'recommendations': True,
+        }
+        charts = f['charts'].render(df)
+        outputs['report'] = os.path.join(out_dir, 'report.pdf')
+        write_atomic(outputs['report'], f['reporter'].generate_report(df, report_data, STATIC_FOLDER, charts))
+
+    return {
+        'file': path,
+        'rows': len(df),
+        'outputs': outputs,
+        'seconds': round(time.perf_counter() - start, 3),
+        'finished': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+def find_inputs(input_dir, recursive=False):
+    """Returns the CSV and Excel files below input_dir, sorted."""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(input_dir):
+        paths.extend(os.path.join(dirpath, name) for name in filenames if name.lower().endswith(INPUT_EXTENSIONS))
+        if not recursive:
+            break
+    return sorted(paths)
+
+def output_dir(out, input_dir, path):
+    """
+    Output directory of a file, mirroring its place below input_dir, e.g.
+    out/north/surat.csv for north/surat.csv. The extension stays, so
+    surat.csv and surat.xlsx never write (or race) on the same files.
+    """
+    return os.path.join(out, os.path.relpath(path, input_dir))
+
+class Checkpoints:
+    """
+    The files finished so far, keyed by artifact_key(path, content hash, options).
+    Only the parent process writes it, after each finished file, through a
+    temporary file. An edited file, or a run with other options, gets a new
+    key and is processed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.done = json.load(f)
+        except (OSError, ValueError):
+            self.done = {}
+
+    def key(self, path, file_hash, options):
+        return artifact_key('batch', path, file_hash, options)
+
+    def finished(self, key):
+        """True if the file was done and its outputs are still there."""
+        record = self.done.get(key)
+        return bool(record) and all(os.path.exists(path) for path in record['outputs'].values())
+
+    def add(self, key, record):
+        self.done[key] = record
+        write_atomic(self.path, json.dumps(self.done, indent=2).encode('utf-8'))
+
+def main():
+    parser = argparse.ArgumentParser(description='Calculates HMPI, maps and reports for a directory of monitoring files.')
+    parser.add_argument('input_dir', help='Directory of .csv, .xlsx and .xls files')
+    parser.add_argument('--out', default=os.path.join('data', 'batch'), help='Output directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Files processed at once, the core count by default')
+    parser.add_argument('--indices', nargs='*', default=[], help='Extra indices to calculate, e.g. HEI Cd MI')
+    parser.add_argument('--sheets', nargs='*', help="Workbook sheets to read and concatenate, or 'all'; the first sheet by default")
+    parser.add_argument('--recursive', action='store_true', help='Also process files in subdirectories')
+    parser.add_argument('--no-map', action='store_true', help='Skip the HTML maps')
+    parser.add_argument('--no-report', action='store_true', help='Skip the PDF reports')
+    parser.add_argument('--force', action='store_true', help='Process files even if they are checkpointed')
+    args = parser.parse_args()
+
+    options = {
+        'indices': sorted(index.lower() for index in args.indices),
+        'sheets': 'all' if args.sheets == ['all'] else args.sheets or None,
+        'map': not args.no_map,
+        'report': not args.no_report,
+    }
+    try:
+        from backend.features.hmpi_calculation import HMPICalculation
+        HMPICalculation().normalize_indices(options['indices'])
+    except ValueError as e:
+        parser.error(str(e))
+
+    paths = find_inputs(args.input_dir, args.recursive)
+    os.makedirs(args.out, exist_ok=True)
+    checkpoints = Checkpoints(os.path.join(args.out, CHECKPOINT_FILE))
+
+    todo = []
+    for path in paths:
+        key = checkpoints.key(os.path.relpath(path, args.input_dir), content_hash(path), options)
+        if not args.force and checkpoints.finished(key):
+            continue
+        todo.append((key, path))
+    print(f"{len(paths)} files found, {len(paths) - len(todo)} already done, {len(todo)} to process")
+    if not todo:
+        return
+
+    failed = 0
+    start = time.perf_counter()
+    # Same start method as the JobManager, so the workers never inherit locks
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(1, min(args.workers, len(todo))), mp_context=context) as pool:
+        futures = {
+            pool.submit(process_file, path, output_dir(args.out, args.input_dir, path), options): (key, path)
+            for key, path in todo
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            key, path = futures[future]
+            try:
+                record = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{i}/{len(todo)}] FAILED {path}: {e}")
+                continue
+            checkpoints.add(key, record)
+            print(f"[{i}/{len(todo)}] {path}: {record['rows']} rows in {record['seconds']:.1f}s")
+
+    print(f"Done in {time.perf_counter() - start:.1f}s, {len(todo) - failed} processed, {failed} failed")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
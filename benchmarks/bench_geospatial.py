@@ -0,0 +1,52 @@
+# benchmarks/bench_geospatial.py
+#
+# Times GeoSpatialAnalyser.geospatial_analysis in per-row and bulk mode.
+#
+#   python -m benchmarks.bench_geospatial              # 1k, 10k, 100k points
+#   python -m benchmarks.bench_geospatial --sizes 1000 5000 --rowwise-limit 5000
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from backend.features.geospatial_analysis import GeoSpatialAnalyser
+from backend.features.hmpi_calculation import HMPICalculation
+
+def synthetic_stations(n, seed=0):
+    """Random stations over Gujarat with an HMPI spread across every pollution level."""
+    rng = np.random.default_rng(seed)
+    hmpi = rng.lognormal(mean=4, sigma=1.2, size=n)
+    levels, _ = HMPICalculation().classify(hmpi)
+    return pd.DataFrame({
+        'Station Name': [f'Station {i}' for i in range(n)],
+        'Latitude': rng.uniform(20.1, 24.7, n),
+        'Longitude': rng.uniform(68.2, 74.5, n),
+        'HMPI': hmpi,
+        'Pollution Level': levels,
+    })
+
+def time_render(analyser, df, bulk):
+    start = time.perf_counter()
+    html = analyser.geospatial_analysis(df, bulk=bulk)
+    return time.perf_counter() - start, len(html)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--rowwise-limit', type=int, default=10_000,
+                        help='Skip the per-row mode above this many points, it takes minutes')
+    args = parser.parse_args()
+
+    analyser = GeoSpatialAnalyser()
+    print(f"{'points':>8} {'mode':>8} {'seconds':>9} {'html MB':>8}")
+    for n in args.sizes:
+        df = synthetic_stations(n)
+        modes = [True] + ([False] if n <= args.rowwise_limit else [])
+        for bulk in modes:
+            seconds, size = time_render(analyser, df, bulk)
+            print(f"{n:>8} {'bulk' if bulk else 'per-row':>8} {seconds:>9.2f} {size / 1e6:>8.1f}")
+
+if __name__ == '__main__':
+    main()
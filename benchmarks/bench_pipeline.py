@@ -0,0 +1,178 @@
+# benchmarks/bench_pipeline.py
+#
+# Times every stage of the pipeline (load, calculate, prettify, map,
+# charts, report) on synthetic datasets, with the peak memory of each stage,
+# and saves the results as JSON so runs of different versions can be compared.
+#
+#   python -m benchmarks.bench_pipeline --save benchmarks/baseline.json
+#   python -m benchmarks.bench_pipeline --rows 1000 100000 --formats csv xlsx --nan-rate 0.05
+#   python -m benchmarks.bench_pipeline --compare benchmarks/baseline.json   # exits 1 on regressions
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from backend.features.better_df import PrettyColumns
+from backend.features.data_processing import DataProcessor
+from backend.features.geospatial_analysis import GeoSpatialAnalyser
+from backend.features.hmpi_calculation import HMPICalculation
+from backend.features.report_charts import ChartRenderer
+from backend.features.report_generation import ReportGenerator
+from benchmarks.synthetic import SyntheticStations
+
+STAGES = ['load', 'calculate', 'prettify', 'map', 'charts', 'report']
+
+STATIC_FOLDER = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'static')
+
+REPORT_DATA = {
+    'title': 'Benchmark Report',
+    'date': '2024-01-01',
+    'sections': {'exec': True, 'quality': True},
+    'recommendations': True,
+}
+
+def measure(fn, memory):
+    """
+    Runs fn and returns (result, seconds, peak MB). tracemalloc slows Python
+    code down a lot, so the time comes from an untraced run and the peak
+    from a second, traced run. Without `memory` the peak is None.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, seconds, peak
+
+def run(path, stages, memory, map_limit):
+    """Runs the pipeline on one file. Returns {stage: (seconds, peak MB)}."""
+    processor, calculator, formatter = DataProcessor(), HMPICalculation(), PrettyColumns()
+    timings = {}
+
+    df, *timings['load'] = measure(lambda: processor.load(path), memory)
+    df, *timings['calculate'] = measure(lambda: calculator.calculate(df), memory)
+    df, *timings['prettify'] = measure(lambda: formatter.prettify(df), memory)
+
+    if 'map' in stages and len(df) <= map_limit:
+        _, *timings['map'] = measure(lambda: GeoSpatialAnalyser().geospatial_analysis(df), memory)
+    charts = {}
+    if 'charts' in stages or 'report' in stages:
+        charts, *timings['charts'] = measure(lambda: ChartRenderer(max_workers=1).render(df), memory)
+    if 'report' in stages:
+        _, *timings['report'] = measure(lambda: ReportGenerator().generate_report(df, REPORT_DATA, STATIC_FOLDER, charts), memory)
+    return {stage: timing for stage, timing in timings.items() if stage in stages}
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'commit': commit,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+def result_key(result):
+    return (result['rows'], result['format'], tuple(result['metals'] or []), result['nan_rate'], result['stage'])
+
+def compare(results, baseline, threshold, min_seconds):
+    """
+    Prints each stage's time against the baseline. Returns the results more
+    than `threshold` times slower; stages faster than `min_seconds` are too
+    noisy to count.
+    """
+    before = {result_key(result): result for result in baseline['results']}
+    regressions = []
+    print(f"\nCompared with {baseline['environment'].get('commit')} ({baseline['environment'].get('created')}):")
+    print(f"{'rows':>9} {'format':>6} {'stage':>10} {'before s':>9} {'now s':>9} {'ratio':>6}")
+    for result in results:
+        old = before.get(result_key(result))
+        if old is None:
+            continue
+        ratio = result['seconds'] / max(old['seconds'], 1e-9)
+        slower = ratio > threshold and result['seconds'] >= min_seconds
+        flag = ' slower' if slower else ''
+        print(f"{result['rows']:>9} {result['format']:>6} {result['stage']:>10} "
+              f"{old['seconds']:>9.3f} {result['seconds']:>9.3f} {ratio:>6.2f}{flag}")
+        if slower:
+            regressions.append(result)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the pipeline on synthetic datasets.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'xlsx'], default=['csv'])
+    parser.add_argument('--metals', nargs='+', help='Metal columns to generate, all by default')
+    parser.add_argument('--nan-rate', type=float, default=0.0, help='Share of metal values left blank')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--map-limit', type=int, default=1_000_000,
+                        help='Skip the map above this many rows, the HTML gets too large to be useful')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the traced runs that measure peak memory')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='With --compare, stages slower than this ratio count as regressions')
+    parser.add_argument('--min-seconds', type=float, default=0.05,
+                        help='With --compare, ignore stages faster than this, their timings are mostly noise')
+    args = parser.parse_args()
+
+    generator = SyntheticStations()
+    results = []
+    print(f"{'rows':>9} {'format':>6} {'stage':>10} {'seconds':>9} {'peak MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            for fmt in args.formats:
+                path = generator.write(os.path.join(tmp, f'stations_{rows}.{fmt}'), rows, args.metals, args.nan_rate, args.seed)
+                for stage, (seconds, peak) in run(path, args.stages, not args.no_memory, args.map_limit).items():
+                    print(f"{rows:>9} {fmt:>6} {stage:>10} {seconds:>9.3f} {peak if peak is not None else float('nan'):>9.1f}")
+                    results.append({
+                        'rows': rows,
+                        'format': fmt,
+                        'metals': args.metals,
+                        'nan_rate': args.nan_rate,
+                        'stage': stage,
+                        'seconds': round(seconds, 4),
+                        'peak_mb': round(peak, 2) if peak is not None else None,
+                    })
+                os.remove(path)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=2)
+        print(f"\nSaved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) more than {args.threshold}x slower than the baseline")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_startup.py
+#
+# Guards the app's cold start: imports app.py in fresh interpreters, checks
+# the median import time against a budget and that none of the heavy
+# libraries were imported. Exits 1 if either check fails.
+#
+#   python -m benchmarks.bench_startup
+#   python -m benchmarks.bench_startup --budget 0.3 --runs 10
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Libraries the feature modules need, which must not load until a route uses them
+HEAVY_MODULES = ['pandas', 'numpy', 'folium', 'fpdf', 'pypdf', 'matplotlib', 'scipy', 'pyarrow']
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# Runs in the child interpreter; serving a page must not pull in heavy modules either
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+seconds = time.perf_counter() - start
+client = app.app.test_client()
+pages = {path: client.get(path).status_code for path in ('/', '/analyzer', '/info')}
+heavy = [name for name in %r if name in sys.modules]
+print(json.dumps({'seconds': seconds, 'pages': pages, 'heavy': heavy}))
+""" % (HEAVY_MODULES,)
+
+def probe():
+    output = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+    # app.py prints on import, the result is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description='Checks the import time of app.py against a budget.')
+    parser.add_argument('--budget', type=float, default=0.5, help='Most seconds the median import may take')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    results = [probe() for _ in range(args.runs)]
+    median = statistics.median(result['seconds'] for result in results)
+    heavy = sorted({name for result in results for name in result['heavy']})
+    failed_pages = {path: status for path, status in results[0]['pages'].items() if status != 200}
+
+    print(f"import app: median {median:.3f}s over {args.runs} runs (budget {args.budget:.3f}s)")
+    print(f"heavy modules loaded after serving the pages: {', '.join(heavy) or 'none'}")
+
+    failures = []
+    if median > args.budget:
+        failures.append(f"import took {median:.3f}s, over the {args.budget:.3f}s budget")
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    if failed_pages:
+        failures.append(f"pages failed: {failed_pages}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
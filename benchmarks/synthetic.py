@@ -0,0 +1,111 @@
+# benchmarks/synthetic.py
+#
+# Seeded synthetic station datasets shaped like data/gujarat_stations.csv,
+# for benchmarking the pipeline at sizes the real data does not reach.
+#
+#   python -m benchmarks.synthetic out.csv --rows 1000000 --nan-rate 0.05
+#   python -m benchmarks.synthetic out.xlsx --rows 100000 --metals as cd pb hg
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SOURCE = os.path.join(os.path.dirname(__file__), '..', 'data', 'gujarat_stations.csv')
+
+# Rows are generated in fixed-size chunks, so a seed gives the same rows
+# whatever the file format, and 10M-row files never sit in memory whole
+CHUNK_ROWS = 250_000
+
+# Most rows Excel can hold below the header
+XLSX_MAX_ROWS = 1_048_575
+
+class SyntheticStations:
+    """
+    Draws random samples that look like the real survey file: same column
+    names and order, station names and positions taken from real stations
+    (positions jittered by about a kilometre), and each metal drawn from a
+    log-normal fitted to that metal's non-zero values, with the same share
+    of zeros. A `nan_rate` share of metal values is left blank.
+    """
+
+    def __init__(self, source=SOURCE):
+        real = pd.read_csv(source)
+        self.id_col, self.lat_col, self.lon_col = real.columns[:3]
+        self.names = real[self.id_col].astype(str).to_numpy()
+        self.lat = real[self.lat_col].to_numpy(dtype='float64')
+        self.lon = real[self.lon_col].to_numpy(dtype='float64')
+
+        # Per metal: (share of zeros, mean and std of log of the non-zero values)
+        self.metals = {}
+        for col in real.columns[3:]:
+            values = pd.to_numeric(real[col], errors='coerce').dropna().to_numpy()
+            positive = np.log(values[values > 0])
+            self.metals[col] = (float((values == 0).mean()), float(positive.mean()), float(positive.std()))
+
+    def chunks(self, rows, metals=None, nan_rate=0.0, seed=0):
+        """Yields DataFrames of up to CHUNK_ROWS rows, `rows` in total."""
+        metals = list(metals) if metals else list(self.metals)
+        unknown = [metal for metal in metals if metal not in self.metals]
+        if unknown:
+            raise ValueError(f"Unknown metals: {', '.join(unknown)}. Available: {', '.join(self.metals)}")
+
+        rng = np.random.default_rng(seed)
+        for start in range(0, rows, CHUNK_ROWS):
+            n = min(CHUNK_ROWS, rows - start)
+            station = rng.integers(0, len(self.names), n)
+            chunk = {
+                self.id_col: self.names[station],
+                self.lat_col: (self.lat[station] + rng.normal(0, 0.01, n)).round(6),
+                self.lon_col: (self.lon[station] + rng.normal(0, 0.01, n)).round(6),
+            }
+            for metal in metals:
+                zeros, mu, sigma = self.metals[metal]
+                values = rng.lognormal(mu, sigma, n)
+                values[rng.random(n) < zeros] = 0.0
+                if nan_rate:
+                    values[rng.random(n) < nan_rate] = np.nan
+                chunk[metal] = values
+            yield pd.DataFrame(chunk)
+
+    def frame(self, rows, metals=None, nan_rate=0.0, seed=0):
+        return pd.concat(self.chunks(rows, metals, nan_rate, seed), ignore_index=True)
+
+    def write(self, path, rows, metals=None, nan_rate=0.0, seed=0):
+        """Writes a dataset to a .csv or .xlsx file, chunk by chunk. Returns the path."""
+        chunks = self.chunks(rows, metals, nan_rate, seed)
+        if path.endswith('.csv'):
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        elif path.endswith('.xlsx'):
+            if rows > XLSX_MAX_ROWS:
+                raise ValueError(f"Excel sheets hold at most {XLSX_MAX_ROWS} rows")
+            from openpyxl import Workbook
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            for i, chunk in enumerate(chunks):
+                if i == 0:
+                    sheet.append(list(chunk.columns))
+                # Blank cells for NaN, as a spreadsheet would have them
+                for row in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False):
+                    sheet.append(list(row))
+            workbook.save(path)
+        else:
+            raise ValueError("Unsupported file type, use .csv or .xlsx")
+        return path
+
+def main():
+    parser = argparse.ArgumentParser(description='Writes a synthetic station dataset.')
+    parser.add_argument('path', help='Output .csv or .xlsx file')
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--metals', nargs='+', help='Metal columns to include, all by default')
+    parser.add_argument('--nan-rate', type=float, default=0.0, help='Share of metal values left blank')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    SyntheticStations().write(args.path, args.rows, args.metals, args.nan_rate, args.seed)
+    print(f"Wrote {args.rows} rows to {args.path}")
+
+if __name__ == '__main__':
+    main()
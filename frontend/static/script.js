@@ -21,6 +21,14 @@ document.addEventListener('DOMContentLoaded', function () {
     const resetBtn = document.getElementById('reset-btn');
     const mapTabBtn = document.getElementById('map-tab-btn');
     const generateReportBtn = document.getElementById('generate-report-btn'); // <-- New button
+    const resultsControls = document.getElementById('results-controls');
+    const resultsPager = document.getElementById('results-pager');
+    const resultsPageInfo = document.getElementById('results-page-info');
+    const resultsPrev = document.getElementById('results-prev');
+    const resultsNext = document.getElementById('results-next');
+    const downloadCsvBtn = document.getElementById('download-csv-btn');
+    const sheetsOption = document.getElementById('sheets-option');
+    const sheetsInput = document.getElementById('sheetsInput');
 
     let uploadedFile = null;
 
@@ -52,6 +60,8 @@ document.addEventListener('DOMContentLoaded', function () {
         uploadedFile = file;
         fileInfoText.textContent = `Selected file: ${file.name}`;
         processBtn.disabled = false;
+        // Workbooks can have several sheets to choose from
+        sheetsOption.classList.toggle('hidden', !/\.xlsx?$/i.test(file.name));
     }
 
     processBtn.addEventListener('click', async () => {
@@ -61,6 +71,9 @@ document.addEventListener('DOMContentLoaded', function () {
 
         const formData = new FormData();
         formData.append('file', uploadedFile);
+        if (!sheetsOption.classList.contains('hidden') && sheetsInput.value.trim()) {
+            formData.append('sheets', sheetsInput.value.trim());
+        }
 
         try {
             const uploadResponse = await fetch('/upload', {
@@ -69,7 +82,8 @@ document.addEventListener('DOMContentLoaded', function () {
             });
 
             if (!uploadResponse.ok) {
-                throw new Error('File upload failed.');
+                const uploadError = await uploadResponse.json().catch(() => ({}));
+                throw new Error(uploadError.error || 'File upload failed.');
             }
 
             const uploadData = await uploadResponse.json();
@@ -84,20 +98,33 @@ document.addEventListener('DOMContentLoaded', function () {
                 mapTabBtn.title = "Map not available: Your data must contain 'Latitude' and 'Longitude' columns.";
             }
 
-            statusMessage.textContent = `${uploadData.rows} rows of data uploaded successfully.`;
+            statusMessage.textContent = uploadData.rows === null
+                ? 'Large file uploaded successfully, it will be processed in chunks.'
+                : `${uploadData.rows} rows of data uploaded successfully.`;
+            if (uploadData.sheets && uploadData.sheets.length > 1) {
+                statusMessage.textContent += ` Sheets read: ${uploadData.selected_sheets.join(', ')} (workbook has ${uploadData.sheets.join(', ')}).`;
+            }
 
             showSpinner('Calculating HMPI...');
-            const calculateResponse = await fetch('/calculate', {
+            const calculateResponse = await runJob('/calculate', {
                 method: 'POST'
-            });
+            }, 'Calculating HMPI...');
 
             if (!calculateResponse.ok) {
                 throw new Error('HMPI calculation failed.');
             }
 
             const calculateData = await calculateResponse.json();
+            if (uploadData.rows === null) {
+                statusMessage.textContent = `${calculateData.rows} rows of data processed successfully.`;
+            }
             displayResults(calculateData);
             switchToResultsView();
+            // Page through the whole result on the server; large CSVs processed
+            // in chunks are not cached, so they keep the preview only
+            if (uploadData.rows !== null) {
+                await loadResultsPage(1);
+            }
         } catch (error) {
             console.error('Error:', error);
             statusMessage.textContent = `An error occurred: ${error.message}`;
@@ -106,6 +133,11 @@ document.addEventListener('DOMContentLoaded', function () {
         }
     });
 
+    // The export is streamed by the server, the browser saves it as it arrives
+    downloadCsvBtn.addEventListener('click', () => {
+        window.location.href = '/export?format=csv';
+    });
+
     // --- Start of Report Generation Logic ---
     generateReportBtn.addEventListener('click', async () => {
         showSpinner('Generating your report...');
@@ -120,18 +152,19 @@ document.addEventListener('DOMContentLoaded', function () {
                 exec: document.getElementById('section-exec').checked,
                 results: document.getElementById('section-results').checked,
                 quality: document.getElementById('section-quality').checked,
-                conc: document.getElementById('section-conc').checked
+                conc: document.getElementById('section-conc').checked,
+                appendix: document.getElementById('section-appendix').checked
             }
         };
 
         try {
-            const response = await fetch('/report', {
+            const response = await runJob('/report', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json'
                 },
                 body: JSON.stringify(reportData)
-            });
+            }, 'Generating your report...');
 
             if (!response.ok) {
                 throw new Error('Report generation failed.');
@@ -157,26 +190,115 @@ document.addEventListener('DOMContentLoaded', function () {
     // --- End of Report Generation Logic ---
 
 
+    // --- Background Jobs ---
+    // Heavy endpoints answer 202 with a job id. Poll its status until it is
+    // done, then fetch the result. Other responses are returned unchanged.
+    async function runJob(url, options = {}, spinnerMessage = null) {
+        const response = await fetch(url, options);
+        if (response.status !== 202) {
+            return response;
+        }
+        const job = await response.json();
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, 500));
+            const statusResponse = await fetch(job.status_url);
+            const status = await statusResponse.json();
+            if (!statusResponse.ok || status.status === 'failed') {
+                throw new Error(status.error || 'Background job failed.');
+            }
+            if (status.status === 'done') {
+                return fetch(job.result_url);
+            }
+            if (spinnerMessage) {
+                showSpinner(`${spinnerMessage} (${status.stage})`);
+            }
+        }
+    }
+
     function displayResults(data) {
-        const {
-            columns,
-            preview
-        } = data;
+        renderTable(data.columns, data.preview);
+    }
+
+    // --- Result Paging ---
+    // Pages, sorting and filters are all done by /results on the server
+    const resultsQuery = { page: 1, sort: null, order: 'asc' };
+
+    async function loadResultsPage(page) {
+        const params = new URLSearchParams({ page, page_size: 50 });
+        if (resultsQuery.sort) {
+            params.set('sort', resultsQuery.sort);
+            params.set('order', resultsQuery.order);
+        }
+        const search = document.getElementById('results-search').value.trim();
+        const level = document.getElementById('results-level').value;
+        const minHmpi = document.getElementById('results-min-hmpi').value;
+        const maxHmpi = document.getElementById('results-max-hmpi').value;
+        if (search) params.set('q', search);
+        if (level) params.set('level', level);
+        if (minHmpi) params.set('min_hmpi', minHmpi);
+        if (maxHmpi) params.set('max_hmpi', maxHmpi);
+
+        const response = await fetch(`/results?${params}`);
+        const data = await response.json();
+        if (!response.ok) {
+            resultsPageInfo.textContent = data.error || 'Could not load results.';
+            return;
+        }
+        resultsQuery.page = data.page;
+        renderTable(data.columns, data.rows);
+        resultsPageInfo.textContent = `Page ${data.page} of ${data.pages} (${data.total} rows)`;
+        resultsPrev.disabled = data.page <= 1;
+        resultsNext.disabled = data.page >= data.pages;
+        resultsControls.classList.remove('hidden');
+        resultsPager.classList.remove('hidden');
+    }
+
+    resultsPrev.addEventListener('click', () => loadResultsPage(resultsQuery.page - 1));
+    resultsNext.addEventListener('click', () => loadResultsPage(resultsQuery.page + 1));
+
+    let searchTimer = null;
+    document.getElementById('results-search').addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => loadResultsPage(1), 300);
+    });
+    ['results-level', 'results-min-hmpi', 'results-max-hmpi'].forEach(id => {
+        document.getElementById(id).addEventListener('change', () => loadResultsPage(1));
+    });
+
+    // Clicking a header sorts by that column, clicking it again reverses the order
+    previewTable.addEventListener('click', (e) => {
+        const header = e.target.closest('th.sortable');
+        if (!header || resultsPager.classList.contains('hidden')) return;
+        const col = header.dataset.col;
+        if (resultsQuery.sort === col) {
+            resultsQuery.order = resultsQuery.order === 'asc' ? 'desc' : 'asc';
+        } else {
+            resultsQuery.sort = col;
+            resultsQuery.order = col === 'HMPI' ? 'desc' : 'asc';
+        }
+        loadResultsPage(1);
+    });
+
+    function renderTable(columns, preview) {
         let tableHtml = '<table><thead><tr>';
         columns.forEach(col => {
-            if (col !== 'Pollution_Color') { // Don't show the color column
-                tableHtml += `<th>${col}</th>`;
+            if (col !== 'Pollution Color') { // Don't show the color column
+                const arrow = resultsQuery.sort === col ? (resultsQuery.order === 'asc' ? ' &#9650;' : ' &#9660;') : '';
+                tableHtml += `<th class="sortable" data-col="${col}">${col}${arrow}</th>`;
             }
         });
         tableHtml += '</tr></thead><tbody>';
 
         preview.forEach(row => {
             const pollutionLevel = row['Pollution Level'] ? row['Pollution Level'].replace(/\s+/g, '-').toLowerCase() : '';
-            const pollutionColor = row['Pollution_Color'] || '#ffffff';
+            const pollutionColor = row['Pollution Color'] || '#ffffff';
             tableHtml += `<tr class="${pollutionLevel}">`;
             columns.forEach(col => {
-                if (col !== 'Pollution_Color') {
+                if (col !== 'Pollution Color') {
                     let cellValue = row[col];
+                    if (cellValue === null || cellValue === undefined) {
+                        cellValue = '';
+                    }
                     if (typeof cellValue === 'number') {
                         cellValue = cellValue.toFixed(2);
                     }
@@ -245,7 +367,7 @@ document.addEventListener('DOMContentLoaded', function () {
         mapContainer.innerHTML = '<div class="spinner"></div><p>Loading map...</p>';
 
         try {
-            const response = await fetch('/map');
+            const response = await runJob('/map');
             if (response.ok) {
                 const mapHtml = await response.text();
                 mapContainer.innerHTML = mapHtml;
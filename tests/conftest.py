@@ -0,0 +1,7 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# The backend package is imported from the repository root, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
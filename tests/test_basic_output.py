@@ -0,0 +1,65 @@
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import zstandard
+
+from backend.features.basic_output import HMPIOutput
+
+
+def empty_stage(tmp_path):
+    df = pd.DataFrame({
+        'Station': pd.Series([], dtype=object),
+        'Pb': pd.Series([], dtype='float64'),
+        'HMPI': pd.Series([], dtype='float64'),
+    })
+    path = str(tmp_path / 'calculated.parquet')
+    df.to_parquet(path, index=False)
+    return path
+
+
+def test_zero_row_parquet_export_keeps_the_schema(tmp_path):
+    output = HMPIOutput()
+    data = b''.join(output.export(output.parquet_chunks(empty_stage(tmp_path)), 'parquet', 'zstd'))
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 0
+    assert table.column_names == ['Station', 'Pb', 'HMPI']
+    assert str(table.schema.field('HMPI').type) == 'double'
+
+
+def test_zero_row_csv_export_has_a_header(tmp_path):
+    output = HMPIOutput()
+    data = b''.join(output.export(output.parquet_chunks(empty_stage(tmp_path)), 'csv'))
+    assert data.decode().strip() == '"Station","Pb","HMPI"'
+
+
+def test_parquet_export_without_chunks_is_valid():
+    data = b''.join(HMPIOutput().export(iter([]), 'parquet'))
+    assert pq.read_table(io.BytesIO(data)).num_rows == 0
+
+
+def test_zstd_csv_export():
+    df = pd.DataFrame({'Station': ['A', 'B'], 'HMPI': [12.5, 80.0]})
+    data = b''.join(HMPIOutput().export([df], 'csv', 'zstd'))
+    text = zstandard.ZstdDecompressor().decompressobj().decompress(data).decode()
+    pd.testing.assert_frame_equal(pd.read_csv(io.StringIO(text)), df)
+
+
+def test_geojson_writes_non_finite_values_as_null():
+    import json
+    import numpy as np
+
+    df = pd.DataFrame({
+        'Station': ['A', 'B'],
+        'Latitude': [21.1, np.inf],
+        'Longitude': [73.1, 73.2],
+        'HMPI': [np.inf, -np.inf],
+        'Pb': np.array([np.nan, 0.01], dtype='float32'),
+    })
+    data = b''.join(HMPIOutput().export([df], 'geojson'))
+    features = json.loads(data, parse_constant=lambda name: pytest.fail(f'{name} in GeoJSON'))['features']
+    assert [feature['properties']['HMPI'] for feature in features] == [None, None]
+    assert features[0]['properties']['Pb'] is None
+    assert features[0]['geometry'] == {'type': 'Point', 'coordinates': [73.1, 21.1]}
+    assert features[1]['geometry'] is None
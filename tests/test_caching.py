@@ -0,0 +1,80 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from backend.features.caching import DatasetCache
+from backend.features.compact import memory_bytes
+from backend.features.hmpi_calculation import HMPICalculation
+from backend.features.result_browser import ResultBrowserCache
+from backend.features.what_if import WhatIfCache
+
+
+def calculated(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Station': [f'Station {i}' for i in range(rows)],
+        'pb': rng.lognormal(-5, 1, rows),
+        'cd': rng.lognormal(-6, 1, rows),
+    })
+    return HMPICalculation().calculate(df)
+
+
+def test_derived_objects_count_against_the_memory_budget(tmp_path):
+    cache = DatasetCache(str(tmp_path), max_memory_bytes=10 ** 9)
+    cache.put('a', 'calculated', calculated(5000))
+    frame_bytes = cache.memory_bytes
+
+    index = ResultBrowserCache(cache).get('a', 'calculated')
+    matrix = WhatIfCache(cache).get('a', 'calculated')
+    assert cache.memory_bytes == frame_bytes + index.memory_bytes() + matrix.memory_bytes()
+
+    # Kept queries are measured on the next hit
+    index.page(sort='HMPI', order='desc', levels=['Perfect', 'Good'])
+    assert ResultBrowserCache(cache).get('a', 'calculated') is index
+    assert cache.memory_bytes == frame_bytes + index.memory_bytes() + matrix.memory_bytes()
+
+
+def test_derived_objects_are_evicted_with_the_frames(tmp_path):
+    df = calculated(5000)
+    cache = DatasetCache(str(tmp_path), max_memory_bytes=int(memory_bytes(df) * 1.5))
+    cache.put('a', 'calculated', df)
+    index = ResultBrowserCache(cache).get('a', 'calculated')
+    assert ('a', 'calculated', 'result-index') in cache.memory
+    assert cache.memory_bytes <= cache.max_memory_bytes
+    # Not kept any more, but still answers from the frame on disk
+    assert ('a', 'calculated') not in cache.memory
+    assert index.page()['total'] == 5000
+
+    cache.put('b', 'calculated', calculated(5000, seed=1))
+    assert ('a', 'calculated', 'result-index') not in cache.memory
+    assert cache.memory_bytes <= cache.max_memory_bytes
+
+
+def test_uncached_stage_has_no_index(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    assert ResultBrowserCache(cache).get('missing', 'calculated') is None
+
+
+def test_queries_from_many_threads(tmp_path):
+    cache = DatasetCache(str(tmp_path))
+    cache.put('a', 'calculated', calculated(2000))
+    browser = ResultBrowserCache(cache)
+    errors = []
+
+    def browse(i):
+        try:
+            for page in range(1, 20):
+                result = browser.get('a', 'calculated').page(page, 10, 'HMPI', 'desc', min_hmpi=float(i))
+                assert result['page'] == page
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=browse, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    index = browser.get('a', 'calculated')
+    assert len(index._queries) <= index.max_queries
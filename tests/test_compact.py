@@ -0,0 +1,48 @@
+# tests/test_compact.py
+
+import numpy as np
+import pandas as pd
+import pandas.testing as pdt
+
+from backend.features.caching import DatasetCache
+from backend.features.compact import compact, fits_float32, widen
+from backend.features.hmpi_calculation import HMPICalculation
+
+def boundary_samples():
+    """Samples right at the permissible limits, where float32 rounding would flip the level."""
+    return pd.DataFrame({
+        'Station': ['hg limit', 'cd limit', 'mn limit', 'hg twice', 'mixed'],
+        'hg': [0.001, np.nan, np.nan, 0.002, 0.0005],
+        'cd': [np.nan, 0.003, np.nan, np.nan, 0.0015],
+        'mn': [np.nan, np.nan, 0.1, np.nan, 0.05],
+        'cu': [np.nan, np.nan, np.nan, np.nan, 0.19671098],
+    })
+
+def calculated(cache, df):
+    cache.put('key', 'cleaned', df)
+    return HMPICalculation().calculate(cache.get('key', 'cleaned'))
+
+def test_compact_on_and_off_give_identical_results(tmp_path):
+    df = boundary_samples()
+    on = calculated(DatasetCache(str(tmp_path / 'on'), compact=True), df.copy())
+    off = calculated(DatasetCache(str(tmp_path / 'off'), compact=False), df.copy())
+
+    np.testing.assert_array_equal(on['HMPI'].to_numpy(), off['HMPI'].to_numpy())
+    assert list(on['Pollution Level']) == list(off['Pollution Level'])
+    assert list(off['Pollution Level'][:4]) == ['Moderate', 'Moderate', 'Moderate', 'Poor']
+
+def test_compact_keeps_uploaded_values(tmp_path):
+    df = boundary_samples()
+    cache = DatasetCache(str(tmp_path), compact=True)
+    cache.put('key', 'cleaned', df)
+    cache.memory.clear()
+    cache.memory_bytes = 0
+    pdt.assert_frame_equal(widen(cache.get('key', 'cleaned')), df, check_dtype=False, check_categorical=False, check_exact=True)
+
+def test_only_exact_columns_are_narrowed():
+    assert fits_float32(np.array([0.5, 0.25, np.nan, 3.0]))
+    assert not fits_float32(np.array([0.001]))
+
+    df, report = compact(pd.DataFrame({'hg': [0.5, 0.25], 'cd': [0.003, 0.1]}))
+    assert report['columns'] == {'hg': 'float32'}
+    assert df['cd'].dtype == 'float64'
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from backend.features.data_processing import DataProcessor
+
+
+def write_csv(path, rows):
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return str(path)
+
+
+def test_text_column_empty_in_the_first_chunk(tmp_path):
+    rows = [{'Station': None, 'Pb': 0.01}] * 3 + [{'Station': 'Garudeshwar', 'Pb': 0.02}, {'Station': 'Motinaroli', 'Pb': None}]
+    path = write_csv(tmp_path / 'late_names.csv', rows)
+
+    chunks = list(DataProcessor().iter_chunks(path, chunksize=3))
+    df = pd.concat(chunks, ignore_index=True)
+    assert list(df['Station'].iloc[3:]) == ['Garudeshwar', 'Motinaroli']
+    assert chunks[1]['Station'].dtype == object
+    assert all(chunk['Pb'].dtype == 'float64' for chunk in chunks)
+
+
+def test_numeric_column_empty_in_the_first_chunk(tmp_path):
+    rows = [{'Station': 'A', 'Cd': None}] * 2 + [{'Station': 'B', 'Cd': '0.003'}, {'Station': 'C', 'Cd': 'n.d.'}]
+    path = write_csv(tmp_path / 'late_values.csv', rows)
+
+    df = pd.concat(DataProcessor().iter_chunks(path, chunksize=2), ignore_index=True)
+    assert df['Cd'].iloc[2] == 0.003
+    assert np.isnan(df['Cd'].iloc[3])
+
+
+def test_chunks_match_a_full_load(tmp_path):
+    rows = [{'Station': f'S{i}', 'Latitude': 21 + i / 100, 'Longitude': 73, 'Hg': i / 1000} for i in range(10)]
+    path = write_csv(tmp_path / 'full.csv', rows)
+
+    processor = DataProcessor()
+    streamed = pd.concat(processor.iter_chunks(path, chunksize=4), ignore_index=True)
+    pd.testing.assert_frame_equal(streamed, processor.load(path))
+
+
+def test_load_in_a_pool_worker_parses_sheets_in_process(tmp_path, monkeypatch):
+    import openpyxl
+    from backend.features import excel_reader
+
+    workbook = openpyxl.Workbook()
+    workbook.active.title = 'North'
+    workbook.active.append(['Station', 'Pb'])
+    workbook.active.append(['A', 0.01])
+    south = workbook.create_sheet('South')
+    south.append(['Station', 'Pb'])
+    south.append(['B', 0.02])
+    path = str(tmp_path / 'districts.xlsx')
+    workbook.save(path)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError('a process pool was started')
+    monkeypatch.setattr(excel_reader, 'PARALLEL_MIN_BYTES', 0)
+    monkeypatch.setattr(excel_reader, 'ProcessPoolExecutor', no_pool)
+
+    df = DataProcessor().load(path, 'all', max_workers=1)
+    assert list(df['Station']) == ['A', 'B']
+    assert list(df['Sheet']) == ['North', 'South']
@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.features.dataset_store import DatasetStore
+from backend.features.hmpi_calculation import HMPICalculation
+
+
+def calculated(names, pb, lat, lon):
+    df = pd.DataFrame({'Station': names, 'Latitude': lat, 'Longitude': lon, 'pb': pb})
+    return HMPICalculation().calculate(df)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DatasetStore(str(tmp_path / 'datasets.sqlite3'))
+
+
+@pytest.fixture
+def gujarat():
+    # HMPI 5 (Perfect), 100 (Moderate), 500 (Extremely Poor)
+    return calculated(['Surat', 'Vadodara', 'Bhuj'], [0.0005, 0.01, 0.05], [21.17, 22.31, 23.25], [72.83, 73.18, 69.67])
+
+
+def test_save_is_idempotent_per_owner(store, gujarat):
+    first = store.save('alice', 'k1', 'calculated', gujarat, 'gujarat.csv')
+    again = store.save('alice', 'k1', 'calculated', gujarat)
+    assert first == again
+    uploads = store.uploads('alice')
+    assert len(uploads) == 1
+    assert uploads[0]['filename'] == 'gujarat.csv'
+    assert uploads[0]['rows'] == 3
+
+
+def test_owners_saving_the_same_dataset_at_once(store, gujarat):
+    # Separate jobs per owner save the same key and stage concurrently
+    errors = []
+
+    def save(owner):
+        try:
+            DatasetStore(store.path).save(owner, 'k1', 'calculated', gujarat)
+        except sqlite3.Error as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(f'owner{i}',)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with store.connect() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM datasets').fetchone()[0] == 1
+        assert conn.execute('SELECT COUNT(*) FROM stations').fetchone()[0] == 3
+        assert conn.execute('SELECT COUNT(*) FROM uploads').fetchone()[0] == 8
+
+
+def test_uploads_and_delete_are_scoped_to_the_owner(store, gujarat):
+    upload_id = store.save('alice', 'k1', 'calculated', gujarat)
+    store.save('bob', 'k1', 'calculated', gujarat)
+
+    assert store.upload('bob', upload_id) is None
+    assert not store.delete('bob', upload_id)
+    assert store.upload('alice', upload_id) is not None
+
+    assert store.delete('alice', upload_id)
+    assert store.uploads('alice') == []
+    # Bob still has the dataset, so its stations stay
+    assert len(store.stations('bob')) == 3
+
+    store.delete('bob', store.uploads('bob')[0]['id'])
+    with store.connect() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM stations').fetchone()[0] == 0
+
+
+def test_uploads_newest_first_with_limit(store, gujarat):
+    for i in range(3):
+        store.save('alice', f'k{i}', 'calculated', gujarat, f'file{i}.csv')
+        time.sleep(0.01)
+    assert [upload['filename'] for upload in store.uploads('alice')] == ['file2.csv', 'file1.csv', 'file0.csv']
+    assert [upload['filename'] for upload in store.uploads('alice', limit=2)] == ['file2.csv', 'file1.csv']
+
+
+def test_station_filters(store, gujarat):
+    store.save('alice', 'k1', 'calculated', gujarat, 'old.csv')
+    time.sleep(0.01)
+    newer = calculated(['Rajkot', 'Surat'], [0.2, 0.001], [22.30, 21.17], [70.80, 72.83])
+    store.save('alice', 'k2', 'calculated', newer, 'new.csv')
+
+    def names(**filters):
+        return [row['station'] for row in store.stations('alice', **filters)]
+
+    assert names() == ['Rajkot', 'Bhuj', 'Vadodara', 'Surat', 'Surat']
+    assert names(level='Extremely Poor') == ['Rajkot', 'Bhuj']
+    assert names(level='Extremely Poor', last=1) == ['Rajkot']
+    assert names(station='Surat') == ['Surat', 'Surat']
+    assert {row['filename'] for row in store.stations('alice', station='Surat')} == {'old.csv', 'new.csv'}
+    assert names(min_hmpi=50, max_hmpi=600) == ['Bhuj', 'Vadodara']
+    # Around Surat and Vadodara only
+    assert names(bbox=(72.5, 21, 73.5, 22.5)) == ['Vadodara', 'Surat', 'Surat']
+    assert names(limit=2) == ['Rajkot', 'Bhuj']
+    assert store.stations('bob') == []
+    with pytest.raises(ValueError, match='Unknown pollution level'):
+        store.stations('alice', level='Terrible')
+
+
+def test_bbox_across_the_antimeridian(store):
+    df = calculated(['Fiji', 'Samoa', 'Gujarat'], [0.01, 0.01, 0.01], [-17.7, -13.8, 22.3], [178.0, -172.0, 72.0])
+    store.save('alice', 'k1', 'calculated', df)
+    assert sorted(row['station'] for row in store.stations('alice', bbox=(170, -20, -170, -10))) == ['Fiji', 'Samoa']
+
+
+def test_rows_without_hmpi_or_position(store):
+    df = calculated(['A', 'B'], [0.01, 0.02], [np.nan, 21.0], [np.nan, 72.0])
+    df.loc[0, 'HMPI'] = np.nan
+    store.save('alice', 'k1', 'calculated', df)
+    rows = {row['station']: row for row in store.stations('alice')}
+    assert rows['A']['hmpi'] is None and rows['A']['pollution_level'] is None
+    assert rows['A']['latitude'] is None
+    assert rows['B']['pollution_level'] == 'Poor'
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backend.features.hmpi_calculation import HMPICalculation, LEVEL_BOUNDS
+
+
+def baseline_calculate(df):
+    """The original row-by-row calculate(), kept as the reference."""
+    standards = HMPICalculation().standards
+    hmpi_list = []
+    poll_list = []
+    for index, row in df.iterrows():
+        num = 0
+        den = 0
+        present_metals = [metal for metal in standards if metal in row and pd.notna(row[metal])]
+        for metal in present_metals:
+            Mi = row[metal]
+            Si = standards[metal]['S']
+            Ii = standards[metal]['I']
+            Wi = standards[metal]['W']
+            Qi = 100 * (Mi - Ii) / (Si - Ii)
+            num += Wi * Qi
+            den += Wi
+        hmpi = num / den if den != 0 else 0
+        hmpi_list.append(hmpi)
+
+        if hmpi <= 10:
+            poll_level = 'Perfect'
+        elif hmpi <= 50:
+            poll_level = 'Good'
+        elif hmpi <= 100:
+            poll_level = 'Moderate'
+        elif hmpi <= 200:
+            poll_level = 'Poor'
+        elif hmpi <= 400:
+            poll_level = 'Very Poor'
+        else:
+            poll_level = 'Extremely Poor'
+        poll_list.append(poll_level)
+
+    out = df.copy()
+    out['HMPI'] = hmpi_list
+    out['Pollution Level'] = poll_list
+    return out
+
+
+def boundary_frame():
+    """Single-metal rows landing on, just below and just above every level bound."""
+    rows = []
+    for metal, S in [('pb', 0.01), ('hg', 0.001), ('mn', 0.1)]:
+        for bound in LEVEL_BOUNDS:
+            for offset in (-1e-9, 0, 1e-9):
+                rows.append({metal: (bound + offset) * S / 100})
+    return pd.DataFrame(rows)
+
+
+def assert_parity(df):
+    expected = baseline_calculate(df)
+    result = HMPICalculation().calculate(df.copy())
+    np.testing.assert_allclose(result['HMPI'].to_numpy(dtype='float64'),
+                               expected['HMPI'].to_numpy(dtype='float64'), rtol=1e-12, atol=0)
+    assert list(result['Pollution Level']) == list(expected['Pollution Level'])
+
+
+def test_parity_on_random_samples():
+    rng = np.random.default_rng(0)
+    metals = list(HMPICalculation().standards)
+    values = rng.lognormal(mean=-5, sigma=2, size=(500, len(metals)))
+    df = pd.DataFrame(values, columns=metals)
+    df.insert(0, 'Station', [f'S{i}' for i in range(len(df))])
+    assert_parity(df)
+
+
+def test_parity_with_nan_cells():
+    rng = np.random.default_rng(1)
+    metals = ['as', 'cd', 'pb', 'hg', 'zn', 'fe']
+    values = rng.lognormal(mean=-5, sigma=2, size=(300, len(metals)))
+    values[rng.random(values.shape) < 0.3] = np.nan
+    # A row with every metal missing scores 0
+    values[0] = np.nan
+    df = pd.DataFrame(values, columns=metals)
+    assert_parity(df)
+    assert HMPICalculation().calculate(df.copy())['HMPI'].iloc[0] == 0
+
+
+def test_parity_with_missing_metals():
+    df = pd.DataFrame({'Station': ['A', 'B', 'C'], 'pb': [0.005, 0.02, np.nan], 'fe': [0.1, np.nan, 0.9]})
+    assert_parity(df)
+    assert_parity(pd.DataFrame({'Station': ['A', 'B']}))
+
+
+def test_parity_at_level_boundaries():
+    assert_parity(boundary_frame())
+
+
+@pytest.mark.parametrize('hmpi, level', [
+    (10, 'Perfect'), (10.01, 'Good'),
+    (50, 'Good'), (50.01, 'Moderate'),
+    (100, 'Moderate'), (100.01, 'Poor'),
+    (200, 'Poor'), (200.01, 'Very Poor'),
+    (400, 'Very Poor'), (400.01, 'Extremely Poor'),
+])
+def test_bounds_are_inclusive(hmpi, level):
+    levels, _ = HMPICalculation().classify(np.array([hmpi], dtype='float64'))
+    assert levels[0] == level
+
+
+def test_a_single_index_name_is_not_split_into_letters():
+    calculator = HMPICalculation()
+    assert calculator.normalize_indices('HEI') == ['hmpi', 'hei']
+    assert calculator.normalize_indices(['HEI', 'hpi']) == ['hmpi', 'hei']
+    with pytest.raises(ValueError, match="Unknown index 'xyz'"):
+        calculator.normalize_indices('xyz')
+
+
+def test_known_index_values():
+    # Pb at twice its limit, Cd at half of it; a missing cell drops out of every sum
+    df = pd.DataFrame({'pb': [0.02, np.nan], 'cd': [0.0015, 0.0015]})
+    result = HMPICalculation().calculate(df, ['hei', 'cd', 'mi'])
+
+    np.testing.assert_allclose(result['HEI'], [2.5, 0.5])
+    np.testing.assert_allclose(result['Contamination Degree'], [0.5, -0.5])
+    np.testing.assert_allclose(result['MI'], [2.5, 0.5])
+    np.testing.assert_allclose(result['HMPI'], [(100 * 200 + 333.3 * 50) / (100 + 333.3), 50])
+    assert list(result['Pollution Level']) == ['Moderate', 'Good']
+
+
+def test_only_requested_indices_are_added():
+    result = HMPICalculation().calculate(pd.DataFrame({'pb': [0.02]}), ['HPI', 'MI'])
+    assert 'MI' in result.columns
+    assert 'HEI' not in result.columns and 'Contamination Degree' not in result.columns
+
+
+def test_unknown_index_names_are_rejected():
+    with pytest.raises(ValueError, match="Unknown index 'wqi'"):
+        HMPICalculation().normalize_indices(['hei', 'wqi'])
+    with pytest.raises(ValueError, match="Unknown index"):
+        HMPICalculation().calculate(pd.DataFrame({'pb': [0.02]}), ['pli'])
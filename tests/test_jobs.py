@@ -0,0 +1,111 @@
+import os
+import time
+
+import pytest
+
+from backend.features import jobs
+from backend.features.jobs import JobManager
+
+
+def echo_task(progress, value):
+    progress('calculate')
+    return {'value': value}
+
+
+def failing_task(progress):
+    raise ValueError('bad input')
+
+
+def wait(manager, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = manager.status(job_id)
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} did not finish')
+
+
+@pytest.fixture
+def path(tmp_path):
+    return os.path.join(tmp_path, 'jobs.sqlite3')
+
+
+def test_job_is_visible_from_another_manager(path):
+    # Two managers on one file stand in for two gunicorn workers
+    submitter = JobManager(path, max_workers=1)
+    poller = JobManager(path)
+    job_id = submitter.submit('calculate', ('calculate', 'k'), echo_task, 42)
+
+    status = wait(poller, job_id)
+    assert status['status'] == 'done'
+    assert status['stage'] == 'done'
+    job = poller.get(job_id)
+    assert job['result'] == {'value': 42}
+    assert job['key'] == ('calculate', 'k')
+
+
+def test_failed_job_keeps_its_error(path):
+    manager = JobManager(path, max_workers=1)
+    job_id = manager.submit('calculate', 'fails', failing_task)
+    status = wait(manager, job_id)
+    assert status['status'] == 'failed'
+    assert status['error'] == 'bad input'
+
+
+def test_unknown_job(path):
+    manager = JobManager(path)
+    assert manager.status('missing') is None
+    assert manager.get('missing') is None
+
+
+def test_finished_jobs_are_pruned(path):
+    manager = JobManager(path, max_workers=1, max_finished=2)
+    job_ids = [manager.submit('calculate', i, echo_task, i) for i in range(4)]
+    # One worker finishes them in order; the last prune runs after the last status update
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        kept = [manager.get(job_id) is not None for job_id in job_ids]
+        if kept == [False, False, True, True]:
+            break
+        time.sleep(0.05)
+    assert kept == [False, False, True, True]
+    assert manager.status(job_ids[-1])['status'] == 'done'
+
+
+def crashing_task(progress):
+    # Stands in for a job process killed by the OOM killer
+    os._exit(1)
+
+
+def test_pool_is_replaced_after_a_job_process_dies(path):
+    manager = JobManager(path, max_workers=1)
+    status = wait(manager, manager.submit('calculate', 'crash', crashing_task))
+    assert status['status'] == 'failed'
+
+    job_id = manager.submit('calculate', 'after', echo_task, 7)
+    assert wait(manager, job_id)['status'] == 'done'
+    assert manager.get(job_id)['result'] == {'value': 7}
+
+
+@pytest.mark.skipif(jobs.fcntl is None, reason='no flock on this platform')
+def test_jobs_of_a_dead_worker_are_failed_at_startup(path):
+    alive = JobManager(path)
+    alive.claim_worker()
+    alive.execute("INSERT INTO jobs (id, kind, key, status, stage, created, worker) "
+                  "VALUES ('live', 'calculate', X'', 'running', 'calculate', ?, ?)", (time.time(), alive.worker))
+    # A worker that died mid-job: its rows stay, its lock file is no longer held
+    dead = os.path.join(alive.workers_dir, 'dead')
+    open(dead, 'w').close()
+    for job_id, status in [('queued', 'queued'), ('running', 'running')]:
+        alive.execute("INSERT INTO jobs (id, kind, key, status, stage, created, worker) "
+                      "VALUES (?, 'calculate', X'', ?, ?, ?, 'dead')", (job_id, status, status, time.time()))
+
+    restarted = JobManager(path)
+    for job_id in ('queued', 'running'):
+        status = restarted.status(job_id)
+        assert status['status'] == 'failed'
+        assert 'stopped' in status['error']
+    assert restarted.status('live')['status'] == 'running'
+    assert not os.path.exists(dead)
+    assert os.path.exists(os.path.join(alive.workers_dir, alive.worker))
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+import app as hmpi_app
+from backend.features.metrics import metrics
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(metrics, 'profile_dir', str(tmp_path / 'profiles'))
+    app = hmpi_app.create_app()
+    # Let the error reach the test client, so after_request handlers are skipped
+    app.testing = True
+
+    def boom():
+        raise RuntimeError('boom')
+    app.add_url_rule('/boom', 'boom', boom)
+    return app.test_client()
+
+
+def test_profiler_is_stopped_when_the_request_raises(client):
+    with pytest.raises(RuntimeError):
+        client.get('/boom?profile=1')
+
+    # A profiler left enabled would make the next one fail to start
+    profiler = metrics.start_profile()
+    assert profiler is not None
+    profiler.disable()
+    assert [name for name in os.listdir(metrics.profile_dir) if '-boom-' in name]
+
+
+def test_profiled_request_reports_its_profile(client):
+    response = client.get('/info?profile=1')
+    assert response.status_code == 200
+    assert os.path.exists(os.path.join(metrics.profile_dir, response.headers['X-Profile']))
+
+
+def test_profile_paths_are_unique(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'profile_dir', str(tmp_path))
+    assert len({metrics.profile_path('calculate') for _ in range(100)}) == 100
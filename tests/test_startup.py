@@ -0,0 +1,14 @@
+import statistics
+
+from benchmarks.bench_startup import probe
+
+# Twice the benchmark's default budget, so a slow CI machine does not fail it.
+# An eager import of pandas and friends is caught by the heavy-module check
+STARTUP_BUDGET_SECONDS = 1.0
+
+
+def test_app_starts_without_heavy_modules():
+    results = [probe() for _ in range(3)]
+    assert statistics.median(result['seconds'] for result in results) < STARTUP_BUDGET_SECONDS
+    assert sorted({name for result in results for name in result['heavy']}) == []
+    assert results[0]['pages'] == {'/': 200, '/analyzer': 200, '/info': 200}
@@ -0,0 +1,68 @@
+import os
+import threading
+import time
+
+import pytest
+
+from backend.features import time_series
+from backend.features.time_series import TimeSeriesStore
+
+
+@pytest.fixture(params=['flock', 'file'])
+def mode(request, monkeypatch):
+    if request.param == 'file':
+        monkeypatch.setattr(time_series, 'fcntl', None)
+    elif time_series.fcntl is None:
+        pytest.skip('no flock on this platform')
+    return request.param
+
+
+def test_long_holder_keeps_the_lock(tmp_path, mode):
+    first = TimeSeriesStore(str(tmp_path), lock_timeout=0.3)
+    second = TimeSeriesStore(str(tmp_path), lock_timeout=0.3)
+    events = []
+    held = threading.Event()
+
+    def hold():
+        with first.lock():
+            held.set()
+            # Several lock timeouts, as in a long ingest
+            time.sleep(1.2)
+            events.append('first released')
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    held.wait()
+    with second.lock():
+        events.append('second acquired')
+    holder.join()
+    assert events == ['first released', 'second acquired']
+
+
+def test_lock_left_by_a_crashed_worker(tmp_path, mode):
+    store = TimeSeriesStore(str(tmp_path), lock_timeout=0.2)
+    open(tmp_path / '.lock', 'w').close()
+    start = time.time()
+    with store.lock():
+        pass
+    assert time.time() - start < 5
+
+
+def test_fresh_lock_is_put_back_instead_of_broken(tmp_path):
+    # Another process re-created the lock between the staleness check and the removal
+    store = TimeSeriesStore(str(tmp_path), lock_timeout=60)
+    path = str(tmp_path / '.lock')
+    open(path, 'w').close()
+    store.break_stale(path)
+    assert os.path.exists(path)
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.stale')] == []
+
+
+def test_stale_lock_is_removed(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), lock_timeout=60)
+    path = str(tmp_path / '.lock')
+    open(path, 'w').close()
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    store.break_stale(path)
+    assert not os.path.exists(path)
+    assert [name for name in os.listdir(tmp_path) if name.endswith('.stale')] == []
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from backend.features.hmpi_calculation import HMPICalculation
+from backend.features.what_if import ConcentrationMatrix, resolve_profile
+
+
+def calculated():
+    # WHO sets no limit for iron or zinc, so the last two rows cannot be scored under it
+    df = pd.DataFrame({
+        'Station': ['A', 'B', 'C', 'D'],
+        'pb': [0.002, 0.05, np.nan, np.nan],
+        'fe': [0.1, 0.2, 0.9, np.nan],
+        'zn': [np.nan, np.nan, np.nan, 5.0],
+    })
+    return HMPICalculation().calculate(df)
+
+
+def test_rows_without_profile_metals_are_unscored():
+    matrix = ConcentrationMatrix(calculated())
+    hmpi = matrix.hmpi_for(resolve_profile('who'))
+    assert not np.isnan(hmpi[:2]).any()
+    assert np.isnan(hmpi[2:]).all()
+
+
+def test_unscored_rows_are_left_out_of_the_comparison():
+    result = ConcentrationMatrix(calculated()).what_if(resolve_profile('who'))
+    assert result['unscored'] == 2
+    assert result['what_if']['unscored'] == 2
+    assert sum(result['what_if']['level_counts'].values()) == 2
+    assert sum(sum(row.values()) for row in result['transitions'].values()) == 2
+    assert result['changed'] == result['better'] + result['worse'] <= 2
+    assert [row['station'] for row in result['top']] == ['B', 'A']
+    assert all(np.isfinite(row['hmpi']) for row in result['top'])
+    # The calculated summary still counts every row
+    assert sum(result['current']['level_counts'].values()) == 4
+
+
+def test_every_row_scored_under_the_default_profile():
+    df = calculated()
+    result = ConcentrationMatrix(df).what_if(resolve_profile())
+    assert result['unscored'] == 0
+    assert result['changed'] == 0
+    np.testing.assert_allclose([row['hmpi'] for row in result['top']], sorted(df['HMPI'], reverse=True))
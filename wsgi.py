@@ -0,0 +1,11 @@
+# wsgi.py
+#
+# Production entry point, e.g.
+#   gunicorn --preload --workers 4 wsgi:app
+#
+# With --preload the master imports every feature module once before
+# forking, so workers boot straight away and share that memory.
+
+from app import create_app
+
+app = create_app(preload=True)